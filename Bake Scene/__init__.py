@@ -21,7 +21,7 @@ bl_info = {
     "name": "Bake Scene",
     "author": "Pauan",
     "version": (1, 3),
-    "blender": (2, 80, 0),
+    "blender": (3, 2, 0),
     "location": "Output Settings > Bake Scene",
     "description": "Bakes your entire scene into textures",
     "warning": "",
@@ -37,13 +37,30 @@ from . import properties
 from . import ui
 from . import operators
 from . import gizmos
+from . import watch
 
 classes = (
+    properties.QualityOverride,
+    properties.QualityProfile,
+    properties.OutputOverride,
+    properties.BakeRegion,
+    properties.BakeProbe,
     properties.Scene,
     operators.CalculateMaxHeight,
     operators.CalculateMaxDepth,
     operators.ShowSize,
     operators.HideSize,
+    operators.AddDefaultQualityProfiles,
+    operators.AddQualityProfile,
+    operators.RemoveQualityProfile,
+    operators.AddQualityOverride,
+    operators.RemoveQualityOverride,
+    operators.AddOutputOverride,
+    operators.RemoveOutputOverride,
+    operators.AddBakeRegion,
+    operators.RemoveBakeRegion,
+    operators.AddBakeProbe,
+    operators.RemoveBakeProbe,
     operators.Bake,
     ui.BakePanel,
     ui.TexturesPanel,
@@ -52,6 +69,9 @@ classes = (
     ui.TexturesMaterialPanel,
     ui.TexturesMaskingPanel,
     ui.TexturesHairPanel,
+    ui.QualityPanel,
+    ui.OutputPanel,
+    ui.PerformancePanel,
     gizmos.BoxGizmo,
     gizmos.PlaneGizmo,
     gizmos.SphereGizmo,
@@ -67,7 +87,11 @@ def register():
     for cls in classes:
         register_class(cls)
 
+    watch.register()
+
 def unregister():
+    watch.unregister()
+
     from bpy.utils import unregister_class
     for cls in reversed(classes):
         unregister_class(cls)
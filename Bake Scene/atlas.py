@@ -0,0 +1,212 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Bakes many decals into a single atlas texture.
+#
+# Every child collection of the atlas collection is a decal. Each decal is cropped to its content (the same as
+# Crop to Content), and then the rectangles are packed into the atlas. Every pass uses the same placement,
+# and the placement is saved in atlas.json.
+
+import os
+import json
+import numpy
+from math import (ceil, sqrt, log2)
+
+from .crop import (coverage_rect)
+from .extract import (DECAL_NAME)
+from .utils import (frame_size, pixel_size, render_converged, render_state, Region)
+
+
+def atlas_path(prefix):
+    return prefix + "atlas.json"
+
+
+def decal_collections(data):
+    return [collection for collection in data.atlas_collection.children if not collection.hide_render]
+
+
+# Hides the other decals, so that only one decal is rendered
+class Isolate:
+    def __init__(self, collections, visible):
+        self.collections = collections
+        self.visible = visible
+
+    def __enter__(self):
+        for collection in self.collections:
+            collection.hide_render = collection != self.visible
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for collection in self.collections:
+            collection.hide_render = False
+
+        return False
+
+
+# Shelf packing: the rectangles are sorted by height and placed in rows from the bottom to the top.
+#
+# Returns the (width, height) of the atlas and the (x, y) position of each rectangle.
+def pack(sizes, padding):
+    area = sum((width + padding) * (height + padding) for (width, height) in sizes)
+    widest = max(width for (width, height) in sizes) + padding
+
+    atlas_width = max(2 ** ceil(log2(max(sqrt(area), 1))), widest)
+
+    positions = [None] * len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+
+    x = 0
+    y = 0
+    shelf = 0
+
+    for i in order:
+        (width, height) = sizes[i]
+
+        if x + width + padding > atlas_width:
+            x = 0
+            y += shelf
+            shelf = 0
+
+        positions[i] = (x, y)
+
+        x += width + padding
+        shelf = max(shelf, height + padding)
+
+    return ((atlas_width, y + shelf), positions)
+
+
+class Atlas:
+    def __init__(self, context, data, prefix):
+        self.context = context
+        self.data = data
+        self.prefix = prefix
+        self.collections = []
+        self.decals = []
+        self.size = None
+        self.saved = None
+
+    def layout(self):
+        context = self.context
+
+        (full_width, full_height) = frame_size(context)
+        pixel = pixel_size(context)
+        camera = context.scene.camera
+
+        for collection in self.collections:
+            with Isolate(self.collections, collection):
+                rect = coverage_rect(context, self.data)
+
+            # Empty decals are not included in the atlas
+            if rect is not None:
+                (x, y, width, height) = rect
+
+                self.decals.append({
+                    # Background workers use a copy of the collection, which can have a different name
+                    "name": collection.get(DECAL_NAME, collection.name),
+                    "collection": collection,
+                    "rect": rect,
+                    "world_offset": [
+                        camera.location.x + (x + width / 2 - full_width / 2) * pixel,
+                        camera.location.y + (y + height / 2 - full_height / 2) * pixel,
+                    ],
+                    "world_size": [width * pixel, height * pixel],
+                })
+
+        if not self.decals:
+            return
+
+        (self.size, positions) = pack([(decal["rect"][2], decal["rect"][3]) for decal in self.decals], self.data.atlas_padding)
+
+        for (decal, position) in zip(self.decals, positions):
+            decal["position"] = position
+
+    def write_map(self):
+        (atlas_width, atlas_height) = self.size
+
+        decals = {}
+
+        for decal in self.decals:
+            (x, y) = decal["position"]
+            (_, _, width, height) = decal["rect"]
+
+            decals[decal["name"]] = {
+                # Pixels of the atlas, starting at the bottom left
+                "rect": [x, y, width, height],
+                "uv": [x / atlas_width, y / atlas_height, (x + width) / atlas_width, (y + height) / atlas_height],
+
+                # Center and size of the decal in world units
+                "world_offset": decal["world_offset"],
+                "world_size": decal["world_size"],
+            }
+
+        path = atlas_path(self.prefix)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path + ".partial", "w", encoding="utf-8") as file:
+            json.dump({"size": [atlas_width, atlas_height], "decals": decals}, file, indent=4)
+
+        os.replace(path + ".partial", path)
+
+    # Renders every decal into the atlas, this is called by render
+    def render(self, data, context):
+        (atlas_width, atlas_height) = self.size
+
+        if render_state["constant"] is not None:
+            return numpy.full((atlas_height, atlas_width, 4), render_state["constant"], dtype=numpy.float32)
+
+        # The empty parts of the atlas use the background color of the pass
+        background = tuple(context.scene.world.color) + (1.0,)
+        pixels = numpy.empty((atlas_height, atlas_width, 4), dtype=numpy.float32)
+        pixels[...] = background
+
+        for decal in self.decals:
+            (x, y) = decal["position"]
+
+            with Isolate(self.collections, decal["collection"]), Region(context, *decal["rect"]):
+                decal_pixels = render_converged(data, context)
+
+            (height, width) = decal_pixels.shape[:2]
+            pixels[y:y + height, x:x + width] = decal_pixels
+
+        return pixels
+
+    def __enter__(self):
+        data = self.data
+
+        if not data.use_atlas or data.atlas_collection is None or data.camera_mode != 'TOP':
+            return self
+
+        self.collections = decal_collections(data)
+        self.layout()
+
+        if not self.decals:
+            return self
+
+        self.write_map()
+
+        self.saved = render_state["atlas"]
+        render_state["atlas"] = self
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.decals:
+            render_state["atlas"] = self.saved
+
+        return False
@@ -19,14 +19,15 @@ import bpy
 
 from .utils import (
     antialias_on, antialias_off, view_transform_raw, view_transform_color, filename,
-    default_settings, render_engine, node_group_output, render_with_input, NodeGroup,
-    ReplaceMaterials, CompositorNodeGroup,
+    default_settings, render_engine, node_group_output, render, render_with_input, NodeGroup,
+    ReplaceMaterials, CompositorNodeGroup, AO_DISTANCE,
 )
+from .quality import (profile_value)
 
 
 def bake_render(data, context, settings):
     context.scene.render.filepath = filename(data, settings, "render")
-    bpy.ops.render.render(write_still=True)
+    return render(data, context)
 
 
 def normal_node_group(tree):
@@ -61,7 +62,7 @@ def normal_node_group(tree):
 
 def bake_normal(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "normal")
 
     context.scene.render.filepath = filename(data, settings, "normal")
     context.scene.render.image_settings.color_mode = 'RGB'
@@ -75,12 +76,12 @@ def bake_normal(data, context, settings):
         normal_node_group(tree)
 
         with ReplaceMaterials(context, "__Bake_Normal"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_ao(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "ao")
 
     context.scene.render.filepath = filename(data, settings, "ao")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -101,11 +102,12 @@ def bake_ao(data, context, settings):
         inputs = tree.nodes.new('NodeGroupInput')
 
         ao = tree.nodes.new('ShaderNodeAmbientOcclusion')
+        ao.inputs["Distance"].default_value = AO_DISTANCE
 
         if data.camera_mode == 'TOP':
-            ao.samples = 128
+            ao.samples = profile_value(data, "ao_samples")
         elif data.camera_mode == 'HDRI':
-            ao.samples = 16
+            ao.samples = profile_value(data, "cycles_ao_samples")
 
         emission = tree.nodes.new('ShaderNodeEmission')
 
@@ -115,12 +117,12 @@ def bake_ao(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_AO"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_curvature(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "curvature")
 
     context.scene.render.filepath = filename(data, settings, "curvature")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -201,12 +203,12 @@ def bake_curvature(data, context, settings):
                 tree.links.new(multiply.outputs["Value"], normalize.inputs[1])
                 tree.links.new(normalize.outputs["Value"], outputs.inputs["Image"])
 
-                bpy.ops.render.render(write_still=True)
+                return render(data, context)
 
 
 def bake_height(data, context, settings, max_height):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "height")
 
     context.scene.render.filepath = filename(data, settings, "height")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -234,12 +236,12 @@ def bake_height(data, context, settings, max_height):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Height"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_depth(data, context, settings, max_depth):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "depth")
 
     context.scene.render.filepath = filename(data, settings, "depth")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -267,13 +269,13 @@ def bake_depth(data, context, settings, max_depth):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Depth"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 # TODO output RGBA instead of RGB
 def bake_color(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "color")
 
     context.scene.render.filepath = filename(data, settings, "color")
     context.scene.render.image_settings.color_mode = 'RGB'
@@ -283,12 +285,12 @@ def bake_color(data, context, settings):
     context.scene.eevee.use_gtao = False
     context.scene.eevee.use_overscan = False
 
-    render_with_input(context, "__Bake_Color", "Base Color")
+    return render_with_input(data, context, "__Bake_Color", "Base Color")
 
 
 def bake_metallic(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "metallic")
 
     context.scene.render.filepath = filename(data, settings, "metallic")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -298,12 +300,12 @@ def bake_metallic(data, context, settings):
     context.scene.eevee.use_gtao = False
     context.scene.eevee.use_overscan = False
 
-    render_with_input(context, "__Bake_Metallic", "Metallic")
+    return render_with_input(data, context, "__Bake_Metallic", "Metallic")
 
 
 def bake_roughness(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "roughness")
 
     context.scene.render.filepath = filename(data, settings, "roughness")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -313,12 +315,12 @@ def bake_roughness(data, context, settings):
     context.scene.eevee.use_gtao = False
     context.scene.eevee.use_overscan = False
 
-    render_with_input(context, "__Bake_Roughness", "Roughness")
+    return render_with_input(data, context, "__Bake_Roughness", "Roughness")
 
 
 def bake_emission(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "emission")
 
     context.scene.render.filepath = filename(data, settings, "emission")
     context.scene.render.image_settings.color_mode = 'RGB'
@@ -328,13 +330,13 @@ def bake_emission(data, context, settings):
     context.scene.eevee.use_gtao = False
     context.scene.eevee.use_overscan = False
 
-    render_with_input(context, "__Bake_Emission", "Emission")
+    return render_with_input(data, context, "__Bake_Emission", "Emission")
 
 
 # TODO output RGBA instead of RGB
 def bake_vertex_color(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "vertex_color")
 
     context.scene.render.filepath = filename(data, settings, "vertex_color")
     context.scene.render.image_settings.color_mode = 'RGB'
@@ -354,12 +356,12 @@ def bake_vertex_color(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Vertex_Color"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_alpha(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "alpha")
 
     context.scene.render.filepath = filename(data, settings, "alpha")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -376,12 +378,12 @@ def bake_alpha(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Alpha"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_material_index(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "material_index")
 
     context.scene.render.filepath = filename(data, settings, "material_index")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -407,12 +409,12 @@ def bake_material_index(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Material_Index"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_object_index(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "object_index")
 
     context.scene.render.filepath = filename(data, settings, "object_index")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -438,12 +440,12 @@ def bake_object_index(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Object_Index"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_hair_random(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "hair_random")
 
     context.scene.render.filepath = filename(data, settings, "hair_random")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -463,7 +465,7 @@ def bake_hair_random(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Hair_Random"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_hair_root(data, context, settings):
@@ -488,12 +490,12 @@ def bake_hair_root(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Hair_Root"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 def bake_object_random(data, context, settings):
     default_settings(context)
-    antialias_on(context)
+    antialias_on(context, data, "object_random")
 
     context.scene.render.filepath = filename(data, settings, "object_random")
     context.scene.render.image_settings.color_mode = 'BW'
@@ -514,4 +516,4 @@ def bake_object_random(data, context, settings):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, "__Bake_Object_Random"):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
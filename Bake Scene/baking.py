@@ -0,0 +1,576 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import bpy
+import numpy
+from math import radians
+
+from . import bakers
+from . import cache
+from .preflight import (black_reason, constant_color)
+from .rebake import (manifest_path, Manifest)
+from .exr import (write_multilayer)
+from .atlas import (Atlas)
+from .crop import (Crop)
+from .projection import (Projection)
+from .frames import (Frames, frame_numbers, frame_suffix)
+from .formats import (output_format, OutputFormat)
+from .quality import (profile_value, is_profile)
+from .utils import (calculate_max_height, calculate_max_depth, load_pixels, bake_regions, region_prefix, AddEmptyMaterial, Camera, Settings, RenderPass, UseRegion, CollectLayers, render_state, LAYERS_FOLDER)
+
+
+# The order that the passes are baked in
+PASSES = (
+    # This must come first, because it must bake with the user's settings
+    "render",
+
+    # Geometry
+    "alpha",
+    "ao",
+    "curvature",
+    "height",
+    "depth",
+    "normal",
+
+    # Material
+    "color",
+    "emission",
+    "metallic",
+    "roughness",
+    "vertex_color",
+
+    # Masking
+    "material_index",
+    "object_index",
+    "object_random",
+
+    # Hair
+    "hair_random",
+    "hair_root",
+)
+
+
+class BakeError(Exception):
+    pass
+
+
+def check_profile(data, name):
+    if not is_profile(data, name):
+        raise BakeError("Unknown quality profile: " + str(name))
+
+
+# Regions with the same file name would overwrite each other's textures
+def check_regions(data):
+    prefixes = {}
+
+    for region in bake_regions(data):
+        prefix = region_prefix(region)
+
+        if prefix in prefixes:
+            raise BakeError("\"" + prefixes[prefix] + "\" and \"" + region.name + "\" have the same file name, rename one of them")
+
+        prefixes[prefix] = region.name
+
+
+def height_error(data):
+    return "Objects are outside of baking range (" + str(round(data.camera_height)) + "m)"
+
+
+def supports_pass(data, name):
+    if name == "height":
+        return data.camera_mode == 'TOP'
+
+    elif name == "depth":
+        return data.camera_mode == 'HDRI'
+
+    else:
+        return True
+
+
+def enabled_passes(data):
+    return [name for name in PASSES if getattr(data, "generate_" + name) and supports_pass(data, name)]
+
+
+# Names of the modes which are used by the command line
+MODES = {
+    "flat": 'TOP',
+    "hdri": 'HDRI',
+}
+
+
+# Changes the scene's settings, this is used when baking from the command line
+def configure(scene, options):
+    data = scene.bake_scene
+
+    if options.get("mode") is not None:
+        data.camera_mode = options["mode"]
+
+    if options.get("size") is not None:
+        data.size = options["size"]
+
+    if options.get("quality") is not None:
+        check_profile(data, options["quality"])
+        data.quality_profile = options["quality"]
+
+    if options.get("output") is not None:
+        scene.render.filepath = options["output"]
+
+    if options.get("resolution") is not None:
+        (x, y) = options["resolution"]
+        scene.render.resolution_x = x
+        scene.render.resolution_y = y
+        scene.render.resolution_percentage = 100
+
+    if options.get("passes") is not None:
+        for name in options["passes"]:
+            if name not in PASSES:
+                raise BakeError("Unknown texture: " + name)
+
+        for name in PASSES:
+            setattr(data, "generate_" + name, name in options["passes"])
+
+
+# Converts the options from a JSON request / job into the options for configure
+def parse_options(options):
+    resolution = options.get("resolution")
+
+    if isinstance(resolution, int):
+        resolution = (resolution, resolution)
+
+    mode = options.get("mode")
+
+    if mode is not None and mode not in MODES:
+        raise BakeError("Unknown mode: " + str(mode))
+
+    return {
+        "output": options.get("output"),
+        "passes": options.get("textures"),
+        "resolution": resolution,
+        "mode": None if mode is None else MODES[mode],
+        "size": options.get("size"),
+        "quality": options.get("quality"),
+    }
+
+
+# The .blend file which is currently loaded, it is only reloaded if it has changed
+loaded = {
+    "path": None,
+    "mtime": None,
+}
+
+
+def open_blend(path):
+    path = os.path.realpath(bpy.path.abspath(path))
+
+    if not os.path.isfile(path):
+        raise BakeError("File not found: " + path)
+
+    mtime = os.path.getmtime(path)
+
+    if loaded["path"] != path or loaded["mtime"] != mtime:
+        bpy.ops.wm.open_mainfile(filepath=path)
+        loaded["path"] = path
+        loaded["mtime"] = mtime
+
+
+def find_scene(name):
+    if name is None:
+        return bpy.context.scene
+
+    elif name in bpy.data.scenes:
+        return bpy.data.scenes[name]
+
+    else:
+        raise BakeError("Unknown scene: " + str(name))
+
+
+# Changes the scene's settings and automatically restores them afterwards
+class Configure:
+    def __init__(self, scene, options):
+        self.scene = scene
+        self.options = options
+        self.saved = None
+
+    def __enter__(self):
+        data = self.scene.bake_scene
+        render = self.scene.render
+
+        self.saved = {
+            "camera_mode": data.camera_mode,
+            "size": data.size,
+            "quality_profile": data.quality_profile,
+            "filepath": render.filepath,
+            "resolution_x": render.resolution_x,
+            "resolution_y": render.resolution_y,
+            "resolution_percentage": render.resolution_percentage,
+            "passes": {name: getattr(data, "generate_" + name) for name in PASSES},
+        }
+
+        configure(self.scene, self.options)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        data = self.scene.bake_scene
+        render = self.scene.render
+
+        data.camera_mode = self.saved["camera_mode"]
+        data.size = self.saved["size"]
+        data.quality_profile = self.saved["quality_profile"]
+        render.filepath = self.saved["filepath"]
+        render.resolution_x = self.saved["resolution_x"]
+        render.resolution_y = self.saved["resolution_y"]
+        render.resolution_percentage = self.saved["resolution_percentage"]
+
+        for (name, value) in self.saved["passes"].items():
+            setattr(data, "generate_" + name, value)
+
+        return False
+
+
+# Reports the progress of the baking
+class Progress:
+    def begin(self, total):
+        pass
+
+    # This is called after each pass is finished, with the files which were written
+    def update(self, index, name, paths):
+        pass
+
+    # This is called instead of update if the pass was skipped
+    def skip(self, index, name, reason):
+        self.update(index, name, [])
+
+    def end(self):
+        pass
+
+
+class WindowProgress(Progress):
+    def __init__(self, window_manager):
+        self.window_manager = window_manager
+        self.skipped = []
+
+    def begin(self, total):
+        self.window_manager.progress_begin(0, total)
+        self.window_manager.progress_update(0)
+
+    def update(self, index, name, paths):
+        self.window_manager.progress_update(index)
+
+    def skip(self, index, name, reason):
+        self.skipped.append(name + " (" + reason + ")")
+        self.window_manager.progress_update(index)
+
+    def end(self):
+        self.window_manager.progress_end()
+
+
+# The channels which are stored in the multilayer file for each texture
+LAYER_CHANNELS = {
+    "render": ("R", "G", "B", "A"),
+    "normal": ("R", "G", "B"),
+    "color": ("R", "G", "B"),
+    "emission": ("R", "G", "B"),
+    "vertex_color": ("R", "G", "B"),
+}
+
+
+# The name of the pass in the outputs and the progress, each region has its own outputs
+def pass_label(region, name):
+    if region is None:
+        return name
+    else:
+        return bpy.path.clean_name(region.name) + "/" + name
+
+
+def multilayer_path(prefix, suffix=""):
+    return prefix + "layers" + suffix + ".exr"
+
+
+# Writes the pixels of every texture into a single multilayer EXR file, the pixels are a dict of name -> pixels.
+# Returns None if there aren't any textures.
+def write_layers(data, prefix, pixels, suffix=""):
+    layers = []
+
+    for name in PASSES:
+        if name not in pixels:
+            continue
+
+        layer = pixels[name]
+        channels = LAYER_CHANNELS.get(name, ("Y",))
+
+        # Grayscale files might be loaded with a single channel
+        if layer.shape[2] < len(channels):
+            layer = numpy.repeat(layer[..., :1], len(channels), axis=2)
+
+        if layers and layer.shape[:2] != layers[0][2].shape[:2]:
+            raise BakeError("The " + name + " texture has a different size than the other textures, bake all of the textures again")
+
+        layers.append((name, channels, layer))
+
+    if not layers:
+        return None
+
+    path = multilayer_path(prefix, suffix)
+    write_multilayer(path, layers, data.multilayer_codec, data.multilayer_depth)
+    return path
+
+
+# The suffixes of the files which are combined, every frame of the frame range is combined separately
+def layer_suffixes(context, data):
+    if not data.use_frame_range:
+        return [""]
+
+    suffixes = [frame_suffix(number) for number in frame_numbers(context.scene)]
+
+    # The flipbook doesn't have a frame number
+    if data.use_flipbook:
+        suffixes.append("")
+
+    return suffixes
+
+
+# Combines the textures in the layers folder into a single multilayer EXR file (one for each region and frame).
+# This is used when the textures were baked by background workers or for a frame range, otherwise bake writes the file directly.
+#
+# It uses every enabled texture in the layers folder (not only the textures which were just baked),
+# so the file is complete even if only some of the textures were baked.
+def combine_layers(context, data, filepath=None):
+    if filepath is None:
+        filepath = context.scene.render.filepath
+
+    paths = []
+
+    for region in bake_regions(data):
+        prefix = bpy.path.abspath(filepath) + region_prefix(region)
+
+        for suffix in layer_suffixes(context, data):
+            pixels = {}
+
+            for name in enabled_passes(data):
+                path = prefix + LAYERS_FOLDER + "/" + name + suffix + ".exr"
+
+                if os.path.exists(path):
+                    pixels[name] = load_pixels(path)
+
+            path = write_layers(data, prefix, pixels, suffix)
+
+            if path is not None:
+                paths.append(path)
+
+    return paths
+
+
+def max_sizes(context, data, names):
+    max_height = 0
+    max_depth = 0
+
+    if "height" in names:
+        if data.height_mode == 'AUTO':
+            # TODO maybe it should always do this check, in order to check for out of camera bounds
+            max_height = calculate_max_height(context, data)
+
+            if max_height is None:
+                raise BakeError(height_error(data))
+
+        elif data.height_mode == 'MANUAL':
+            max_height = data.max_height
+
+
+    if "depth" in names:
+        if data.depth_mode == 'AUTO':
+            max_depth = calculate_max_depth(context)
+
+        elif data.depth_mode == 'MANUAL':
+            max_depth = data.max_depth
+
+    return (max_height, max_depth)
+
+
+# Bakes the passes and returns a dict of the files which were written for each pass
+def bake(context, data, names=None, progress=None, combine=True):
+    if names is None:
+        names = enabled_passes(data)
+
+    else:
+        names = [name for name in PASSES if name in names and supports_pass(data, name)]
+
+    if progress is None:
+        progress = Progress()
+
+    check_profile(data, data.quality_profile)
+    check_regions(data)
+
+    regions = bake_regions(data)
+
+    # The layers are kept in memory and written once, unless only some of the textures are baked
+    # (for example by background workers), in that case every texture is written into the layers folder
+    use_layers = combine and data.use_multilayer and names == enabled_passes(data) and not data.use_frame_range
+
+    outputs = {}
+
+    with Settings(context) as settings, Camera(context) as camera, AddEmptyMaterial(context):
+        render = context.scene.render
+        render.resolution_percentage = max(round(render.resolution_percentage * profile_value(data, "resolution_scale") / 100), 1)
+
+        if data.camera_mode == 'TOP':
+            camera.data.type = 'ORTHO'
+            camera.data.ortho_scale = data.size
+            camera.data.clip_end = data.camera_height * 2
+            camera.location = (0.0, 0.0, data.camera_height)
+
+        elif data.camera_mode == 'HDRI':
+            camera.data.type = 'PANO'
+            camera.data.cycles.panorama_type = 'EQUIRECTANGULAR'
+            camera.location = (0.0, 0.0, 0.0)
+            camera.rotation_euler = (radians(90.0), 0.0, 0.0)
+
+        # Cycles keeps the synced scene between renders, so it isn't synced again for every region
+        if len(regions) > 1:
+            render.use_persistent_data = True
+
+        # Bake all the textures
+        progress.begin(len(names) * len(regions))
+
+        index = 0
+
+        # The settings, camera and materials are shared by every region, only the camera is moved
+        for region in regions:
+            with UseRegion(context, data, region):
+                (max_height, max_depth) = max_sizes(context, data, names)
+
+                baking = {
+                    "render": lambda: bakers.bake_render(data, context, settings),
+                    "alpha": lambda: bakers.bake_alpha(data, context, settings),
+                    "ao": lambda: bakers.bake_ao(data, context, settings),
+                    "curvature": lambda: bakers.bake_curvature(data, context, settings),
+                    "height": lambda: bakers.bake_height(data, context, settings, max_height),
+                    "depth": lambda: bakers.bake_depth(data, context, settings, max_depth),
+                    "normal": lambda: bakers.bake_normal(data, context, settings),
+                    "color": lambda: bakers.bake_color(data, context, settings),
+                    "emission": lambda: bakers.bake_emission(data, context, settings),
+                    "metallic": lambda: bakers.bake_metallic(data, context, settings),
+                    "roughness": lambda: bakers.bake_roughness(data, context, settings),
+                    "vertex_color": lambda: bakers.bake_vertex_color(data, context, settings),
+                    "material_index": lambda: bakers.bake_material_index(data, context, settings),
+                    "object_index": lambda: bakers.bake_object_index(data, context, settings),
+                    "object_random": lambda: bakers.bake_object_random(data, context, settings),
+                    "hair_random": lambda: bakers.bake_hair_random(data, context, settings),
+                    "hair_root": lambda: bakers.bake_hair_root(data, context, settings),
+                }
+
+                parameters = {
+                    "height": max_height,
+                    "depth": max_depth,
+                }
+
+                fingerprints = cache.Fingerprints(context, data)
+
+                # All of the output files start with this
+                prefix = bpy.path.abspath(settings.filepath) + region_prefix(region)
+
+                layers = {} if use_layers else None
+
+                # The cache and the manifest need the output files of a single frame
+                use_files = layers is None and not data.use_frame_range
+
+                manifest = None
+
+                if data.use_partial_rebake or data.use_output_checks or profile_value(data, "use_adaptive"):
+                    manifest = Manifest(manifest_path(prefix))
+
+                # The coverage pre-pass is rendered before the passes, so every pass is cropped to the same rectangle
+                with CollectLayers(layers), Projection(context, data), Atlas(context, data, prefix) as atlas, Crop(context, data, prefix) as crop:
+                    for name in names:
+                        index += 1
+
+                        # Each region has its own outputs
+                        label = pass_label(region, name)
+
+                        fingerprint = None
+                        paths = None
+                        samples = None
+                        constant = None
+                        digests = None
+                        constants = None
+
+                        if data.preflight_mode != 'OFF':
+                            reason = black_reason(context, data, name)
+
+                            if reason is not None:
+                                if data.preflight_mode == 'SKIP':
+                                    outputs[label] = []
+                                    progress.skip(index, label, reason)
+                                    continue
+
+                                constant = (0.0, 0.0, 0.0, 1.0)
+
+                            # Textures with a single color are never skipped
+                            else:
+                                constant = constant_color(context, data, name)
+
+                        if data.use_cache and use_files:
+                            fingerprint = fingerprints.fingerprint(name, parameters.get(name))
+
+                            if fingerprint is not None:
+                                paths = cache.restore(data, fingerprint, prefix)
+
+                        if paths is None:
+                            rect = None
+
+                            # The partial rectangles are relative to the uncropped frame
+                            if manifest is not None and data.use_partial_rebake and crop.region is None and not atlas.decals and use_files:
+                                rect = manifest.changed_rect(context, data, name, fingerprints.pass_hashes(name, parameters.get(name)))
+
+                            # Nothing changed, so the existing files can be used as-is
+                            if rect is not None and rect[2] == 0:
+                                paths = manifest.paths(name)
+                                digests = manifest.digests(name)
+                                constants = manifest.previous[name].get("constants")
+
+                            else:
+                                previous = manifest.digests(name) if manifest is not None else None
+
+                                # Every frame has its own fingerprint, so unchanged frames can be copied
+                                frame_fingerprint = lambda: cache.Fingerprints(context, data).fingerprint(name, parameters.get(name))
+
+                                with OutputFormat(context, output_format(data, name)), RenderPass(name, rect, constant, previous), Frames(context, data, frame_fingerprint):
+                                    paths = baking[name]()
+                                    samples = render_state["samples"]
+                                    digests = render_state["digests"]
+                                    constants = render_state["constants"]
+
+                            if fingerprint is not None:
+                                cache.store(data, fingerprint, prefix, paths)
+
+                        if manifest is not None:
+                            hashes = fingerprints.pass_hashes(name, parameters.get(name)) if data.use_partial_rebake else None
+                            manifest.record(name, hashes, paths, samples, digests, constants)
+
+                        outputs[label] = paths
+                        progress.update(index, label, outputs[label])
+
+                if layers:
+                    outputs[pass_label(region, "layers")] = [write_layers(data, prefix, layers)]
+
+        progress.end()
+
+    # Background workers only bake some of the textures, so the main process combines the layers afterwards
+    if combine and data.use_multilayer and not use_layers:
+        combine_layers(context, data)
+
+    return outputs
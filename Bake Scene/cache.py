@@ -0,0 +1,488 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Every pass has a fingerprint, which is a hash of everything that the pass depends on.
+# The baked files are stored in a directory which is named after the fingerprint:
+#
+#     <cache>/<fingerprint>/files.json
+#     <cache>/<fingerprint>/0.png
+#
+# If the fingerprint hasn't changed then the files are copied from the cache instead of being baked again.
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import bpy
+import numpy
+from mathutils import (Vector)
+
+from .extract import (bake_objects)
+from .quality import (pass_samples, profile_value)
+from .formats import (output_format)
+from .utils import (frame_size, render_state)
+
+
+# Which Principled BSDF inputs are used by each pass, None means that it uses the entire material
+PASS_INPUTS = {
+    "render": None,
+    "alpha": ("Alpha",),
+    "ao": ("Alpha", "Normal"),
+    "curvature": ("Alpha", "Normal"),
+    "height": ("Alpha",),
+    "depth": ("Alpha",),
+    "normal": ("Alpha", "Normal"),
+    "color": ("Alpha", "Base Color"),
+    "emission": ("Alpha", "Emission"),
+    "metallic": ("Alpha", "Metallic"),
+    "roughness": ("Alpha", "Roughness"),
+    "vertex_color": ("Alpha",),
+    "material_index": ("Alpha",),
+    "object_index": ("Alpha",),
+    "object_random": ("Alpha",),
+    "hair_random": ("Alpha",),
+    "hair_root": ("Alpha",),
+}
+
+# Bake Scene settings which don't change the baked textures
+IGNORED_SETTINGS = ("show_size", "use_workers", "worker_count", "worker_threads", "use_worker_extract", "use_output_checks", "multilayer_codec", "multilayer_depth", "use_cache", "cache_directory", "cache_size", "use_partial_rebake", "use_watch", "watch_delay", "watch_quality")
+
+# Node properties which only affect the UI
+IGNORED_NODE_PROPERTIES = (
+    "name", "label", "location", "width", "width_hidden", "height", "dimensions", "select", "show_options",
+    "show_preview", "show_texture", "hide", "color", "use_custom_color", "parent", "bl_idname", "bl_label",
+    "bl_description", "bl_icon", "bl_static_type", "bl_width_default", "bl_width_min", "bl_width_max",
+    "bl_height_default", "bl_height_min", "bl_height_max",
+)
+
+
+# The pass depends on something which can't be hashed (for example an image which was painted but not saved)
+class Uncacheable(Exception):
+    pass
+
+
+def update(h, *values):
+    for value in values:
+        h.update(repr(value).encode("utf-8"))
+        h.update(b"\0")
+
+
+def property_value(value):
+    if isinstance(value, bpy.types.ID):
+        return value.name
+
+    elif isinstance(value, str):
+        return value
+
+    elif hasattr(value, "__len__"):
+        return tuple(property_value(x) for x in value)
+
+    else:
+        return value
+
+
+def hash_properties(h, struct, ignored=()):
+    for prop in struct.bl_rna.properties:
+        name = prop.identifier
+
+        if name == "rna_type" or name in ignored or prop.type == 'COLLECTION':
+            continue
+
+        value = getattr(struct, name)
+
+        # Nested structs are hashed separately
+        if prop.type == 'POINTER' and value is not None and not isinstance(value, bpy.types.ID):
+            continue
+
+        update(h, name, property_value(value))
+
+
+def hash_array(h, collection, attribute, dtype, size):
+    array = numpy.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    h.update(array.tobytes())
+
+
+def hash_image(h, image):
+    if image.is_dirty:
+        raise Uncacheable()
+
+    update(h, image.name, image.source, image.colorspace_settings.name, image.alpha_mode)
+
+    if image.source == 'GENERATED':
+        update(h, image.generated_type, tuple(image.generated_color), image.generated_width, image.generated_height)
+
+    elif image.packed_file is not None:
+        update(h, image.packed_file.size)
+
+    else:
+        path = bpy.path.abspath(image.filepath, library=image.library)
+        update(h, path)
+
+        if os.path.exists(path):
+            stat = os.stat(path)
+            update(h, stat.st_size, stat.st_mtime)
+
+
+def hash_node(h, node, visited):
+    if node.name in visited:
+        update(h, "visited", node.name)
+        return
+
+    visited.add(node.name)
+
+    update(h, node.bl_idname)
+    hash_properties(h, node, IGNORED_NODE_PROPERTIES)
+
+    image = getattr(node, "image", None)
+
+    if image is not None:
+        hash_image(h, image)
+
+    node_tree = getattr(node, "node_tree", None)
+
+    if node_tree is not None:
+        hash_tree(h, node_tree)
+
+    for input in node.inputs:
+        hash_input(h, input, visited)
+
+
+def hash_input(h, socket, visited):
+    update(h, socket.identifier)
+
+    if socket.is_linked:
+        for link in socket.links:
+            update(h, link.from_socket.identifier)
+            hash_node(h, link.from_node, visited)
+
+    elif hasattr(socket, "default_value"):
+        update(h, property_value(socket.default_value))
+
+
+def hash_tree(h, tree):
+    visited = set()
+
+    for node in sorted(tree.nodes, key=lambda node: node.name):
+        hash_node(h, node, visited)
+
+    for link in tree.links:
+        update(h, link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+
+
+# This must match how ReplaceMaterials connects the Principled BSDF to the bake node group
+def hash_material(h, material, inputs):
+    update(h, material.name, material.pass_index, material.blend_method, material.alpha_threshold, material.use_backface_culling, material.use_nodes)
+
+    if not material.use_nodes:
+        return
+
+    if inputs is None:
+        hash_tree(h, material.node_tree)
+        return
+
+    for node in material.node_tree.nodes:
+        if node.type == 'OUTPUT_MATERIAL' and node.is_active_output:
+            for link in node.inputs["Surface"].links:
+                if link.from_node.type == 'BSDF_PRINCIPLED':
+                    visited = set()
+
+                    for name in inputs:
+                        hash_input(h, link.from_node.inputs[name], visited)
+
+                break
+
+
+def hash_geometry(h, obj, depsgraph):
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+
+    if mesh is None:
+        return
+
+    try:
+        hash_array(h, mesh.vertices, "co", numpy.float32, 3)
+        hash_array(h, mesh.loops, "vertex_index", numpy.int32, 1)
+        hash_array(h, mesh.polygons, "loop_start", numpy.int32, 1)
+        hash_array(h, mesh.polygons, "material_index", numpy.int32, 1)
+        hash_array(h, mesh.polygons, "use_smooth", numpy.bool_, 1)
+
+        for layer in mesh.uv_layers:
+            update(h, layer.name)
+            hash_array(h, layer.data, "uv", numpy.float32, 2)
+
+        for layer in mesh.vertex_colors:
+            update(h, layer.name)
+            hash_array(h, layer.data, "color", numpy.float32, 4)
+
+    finally:
+        evaluated.to_mesh_clear()
+
+
+def hash_object(h, obj, depsgraph):
+    update(h, obj.name, obj.type, obj.pass_index, tuple(tuple(row) for row in obj.matrix_world))
+
+    if obj.data is not None and obj.type not in ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT'):
+        hash_properties(h, obj.data)
+
+    for modifier in obj.modifiers:
+        hash_properties(h, modifier)
+
+    for system in obj.particle_systems:
+        update(h, system.seed)
+        hash_properties(h, system.settings)
+
+    if obj.instance_collection is not None:
+        update(h, obj.instance_collection.name)
+
+    if obj.type in ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT'):
+        hash_geometry(h, obj, depsgraph)
+
+
+# World space (min x, min y, max x, max y) of the object, or None if the object can affect pixels outside of its bounds
+def object_bounds(obj, depsgraph):
+    if obj.type not in ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT') or obj.instance_collection is not None or len(obj.particle_systems) > 0:
+        return None
+
+    evaluated = obj.evaluated_get(depsgraph)
+    corners = [obj.matrix_world @ Vector(corner) for corner in evaluated.bound_box]
+
+    return [
+        min(co.x for co in corners),
+        min(co.y for co in corners),
+        max(co.x for co in corners),
+        max(co.y for co in corners),
+    ]
+
+
+# Calculates the fingerprints for the passes, the objects are only hashed once
+class Fingerprints:
+    def __init__(self, context, data):
+        self.context = context
+        self.data = data
+        self.objects = None
+        self.materials = {}
+        self.passes = {}
+
+    # Returns a dict of object name -> (object, hash, bounds)
+    def object_hashes(self):
+        if self.objects is None:
+            depsgraph = self.context.evaluated_depsgraph_get()
+            self.objects = {}
+
+            for obj in bake_objects(self.context, self.data):
+                h = hashlib.sha256()
+                hash_object(h, obj, depsgraph)
+                self.objects[obj.name] = (obj, h.hexdigest(), object_bounds(obj, depsgraph))
+
+        return self.objects
+
+    def material_hash(self, material, inputs):
+        key = (material.name, inputs)
+
+        if key not in self.materials:
+            h = hashlib.sha256()
+            hash_material(h, material, inputs)
+            self.materials[key] = h.hexdigest()
+
+        return self.materials[key]
+
+    # Hash of everything that the pass depends on, except for the objects
+    def scene_hash(self, name, parameters):
+        scene = self.context.scene
+
+        h = hashlib.sha256()
+
+        update(h, name, parameters, frame_size(self.context), scene.render.engine)
+
+        # The camera is moved when the textures are cropped
+        update(h, tuple(scene.camera.location), scene.camera.data.ortho_scale)
+
+        atlas = render_state["atlas"]
+
+        if atlas is not None:
+            update(h, atlas.size, [(decal["name"], decal["rect"], decal["position"]) for decal in atlas.decals])
+        update(h, pass_samples(self.data, name), profile_value(self.data, "ao_samples"), profile_value(self.data, "cycles_ao_samples"))
+        update(h, profile_value(self.data, "use_adaptive"), profile_value(self.data, "adaptive_threshold"), profile_value(self.data, "adaptive_min_samples"))
+        update(h, profile_value(self.data, "use_denoising"))
+
+        hash_properties(h, self.data, IGNORED_SETTINGS + tuple("generate_" + x for x in PASS_INPUTS))
+        hash_properties(h, scene.render.image_settings)
+        update(h, "output_format", output_format(self.data, name))
+
+        if name == "render":
+            hash_properties(h, scene.render)
+            hash_properties(h, scene.view_settings)
+            hash_properties(h, scene.cycles)
+            hash_properties(h, scene.eevee)
+
+            if scene.world is not None and scene.world.use_nodes:
+                hash_tree(h, scene.world.node_tree)
+
+        return h.hexdigest()
+
+    # Hash of the object and the parts of its materials which are used by the pass
+    def object_hash(self, name, obj, object_hash):
+        inputs = PASS_INPUTS[name]
+
+        h = hashlib.sha256()
+        update(h, object_hash)
+
+        for slot in obj.material_slots:
+            if slot.material is not None:
+                update(h, slot.link, self.material_hash(slot.material, inputs))
+
+        return h.hexdigest()
+
+    # Returns (scene hash, dict of object name -> (hash, bounds)), or None if the pass can't be hashed
+    def pass_hashes(self, name, parameters):
+        if name not in self.passes:
+            try:
+                scene = self.scene_hash(name, parameters)
+
+                objects = {
+                    obj_name: (self.object_hash(name, obj, object_hash), bounds)
+                    for (obj_name, (obj, object_hash, bounds)) in self.object_hashes().items()
+                }
+
+                self.passes[name] = (scene, objects)
+
+            except Uncacheable:
+                self.passes[name] = None
+
+        return self.passes[name]
+
+    # Returns None if the pass can't be cached
+    def fingerprint(self, name, parameters):
+        hashes = self.pass_hashes(name, parameters)
+
+        if hashes is None:
+            return None
+
+        (scene, objects) = hashes
+
+        h = hashlib.sha256()
+        update(h, scene)
+
+        for obj_name in sorted(objects):
+            update(h, objects[obj_name][0])
+
+        return h.hexdigest()
+
+
+def cache_directory(data):
+    if data.cache_directory:
+        return bpy.path.abspath(data.cache_directory)
+    else:
+        return os.path.join(tempfile.gettempdir(), "bake_scene_cache")
+
+
+def link_or_copy(source, target):
+    partial = target + ".partial"
+
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    try:
+        os.link(source, partial)
+
+    # Hard links don't work across filesystems
+    except OSError:
+        shutil.copyfile(source, partial)
+
+    os.replace(partial, target)
+
+
+# Copies the cached files into the output paths, returns None if the fingerprint isn't in the cache
+def restore(data, fingerprint, prefix):
+    entry = os.path.join(cache_directory(data), fingerprint)
+
+    try:
+        with open(os.path.join(entry, "files.json"), "r", encoding="utf-8") as file:
+            files = json.load(file)
+
+    except (OSError, ValueError):
+        return None
+
+    paths = []
+
+    for (index, suffix) in enumerate(files):
+        path = prefix + suffix
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        link_or_copy(os.path.join(entry, str(index)), path)
+        paths.append(path)
+
+    # This is used for the LRU eviction
+    os.utime(entry)
+
+    return paths
+
+
+def store(data, fingerprint, prefix, paths):
+    # Files which aren't inside of the output folder can't be restored
+    if not all(path.startswith(prefix) for path in paths):
+        return
+
+    directory = cache_directory(data)
+    entry = os.path.join(directory, fingerprint)
+    partial = entry + "." + str(os.getpid()) + ".partial"
+
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    for (index, path) in enumerate(paths):
+        link_or_copy(path, os.path.join(partial, str(index)))
+
+    with open(os.path.join(partial, "files.json"), "w", encoding="utf-8") as file:
+        json.dump([path[len(prefix):] for path in paths], file)
+
+    shutil.rmtree(entry, ignore_errors=True)
+
+    try:
+        os.replace(partial, entry)
+
+    except OSError:
+        shutil.rmtree(partial, ignore_errors=True)
+
+    evict(directory, data.cache_size * 1024 * 1024)
+
+
+def entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+
+# Deletes the least recently used entries until the cache is smaller than the maximum size
+def evict(directory, max_size):
+    entries = []
+
+    for name in os.listdir(directory):
+        entry = os.path.join(directory, name)
+
+        if not name.endswith(".partial") and os.path.isdir(entry):
+            entries.append((os.path.getmtime(entry), entry_size(entry), entry))
+
+    entries.sort()
+
+    total = sum(size for (_, size, _) in entries)
+
+    for (_, size, entry) in entries:
+        if total <= max_size:
+            break
+
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
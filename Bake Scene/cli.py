@@ -0,0 +1,152 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import time
+import argparse
+import bpy
+
+from . import workers
+from . import server
+from . import jobs
+from . import farm
+from .baking import (bake, configure, find_scene, enabled_passes, BakeError, Progress, PASSES, MODES)
+
+
+# Prints the progress to stdout instead of the window manager
+class PrintProgress(Progress):
+    def __init__(self):
+        self.total = 0
+
+    def begin(self, total):
+        self.total = total
+        print("Baking " + str(total) + " textures", flush=True)
+
+    def update(self, index, name, paths):
+        print("[" + str(index) + "/" + str(self.total) + "] Finished " + name, flush=True)
+
+    def skip(self, index, name, reason):
+        print("[" + str(index) + "/" + str(self.total) + "] Skipped " + name + " because " + reason, flush=True)
+
+
+def parse_resolution(value):
+    (x, _, y) = value.lower().partition("x")
+    return (int(x), int(y or x))
+
+
+def parse_list(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog="blender --background file.blend --python bake.py --",
+        description="Bakes a scene into textures.",
+    )
+
+    parser.add_argument("--scene", help="name of the scene to bake (default: the active scene)")
+    parser.add_argument("--output", help="output path, for example //textures/ or /tmp/decal_")
+    parser.add_argument("--textures", type=parse_list, help="comma separated list of textures: " + ", ".join(PASSES))
+    parser.add_argument("--resolution", type=parse_resolution, help="resolution, for example 4096 or 4096x2048")
+    parser.add_argument("--mode", choices=tuple(MODES), help="type of baking")
+    parser.add_argument("--size", type=float, help="width / height of the scene (Flat mode only)")
+    parser.add_argument("--quality", help="name of the quality profile, for example preview, draft, or final")
+    parser.add_argument("--workers", type=int, help="bake in parallel with this many background Blender processes")
+    parser.add_argument("--job", help="bake the job file (JSON or TOML), if it was interrupted it continues where it stopped")
+    parser.add_argument("--queue", help="directory for the distributed work queue, used by --submit, --worker and --coordinate")
+    parser.add_argument("--submit", metavar="JOB", help="split the job file into units and add them to the queue")
+    parser.add_argument("--worker", action="store_true", help="bake units from the queue until it is finished")
+    parser.add_argument("--coordinate", action="store_true", help="wait for the queue to finish and copy the textures to their output paths")
+    parser.add_argument("--lease-timeout", type=float, default=300.0, help="seconds before an unresponsive worker's unit is given to another worker (default: 300)")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="run a bake server on this port instead of baking")
+    parser.add_argument("--host", default="127.0.0.1", help="address which the bake server listens on (default: 127.0.0.1)")
+
+    return parser
+
+
+def options(args):
+    return {
+        "output": args.output,
+        "passes": args.textures,
+        "resolution": args.resolution,
+        "mode": None if args.mode is None else MODES[args.mode],
+        "size": args.size,
+        "quality": args.quality,
+    }
+
+
+def run(context, args):
+    data = context.scene.bake_scene
+    progress = PrintProgress()
+
+    configure(context.scene, options(args))
+
+    if args.workers:
+        data.use_workers = True
+        data.worker_count = args.workers
+        return workers.bake_workers(context, data, enabled_passes(data), progress)
+
+    else:
+        return bake(context, data, progress=progress)
+
+
+# Entry point for baking from the command line, returns the exit status
+def main(argv):
+    args = parser().parse_args(argv)
+
+    if args.serve is not None:
+        server.serve(args.host, args.serve)
+        return 0
+
+    if (args.submit is not None or args.worker or args.coordinate) and args.queue is None:
+        print("Error: --queue is required", file=sys.stderr, flush=True)
+        return 1
+
+    start = time.time()
+
+    try:
+        if args.submit is not None:
+            count = farm.submit(args.submit, args.queue)
+            print("Added " + str(count) + " units to the queue", flush=True)
+            return 0
+
+        elif args.worker:
+            farm.work(args.queue, args.lease_timeout, PrintProgress())
+            outputs = {}
+
+        elif args.coordinate:
+            outputs = farm.coordinate(args.queue, PrintProgress())
+
+        elif args.job is not None:
+            outputs = jobs.run_job(args.job, PrintProgress())
+
+        else:
+            with bpy.context.temp_override(scene=find_scene(args.scene)):
+                outputs = run(bpy.context, args)
+
+    except BakeError as e:
+        print("Error: " + str(e), file=sys.stderr, flush=True)
+        return 1
+
+    for paths in outputs.values():
+        for path in paths:
+            print("Saved: " + path, flush=True)
+
+    duration = time.time() - start
+    print("Finished baking all textures (" + str(round(duration, 2)) + " seconds)", flush=True)
+
+    return 0
@@ -0,0 +1,161 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Crops the textures to the part of the frame which contains objects, this is useful for decals.
+#
+# A small coverage image is rendered with Workbench first, and then every pass only renders the
+# rectangle which contains the objects. The position of the rectangle is saved next to the textures,
+# so the decal can be placed in the correct spot.
+
+import os
+import json
+import numpy
+from math import (floor, ceil)
+
+from .utils import (frame_size, pixel_size, render_pixels, default_settings, render_state, Region)
+
+
+# The coverage image is rendered with this many pixels on the longest side
+COVERAGE_SIZE = 256
+
+
+def crop_path(prefix):
+    return prefix + "crop.json"
+
+
+# Renders the frame with Workbench and returns the alpha, which is 0 where there aren't any objects.
+# If size is not None then the longest side of the image is at most that many pixels.
+def coverage_alpha(context, size=None):
+    scene = context.scene
+    render = scene.render
+
+    (width, height) = frame_size(context)
+
+    saved = (render.engine, render.film_transparent, render.resolution_percentage, scene.display.render_aa)
+
+    try:
+        default_settings(context)
+
+        render.engine = 'BLENDER_WORKBENCH'
+        render.film_transparent = True
+        scene.display.render_aa = 'OFF'
+
+        if size is not None:
+            render.resolution_percentage = max(min(render.resolution_percentage, round(render.resolution_percentage * size / max(width, height))), 1)
+
+        return render_pixels(context)[..., 3]
+
+    finally:
+        (render.engine, render.film_transparent, render.resolution_percentage, scene.display.render_aa) = saved
+
+
+# Whether every pixel of the frame contains an object, this renders the coverage at the full size
+def covers_frame(context):
+    return bool(numpy.all(coverage_alpha(context) >= 1.0))
+
+
+# Renders a small image of the frame and returns the rectangle (in full size pixels) which contains objects,
+# or None if the frame is empty
+def coverage_rect(context, data):
+    (width, height) = frame_size(context)
+
+    alpha = coverage_alpha(context, COVERAGE_SIZE)
+    (small_height, small_width) = alpha.shape
+
+    (rows, columns) = numpy.nonzero(alpha > 0)
+
+    if len(rows) == 0:
+        return None
+
+    scale_x = width / small_width
+    scale_y = height / small_height
+
+    # Each small pixel covers several full size pixels, so the whole small pixel is included
+    x1 = max(floor(columns.min() * scale_x) - data.crop_padding, 0)
+    y1 = max(floor(rows.min() * scale_y) - data.crop_padding, 0)
+    x2 = min(ceil((columns.max() + 1) * scale_x) + data.crop_padding, width)
+    y2 = min(ceil((rows.max() + 1) * scale_y) + data.crop_padding, height)
+
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def write_sidecar(context, path, rect, full_size):
+    camera = context.scene.camera
+
+    (x, y, width, height) = rect
+    (full_width, full_height) = full_size
+
+    pixel = pixel_size(context)
+
+    sidecar = {
+        # Pixels of the uncropped texture, starting at the bottom left
+        "rect": [x, y, width, height],
+        "size": [full_width, full_height],
+
+        # The same rectangle in UV coordinates of the uncropped texture
+        "uv": [x / full_width, y / full_height, (x + width) / full_width, (y + height) / full_height],
+
+        # Center and size of the cropped texture in world units
+        "world_offset": [camera.location.x, camera.location.y],
+        "world_size": [width * pixel, height * pixel],
+    }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path + ".partial", "w", encoding="utf-8") as file:
+        json.dump(sidecar, file, indent=4)
+
+    os.replace(path + ".partial", path)
+
+
+# Crops the frame while the passes are being rendered
+class Crop:
+    def __init__(self, context, data, prefix):
+        self.context = context
+        self.data = data
+        self.prefix = prefix
+        self.region = None
+
+    def __enter__(self):
+        rect = None
+        full_size = frame_size(self.context)
+
+        # The atlas crops every decal separately
+        if self.data.use_crop and self.data.camera_mode == 'TOP' and render_state["atlas"] is None:
+            rect = coverage_rect(self.context, self.data)
+
+        # Empty frames and frames which are completely filled are not cropped
+        if rect is None or (rect[2], rect[3]) == full_size:
+            # The placement from an older bake would be wrong
+            if os.path.exists(crop_path(self.prefix)):
+                os.remove(crop_path(self.prefix))
+
+            return self
+
+        self.region = Region(self.context, *rect)
+        self.region.__enter__()
+
+        write_sidecar(self.context, crop_path(self.prefix), rect, full_size)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.region is not None:
+            self.region.__exit__(exc_type, exc_value, traceback)
+            self.region = None
+
+        return False
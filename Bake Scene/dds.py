@@ -0,0 +1,354 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Writes block compressed DDS files (with mipmaps) which can be used directly by game engines.
+#
+# The encoders run on the CPU with numpy. They use the bounding box of each 4x4 block as the endpoints,
+# which is much faster than an optimizing encoder but the quality is slightly lower.
+# BC7 only uses mode 6 (a single pair of RGBA endpoints with 16 levels).
+
+import os
+import struct
+import numpy
+from concurrent.futures import (ThreadPoolExecutor)
+
+from .resample import (downsample, COLOR_PASSES)
+
+
+# The codec which is used for each pass, None means that the pass isn't saved as DDS.
+# Index passes are not saved, because block compression changes the IDs.
+DDS_CODECS = {
+    "render": 'COLOR',
+    "alpha": 'BC4',
+    "ao": 'BC4',
+    "curvature": 'BC4',
+    "height": 'BC4',
+    "depth": 'BC4',
+    "normal": 'BC5',
+    "color": 'COLOR',
+    "emission": 'COLOR',
+    "metallic": 'BC4',
+    "roughness": 'BC4',
+    "vertex_color": 'COLOR',
+    "material_index": None,
+    "object_index": None,
+    "object_random": 'BC4',
+    "hair_random": 'BC4',
+    "hair_root": 'BC4',
+}
+
+# DXGI formats for the DX10 header, the second value is used for sRGB colors
+DXGI_FORMATS = {
+    'BC1': (71, 72),
+    'BC4': (80, 80),
+    'BC5': (83, 83),
+    'BC7': (98, 99),
+}
+
+# Bytes per 4x4 block
+BLOCK_SIZES = {
+    'BC1': 8,
+    'BC4': 8,
+    'BC5': 16,
+    'BC7': 16,
+}
+
+# How many blocks are encoded by each task
+CHUNK_BLOCKS = 16384
+
+BC7_WEIGHTS = numpy.array([0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64], dtype=numpy.int32)
+
+# The BC1 palette is stored as (endpoint 0, endpoint 1, 1/3, 2/3), this converts from the position on the line
+BC1_ORDER = numpy.array([0, 2, 3, 1], dtype=numpy.uint32)
+
+
+def pass_codec(data, name):
+    codec = DDS_CODECS[name]
+
+    if codec == 'COLOR':
+        return data.dds_color_codec
+    else:
+        return codec
+
+
+def linear_to_srgb(rgb):
+    rgb = numpy.clip(rgb, 0.0, 1.0)
+    return numpy.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * rgb ** (1.0 / 2.4) - 0.055)
+
+
+# Splits the pixels into (count, 16, channels) blocks, the size is padded by repeating the last row and column
+def image_blocks(pixels):
+    (height, width, channels) = pixels.shape
+
+    # DDS files are stored from top to bottom
+    pixels = pixels[::-1]
+
+    padded = numpy.pad(pixels, ((0, -height % 4), (0, -width % 4), (0, 0)), mode='edge')
+    (rows, columns) = (padded.shape[0] // 4, padded.shape[1] // 4)
+
+    return padded.reshape(rows, 4, columns, 4, channels).transpose(0, 2, 1, 3, 4).reshape(-1, 16, channels)
+
+
+# Returns the position of every texel on the line between the endpoints (0 is the first endpoint and 1 is the last)
+def project(texels, start, end):
+    axis = end - start
+    length = numpy.sum(axis * axis, axis=1)
+    t = numpy.einsum("nkc,nc->nk", texels - start[:, None, :], axis)
+    return numpy.divide(t, length[:, None], out=numpy.zeros_like(t), where=length[:, None] > 0)
+
+
+# The endpoints are the corners of the bounding box, the diagonal is chosen based on the correlation with the main channel
+def bounding_endpoints(texels):
+    low = texels.min(axis=1)
+    high = texels.max(axis=1)
+
+    main = numpy.argmax(high - low, axis=1)
+    centered = texels - texels.mean(axis=1, keepdims=True)
+    reference = numpy.take_along_axis(centered, main[:, None, None], axis=2)
+    flip = numpy.sum(centered * reference, axis=1) < 0
+
+    start = numpy.where(flip, high, low)
+    end = numpy.where(flip, low, high)
+    return (start, end)
+
+
+def pack_bits(count, fields):
+    low = numpy.zeros(count, dtype=numpy.uint64)
+    high = numpy.zeros(count, dtype=numpy.uint64)
+
+    position = 0
+
+    for (value, bits) in fields:
+        value = value.astype(numpy.uint64)
+
+        if position < 64:
+            low |= value << numpy.uint64(position)
+
+            if position + bits > 64:
+                high |= value >> numpy.uint64(64 - position)
+
+        else:
+            high |= value << numpy.uint64(position - 64)
+
+        position += bits
+
+    return numpy.stack([low, high], axis=1).astype("<u8").tobytes()
+
+
+def rgb565(rgb):
+    q = numpy.rint(rgb * [31.0, 63.0, 31.0]).astype(numpy.uint32)
+    return (q[:, 0] << 11) | (q[:, 1] << 5) | q[:, 2]
+
+
+def decode565(c):
+    return numpy.stack([(c >> 11) / 31.0, ((c >> 5) & 63) / 63.0, (c & 31) / 31.0], axis=1)
+
+
+def encode_bc1(texels):
+    rgb = texels[..., :3]
+
+    (start, end) = bounding_endpoints(rgb)
+
+    c0 = rgb565(end)
+    c1 = rgb565(start)
+
+    # The 4 color mode is only used when the first endpoint is larger
+    swap = c0 < c1
+    (c0, c1) = (numpy.where(swap, c1, c0), numpy.where(swap, c0, c1))
+
+    t = project(rgb, decode565(c0), decode565(c1))
+    levels = numpy.clip(numpy.rint(t * 3), 0, 3).astype(numpy.uint32)
+
+    # Single color blocks use 3 color mode, where index 0 is the color
+    indexes = numpy.where((c0 == c1)[:, None], 0, BC1_ORDER[levels])
+
+    packed = numpy.zeros(len(texels), dtype=numpy.uint32)
+
+    for i in range(16):
+        packed |= indexes[:, i] << numpy.uint32(i * 2)
+
+    blocks = numpy.zeros(len(texels), dtype=[("c0", "<u2"), ("c1", "<u2"), ("indexes", "<u4")])
+    blocks["c0"] = c0
+    blocks["c1"] = c1
+    blocks["indexes"] = packed
+    return blocks.tobytes()
+
+
+def encode_bc4(values):
+    a0 = numpy.rint(values.max(axis=1) * 255).astype(numpy.int32)
+    a1 = numpy.rint(values.min(axis=1) * 255).astype(numpy.int32)
+
+    t = numpy.divide(values * 255 - a1[:, None], (a0 - a1)[:, None], out=numpy.zeros(values.shape), where=(a0 > a1)[:, None])
+    levels = numpy.clip(numpy.rint(t * 7), 0, 7).astype(numpy.uint64)
+
+    # Palette: 0 is a0, 1 is a1, 2 to 7 go from a0 to a1
+    indexes = numpy.where(levels == 7, 0, numpy.where(levels == 0, 1, 8 - levels))
+
+    packed = numpy.zeros(len(values), dtype=numpy.uint64)
+
+    for i in range(16):
+        packed |= indexes[:, i] << numpy.uint64(i * 3)
+
+    blocks = numpy.zeros((len(values), 8), dtype=numpy.uint8)
+    blocks[:, 0] = a0
+    blocks[:, 1] = a1
+    blocks[:, 2:] = packed.astype("<u8").view(numpy.uint8).reshape(-1, 8)[:, :6]
+    return blocks.tobytes()
+
+
+def encode_bc5(texels):
+    red = numpy.frombuffer(encode_bc4(texels[..., 0]), dtype=numpy.uint8).reshape(-1, 8)
+    green = numpy.frombuffer(encode_bc4(texels[..., 1]), dtype=numpy.uint8).reshape(-1, 8)
+    return numpy.concatenate([red, green], axis=1).tobytes()
+
+
+# Quantizes the endpoint to 7 bits per channel plus a shared p-bit, choosing the p-bit with the smallest error
+def bc7_endpoint(values):
+    best = None
+
+    for p in (0, 1):
+        q = numpy.clip(numpy.rint((values - p) / 2), 0, 127).astype(numpy.int32)
+        error = numpy.sum((q * 2 + p - values) ** 2, axis=1)
+
+        if best is None:
+            best = (q, numpy.full(len(values), p), error)
+
+        else:
+            better = error < best[2]
+            best = (
+                numpy.where(better[:, None], q, best[0]),
+                numpy.where(better, p, best[1]),
+                numpy.where(better, error, best[2]),
+            )
+
+    return best[:2]
+
+
+def encode_bc7(texels):
+    values = texels * 255.0
+
+    (start, end) = bounding_endpoints(values)
+
+    (q0, p0) = bc7_endpoint(start)
+    (q1, p1) = bc7_endpoint(end)
+
+    e0 = (q0 * 2 + p0[:, None]).astype(numpy.float64)
+    e1 = (q1 * 2 + p1[:, None]).astype(numpy.float64)
+
+    t = project(values, e0, e1)
+    indexes = numpy.searchsorted((BC7_WEIGHTS[1:] + BC7_WEIGHTS[:-1]) / 128.0, numpy.clip(t, 0, 1)).astype(numpy.int32)
+
+    # The first index only has 3 bits, so the endpoints are swapped if it is too large
+    swap = indexes[:, 0] >= 8
+    indexes = numpy.where(swap[:, None], 15 - indexes, indexes)
+    (q0, q1) = (numpy.where(swap[:, None], q1, q0), numpy.where(swap[:, None], q0, q1))
+    (p0, p1) = (numpy.where(swap, p1, p0), numpy.where(swap, p0, p1))
+
+    count = len(texels)
+
+    fields = [(numpy.full(count, 64), 7)]
+
+    for channel in range(4):
+        fields.append((q0[:, channel], 7))
+        fields.append((q1[:, channel], 7))
+
+    fields.append((p0, 1))
+    fields.append((p1, 1))
+    fields.append((indexes[:, 0], 3))
+
+    for i in range(1, 16):
+        fields.append((indexes[:, i], 4))
+
+    return pack_bits(count, fields)
+
+
+def encode(codec, texels):
+    if codec == 'BC1':
+        return encode_bc1(texels)
+    elif codec == 'BC4':
+        return encode_bc4(texels[..., 0])
+    elif codec == 'BC5':
+        return encode_bc5(texels)
+    elif codec == 'BC7':
+        return encode_bc7(texels)
+
+
+def encode_image(executor, codec, pixels):
+    blocks = image_blocks(pixels).astype(numpy.float64)
+    chunks = [blocks[i:i + CHUNK_BLOCKS] for i in range(0, len(blocks), CHUNK_BLOCKS)]
+    return b"".join(executor.map(lambda chunk: encode(codec, chunk), chunks))
+
+
+# Returns every mipmap level, from the full size down to 1x1
+def mipmaps(pixels, name, filter):
+    levels = [pixels]
+
+    while pixels.shape[0] > 1 or pixels.shape[1] > 1:
+        # Sides which are already 1 pixel are repeated, so only the other side is halved
+        if pixels.shape[0] == 1:
+            pixels = numpy.repeat(pixels, 2, axis=0)
+
+        if pixels.shape[1] == 1:
+            pixels = numpy.repeat(pixels, 2, axis=1)
+
+        pixels = downsample(pixels, name, filter)
+        levels.append(pixels)
+
+    return levels
+
+
+def header(codec, width, height, mipmap_count, srgb):
+    (linear_format, srgb_format) = DXGI_FORMATS[codec]
+
+    top_size = ((width + 3) // 4) * ((height + 3) // 4) * BLOCK_SIZES[codec]
+
+    pixel_format = struct.pack("<II4sIIIII", 32, 0x4, b"DX10", 0, 0, 0, 0, 0)
+
+    dds_header = struct.pack("<IIIIIII", 124, 0x1 | 0x2 | 0x4 | 0x1000 | 0x20000 | 0x80000, height, width, top_size, 0, mipmap_count)
+    dds_header += b"\0" * 44
+    dds_header += pixel_format
+    dds_header += struct.pack("<IIIII", 0x1000 | 0x8 | 0x400000, 0, 0, 0, 0)
+
+    dx10_header = struct.pack("<IIIII", srgb_format if srgb else linear_format, 3, 0, 1, 0)
+
+    return b"DDS " + dds_header + dx10_header
+
+
+# The pixels are linear RGBA in Blender's bottom to top order
+def write_dds(path, pixels, name, codec, filter):
+    srgb = name in COLOR_PASSES
+
+    levels = mipmaps(pixels, name, filter)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        encoded = []
+
+        for level in levels:
+            if srgb:
+                level = numpy.concatenate([linear_to_srgb(level[..., :3]), level[..., 3:]], axis=2)
+
+            encoded.append(encode_image(executor, codec, numpy.clip(level, 0.0, 1.0)))
+
+    partial = path + ".partial"
+
+    with open(partial, "wb") as file:
+        file.write(header(codec, pixels.shape[1], pixels.shape[0], len(levels), srgb))
+
+        for data in encoded:
+            file.write(data)
+
+    os.replace(partial, path)
@@ -0,0 +1,227 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Writes multilayer OpenEXR files.
+#
+# Blender can only write multilayer files from the compositor, so the file is written directly, following
+# the OpenEXR file layout (a single part scanline image). Every layer is stored as "<layer>.<channel>".
+#
+# It can also write a file a few rows at a time, so the whole image never needs to be in memory.
+
+import os
+import zlib
+import struct
+import numpy
+from concurrent.futures import (ThreadPoolExecutor)
+
+
+EXR_MAGIC = 20000630
+EXR_VERSION = 2
+
+# The compression value in the header, and how many scanlines are stored in each block
+CODECS = {
+    'NONE': (0, 1),
+    'ZIPS': (2, 1),
+    'ZIP': (3, 16),
+}
+
+# The pixel type in the header, and the numpy type which is used for the pixels
+PIXEL_TYPES = {
+    '16': (1, numpy.dtype("<f2")),
+    '32': (2, numpy.dtype("<f4")),
+}
+
+
+def attribute(name, type, value):
+    return name.encode("utf-8") + b"\0" + type.encode("utf-8") + b"\0" + struct.pack("<i", len(value)) + value
+
+
+def channel_list(names, pixel_type):
+    value = b""
+
+    for name in names:
+        value += name.encode("utf-8") + b"\0" + struct.pack("<iB3xii", pixel_type, 0, 1, 1)
+
+    return value + b"\0"
+
+
+# The line order is 0 if the scanlines are stored from top to bottom, or 1 if they are stored from bottom to top
+def header(names, pixel_type, compression, width, height, line_order=0):
+    box = struct.pack("<iiii", 0, 0, width - 1, height - 1)
+
+    return b"".join([
+        struct.pack("<ii", EXR_MAGIC, EXR_VERSION),
+        attribute("channels", "chlist", channel_list(names, pixel_type)),
+        attribute("compression", "compression", struct.pack("<B", compression)),
+        attribute("dataWindow", "box2i", box),
+        attribute("displayWindow", "box2i", box),
+        attribute("lineOrder", "lineOrder", struct.pack("<B", line_order)),
+        attribute("pixelAspectRatio", "float", struct.pack("<f", 1.0)),
+        attribute("screenWindowCenter", "v2f", struct.pack("<ff", 0.0, 0.0)),
+        attribute("screenWindowWidth", "float", struct.pack("<f", 1.0)),
+        b"\0",
+    ])
+
+
+# Zip compression splits the bytes into two halves and stores the difference between neighboring bytes
+def zip_block(raw):
+    data = numpy.frombuffer(raw, dtype=numpy.uint8)
+    data = numpy.concatenate((data[0::2], data[1::2])).astype(numpy.int16)
+
+    data[1:] = (numpy.diff(data) + 128) & 0xFF
+
+    compressed = zlib.compress(data.astype(numpy.uint8).tobytes())
+
+    # If compressing made it bigger then the uncompressed bytes are stored instead
+    if len(compressed) < len(raw):
+        return compressed
+    else:
+        return raw
+
+
+# The layers are a list of (name, channels, pixels), the pixels are in Blender's bottom to top order.
+# Every layer must have the same size.
+def write_multilayer(path, layers, codec='ZIP', depth='32'):
+    (compression, lines) = CODECS[codec]
+    (pixel_type, dtype) = PIXEL_TYPES[depth]
+
+    (height, width) = layers[0][2].shape[:2]
+
+    channels = {}
+
+    for (name, names, pixels) in layers:
+        for (index, channel) in enumerate(names):
+            channels[name + "." + channel] = pixels[..., index]
+
+    # The channels must be sorted, and the scanlines are stored from top to bottom
+    names = sorted(channels)
+    planes = numpy.stack([channels[name][::-1] for name in names]).astype(dtype)
+
+    def block(y):
+        raw = numpy.ascontiguousarray(planes[:, y:y + lines, :].transpose(1, 0, 2)).tobytes()
+
+        if compression != 0:
+            raw = zip_block(raw)
+
+        return struct.pack("<ii", y, len(raw)) + raw
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        blocks = list(executor.map(block, range(0, height, lines)))
+
+    start = header(names, pixel_type, compression, width, height)
+
+    offsets = []
+    offset = len(start) + 8 * len(blocks)
+
+    for data in blocks:
+        offsets.append(offset)
+        offset += len(data)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    partial = path + ".partial"
+
+    with open(partial, "wb") as file:
+        file.write(start)
+        file.write(struct.pack("<" + str(len(offsets)) + "Q", *offsets))
+
+        for data in blocks:
+            file.write(data)
+
+    os.replace(partial, path)
+
+
+# Writes the rows of an image from the bottom to the top, only the rows of a single block are kept in memory.
+#
+# The channels must be sorted, and the rows which are written must have one value for each channel.
+class ScanlineWriter:
+    def __init__(self, path, names, width, height, codec='ZIP', depth='32'):
+        (self.compression, self.lines) = CODECS[codec]
+        (self.pixel_type, self.dtype) = PIXEL_TYPES[depth]
+
+        self.path = path
+        self.names = names
+        self.width = width
+        self.height = height
+
+        self.blocks = (height + self.lines - 1) // self.lines
+        self.offsets = [0] * self.blocks
+
+        # The blocks are written from the last block (the bottom of the image) to the first block
+        self.block = self.blocks - 1
+        self.pending = []
+        self.pending_rows = 0
+
+        self.file = None
+        self.table = None
+
+    def block_rows(self, block):
+        return min(self.lines, self.height - block * self.lines)
+
+    def write_block(self, rows):
+        y = self.block * self.lines
+
+        # The rows are bottom to top, but each block is stored from top to bottom
+        raw = numpy.ascontiguousarray(rows[::-1].transpose(0, 2, 1).astype(self.dtype)).tobytes()
+
+        if self.compression != 0:
+            raw = zip_block(raw)
+
+        self.offsets[self.block] = self.file.tell()
+        self.file.write(struct.pack("<ii", y, len(raw)) + raw)
+
+        self.block -= 1
+
+    # The rows are a (rows, width, channels) array, in Blender's bottom to top order
+    def write(self, rows):
+        self.pending.append(rows)
+        self.pending_rows += rows.shape[0]
+
+        while self.block >= 0 and self.pending_rows >= self.block_rows(self.block):
+            pending = numpy.concatenate(self.pending)
+            size = self.block_rows(self.block)
+
+            self.write_block(pending[:size])
+
+            self.pending = [pending[size:]]
+            self.pending_rows -= size
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.file = open(self.path, "wb")
+        self.file.write(header(self.names, self.pixel_type, self.compression, self.width, self.height, line_order=1))
+
+        # The offsets are written after all of the blocks are written
+        self.table = self.file.tell()
+        self.file.write(b"\0" * (8 * self.blocks))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                if self.block >= 0:
+                    raise ValueError("Not enough rows were written to the EXR file")
+
+                self.file.seek(self.table)
+                self.file.write(struct.pack("<" + str(self.blocks) + "Q", *self.offsets))
+
+        finally:
+            self.file.close()
+
+        return False
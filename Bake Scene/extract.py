@@ -0,0 +1,181 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+import bpy
+from mathutils import (Vector)
+
+from .utils import (renderable_objects, region_bounds)
+
+
+# AO can be affected by objects which are slightly outside of the baking region
+REGION_MARGIN = 0.2
+
+# Custom property which contains the original name of an extracted collection
+DECAL_NAME = "bake_scene_name"
+
+# Scene settings which are copied into the extracted scene
+SCENE_SETTINGS = (
+    "render",
+    "cycles",
+    "eevee",
+    "display",
+    "view_settings",
+    "display_settings",
+    "sequencer_colorspace_settings",
+    "unit_settings",
+    "bake_scene",
+)
+
+
+def copy_properties(source, target):
+    for prop in source.bl_rna.properties:
+        name = prop.identifier
+
+        if name == "rna_type":
+            continue
+
+        value = getattr(source, name)
+
+        if prop.type == 'COLLECTION':
+            copy_collection(value, getattr(target, name))
+
+        elif prop.type == 'POINTER' and value is not None and not isinstance(value, bpy.types.ID):
+            copy_properties(value, getattr(target, name))
+
+        elif not prop.is_readonly:
+            try:
+                setattr(target, name, value)
+
+            # Some properties can't be changed, for example because they depend on other properties
+            except (AttributeError, TypeError, ValueError):
+                pass
+
+
+# Copies the items of a CollectionProperty (for example the regions or the quality profiles)
+def copy_collection(source, target):
+    # Blender's own collections (for example the render views) can't be copied this way
+    if not hasattr(target, "add"):
+        return
+
+    target.clear()
+
+    for item in source:
+        copy_properties(item, target.add())
+
+
+# Copies the collections of the view layer into the scene, but only with the objects which are baked.
+#
+# The collections keep their hierarchy and hide_render, so the decals of the atlas can still be hidden. Returns a dict
+# of the old collections -> new collections.
+def copy_layer_collections(layer, parent, objects, mapping):
+    for child in layer.children:
+        if child.exclude:
+            continue
+
+        source = child.collection
+
+        collection = bpy.data.collections.new(source.name)
+        collection.hide_render = source.hide_render
+
+        # The new collection might have a different name, the atlas uses the original name
+        collection[DECAL_NAME] = source.get(DECAL_NAME, source.name)
+
+        parent.children.link(collection)
+        mapping[source] = collection
+
+        for obj in source.objects:
+            if obj in objects:
+                collection.objects.link(obj)
+
+        copy_layer_collections(child, collection, objects, mapping)
+
+    return mapping
+
+
+def remove_collections(mapping):
+    for collection in mapping.values():
+        bpy.data.collections.remove(collection)
+
+
+def inside_region(context, data, obj):
+    if data.camera_mode == 'HDRI' or obj.type == 'LIGHT':
+        return True
+
+    corners = [obj.matrix_world @ Vector(corner) for corner in obj.bound_box]
+
+    min_x = min(co.x for co in corners)
+    max_x = max(co.x for co in corners)
+    min_y = min(co.y for co in corners)
+    max_y = max(co.y for co in corners)
+
+    # The object is needed if it is inside of any region
+    for ((center_x, center_y), size) in region_bounds(context, data):
+        half_width = size[0] / 2 + REGION_MARGIN
+        half_height = size[1] / 2 + REGION_MARGIN
+
+        if (
+            min_x - center_x <= half_width and
+            max_x - center_x >= -half_width and
+            min_y - center_y <= half_height and
+            max_y - center_y >= -half_height
+        ):
+            return True
+
+    return False
+
+
+def bake_objects(context, data):
+    return [obj for obj in renderable_objects(context.view_layer.layer_collection) if inside_region(context, data, obj)]
+
+
+# Writes a .blend file which only contains the data which is needed for baking, and returns the name of the scene
+def write_bake_blend(context, data, filepath):
+    source = context.scene
+    scene = bpy.data.scenes.new("[Bake Scene] " + source.name)
+    mapping = {}
+
+    try:
+        for name in SCENE_SETTINGS:
+            copy_properties(getattr(source, name), getattr(scene, name))
+
+        scene.world = source.world
+        scene.frame_current = source.frame_current
+
+        objects = set(bake_objects(context, data))
+        layer = context.view_layer.layer_collection
+
+        for obj in layer.collection.objects:
+            if obj in objects:
+                scene.collection.objects.link(obj)
+
+        copy_layer_collections(layer, scene.collection, objects, mapping)
+
+        # The settings must use the new collections, otherwise the atlas would hide the old collections
+        for name in ("atlas_collection", "probe_collection"):
+            collection = getattr(scene.bake_scene, name)
+
+            if collection in mapping:
+                setattr(scene.bake_scene, name, mapping[collection])
+
+        # Materials, images, parents, etc. are written automatically because the objects use them
+        bpy.data.libraries.write(filepath, {scene}, path_remap='ABSOLUTE')
+
+        return scene.name
+
+    finally:
+        bpy.data.scenes.remove(scene)
+        remove_collections(mapping)
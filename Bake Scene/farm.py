@@ -0,0 +1,348 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# A queue is a directory (usually on a shared filesystem) which is split into units of work:
+#
+#     units/<id>.json       A single pass which needs to be baked
+#     leases/<id>.json      Created by the worker which is baking the unit, the worker keeps touching it while it is baking
+#     results/<id>/         The files which were baked by the worker
+#     done/<id>.json        Created after the results are published
+#     failed/<id>.json      Created if the bake failed
+#
+# If a lease hasn't been touched for a while then the worker is assumed to be dead, and another worker can claim the unit.
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import subprocess
+import bpy
+
+from .baking import (bake, open_blend, find_scene, parse_options, enabled_passes, combine_layers, Configure, BakeError, Progress)
+from .jobs import (load_job, bake_key, write_json)
+
+
+# Runs in a separate process, because Python threads are paused while Blender is rendering.
+# It stops when the worker closes stdin (or when the worker dies).
+HEARTBEAT = """
+import os, sys, threading
+stopped = threading.Event()
+threading.Thread(target=lambda: (sys.stdin.read(), stopped.set()), daemon=True).start()
+while not stopped.wait(float(sys.argv[2])):
+    try:
+        os.utime(sys.argv[1])
+    except OSError:
+        break
+"""
+
+# Prefix for the files in the results directory
+RESULT_PREFIX = "out_"
+
+
+def queue_path(queue, kind, id=None, extension=".json"):
+    if id is None:
+        return os.path.join(queue, kind)
+    else:
+        return os.path.join(queue, kind, id + extension)
+
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def unit_ids(queue):
+    return sorted(name[:-len(".json")] for name in os.listdir(queue_path(queue, "units")) if name.endswith(".json"))
+
+
+def is_complete(queue, id):
+    return os.path.exists(queue_path(queue, "done", id)) or os.path.exists(queue_path(queue, "failed", id))
+
+
+# Splits the job file into one unit per pass
+def submit(path, queue):
+    path = os.path.abspath(path)
+    job = load_job(path)
+
+    for kind in ("units", "leases", "results", "done", "failed"):
+        os.makedirs(queue_path(queue, kind), exist_ok=True)
+
+    count = 0
+
+    for (index, bake_options) in enumerate(job.get("bakes", [])):
+        if "file" not in bake_options:
+            raise BakeError("Missing file in job")
+
+        blend = os.path.join(os.path.dirname(path), bake_options["file"])
+
+        open_blend(blend)
+
+        scene = find_scene(bake_options.get("scene"))
+
+        with Configure(scene, parse_options(bake_options)):
+            output = bpy.path.abspath(scene.render.filepath)
+            names = enabled_passes(scene.bake_scene)
+
+        for name in names:
+            id = str(index).zfill(4) + "_" + bake_key(bake_options) + "_" + name
+
+            write_json(queue_path(queue, "units", id), {
+                "file": os.path.abspath(blend),
+                "scene": scene.name,
+                "options": bake_options,
+                "texture": name,
+                "output": output,
+            })
+
+            count += 1
+
+    return count
+
+
+def worker_name():
+    return socket.gethostname() + ":" + str(os.getpid())
+
+
+def worker_suffix():
+    return "." + worker_name().replace(":", "_")
+
+
+# Returns True if the lease was created by this worker.
+#
+# If two workers break the same stale lease at the same time then the unit might be baked twice,
+# that is harmless because the results are published atomically.
+def claim(queue, id, timeout):
+    lease = queue_path(queue, "leases", id)
+
+    try:
+        if time.time() - os.path.getmtime(lease) < timeout:
+            return False
+
+        stale = lease + worker_suffix() + ".stale"
+        os.replace(lease, stale)
+        os.remove(stale)
+
+    except FileNotFoundError:
+        pass
+
+    try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+
+    except FileExistsError:
+        return False
+
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump({"worker": worker_name(), "time": time.time()}, file)
+
+    return True
+
+
+def release(queue, id):
+    try:
+        os.remove(queue_path(queue, "leases", id))
+
+    except FileNotFoundError:
+        pass
+
+
+# Keeps touching the lease file while the unit is being baked
+class Heartbeat:
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen([sys.executable, "-c", HEARTBEAT, self.path, str(self.interval)], stdin=subprocess.PIPE)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.process.stdin.close()
+        self.process.wait()
+        return False
+
+
+# The results can contain folders (for example the Multilayer EXR layers), so it returns the relative paths of every file
+def result_files(results):
+    files = []
+
+    for (directory, _, names) in os.walk(results):
+        for name in names:
+            files.append(os.path.relpath(os.path.join(directory, name), results).replace(os.sep, "/"))
+
+    return sorted(files)
+
+
+def bake_unit(queue, id, progress):
+    unit = read_json(queue_path(queue, "units", id))
+
+    results = queue_path(queue, "results", id, extension="")
+    partial = results + worker_suffix() + ".partial"
+
+    if os.path.exists(partial):
+        shutil.rmtree(partial)
+
+    os.makedirs(partial)
+
+    open_blend(unit["file"])
+
+    scene = find_scene(unit["scene"])
+
+    options = parse_options(unit["options"])
+    options["output"] = os.path.join(partial, RESULT_PREFIX)
+
+    with bpy.context.temp_override(scene=scene):
+        with Configure(scene, options):
+            bake(bpy.context, scene.bake_scene, names=[unit["texture"]], progress=progress, combine=False)
+
+    # Publish the results
+    shutil.rmtree(results, ignore_errors=True)
+
+    try:
+        os.replace(partial, results)
+
+    # Another worker published the same unit at the same time
+    except OSError:
+        shutil.rmtree(partial, ignore_errors=True)
+
+    write_json(queue_path(queue, "done", id), {
+        "worker": worker_name(),
+        "files": result_files(results),
+    })
+
+
+# Bakes units until every unit in the queue is finished
+def work(queue, timeout, progress=None, poll=5.0):
+    if progress is None:
+        progress = Progress()
+
+    while True:
+        remaining = [id for id in unit_ids(queue) if not is_complete(queue, id)]
+
+        if not remaining:
+            return
+
+        claimed = False
+
+        for id in remaining:
+            if is_complete(queue, id) or not claim(queue, id, timeout):
+                continue
+
+            claimed = True
+
+            # Another worker might have finished it before the lease was claimed
+            if is_complete(queue, id):
+                release(queue, id)
+                continue
+
+            try:
+                with Heartbeat(queue_path(queue, "leases", id), timeout / 4):
+                    bake_unit(queue, id, progress)
+
+            except Exception as e:
+                write_json(queue_path(queue, "failed", id), {
+                    "worker": worker_name(),
+                    "error": str(e) if isinstance(e, BakeError) else repr(e),
+                })
+
+            finally:
+                release(queue, id)
+
+        # All of the remaining units are being baked by other workers
+        if not claimed:
+            time.sleep(poll)
+
+
+def copy_atomic(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copyfile(source, target + ".partial")
+    os.replace(target + ".partial", target)
+
+
+# Waits for every unit to finish, and then copies the results to the output paths
+def coordinate(queue, progress=None, poll=5.0):
+    if progress is None:
+        progress = Progress()
+
+    ids = unit_ids(queue)
+    finished = set()
+
+    progress.begin(len(ids))
+
+    while len(finished) < len(ids):
+        for id in ids:
+            if id not in finished and is_complete(queue, id):
+                finished.add(id)
+                progress.update(len(finished), id, [])
+
+        if len(finished) < len(ids):
+            time.sleep(poll)
+
+    progress.end()
+
+    errors = []
+    outputs = {}
+
+    for id in ids:
+        if os.path.exists(queue_path(queue, "failed", id)):
+            errors.append(id + ": " + read_json(queue_path(queue, "failed", id))["error"])
+            continue
+
+        unit = read_json(queue_path(queue, "units", id))
+        done = read_json(queue_path(queue, "done", id))
+
+        paths = []
+
+        for name in done["files"]:
+            target = unit["output"] + name[len(RESULT_PREFIX):]
+            copy_atomic(os.path.join(queue_path(queue, "results", id, extension=""), name), target)
+            paths.append(target)
+
+        outputs[id] = paths
+
+    if errors:
+        raise BakeError("Some units failed:\n" + "\n".join(errors))
+
+    outputs.update(combine_units(queue, ids))
+
+    return outputs
+
+
+# Every unit only bakes a single texture, so the Multilayer EXR files are combined after all of the results were copied,
+# the same as a local bake. Units with the same output are combined once.
+def combine_units(queue, ids):
+    outputs = {}
+
+    for id in ids:
+        unit = read_json(queue_path(queue, "units", id))
+        key = bake_key(unit["options"])
+
+        if key in outputs:
+            continue
+
+        open_blend(unit["file"])
+
+        scene = find_scene(unit["scene"])
+
+        with bpy.context.temp_override(scene=scene):
+            with Configure(scene, parse_options(unit["options"])):
+                data = scene.bake_scene
+                outputs[key] = combine_layers(bpy.context, data, unit["output"]) if data.use_multilayer else []
+
+    return {key + "/layers": paths for (key, paths) in outputs.items() if paths}
@@ -0,0 +1,149 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Each texture can be saved with a different file format and bit depth.
+#
+# A format is a (file_format, color_depth, compression) tuple, or None if the texture uses the
+# output settings of the scene.
+
+
+# Formats which are used by the Auto output policy.
+#
+# Masks only need 8 bits, but height, depth and normal need 16 bits to avoid banding.
+# Random values use 16 bits so that different objects are less likely to get the same value.
+# The render texture uses the output settings, because it is the user's final image.
+AUTO_FORMATS = {
+    "render": None,
+    "alpha": ('PNG', '8', 15),
+    "ao": ('PNG', '8', 15),
+    "curvature": ('PNG', '8', 15),
+    "height": ('PNG', '16', 15),
+    "depth": ('PNG', '16', 15),
+    "normal": ('PNG', '16', 15),
+    "color": ('PNG', '8', 15),
+    "emission": ('PNG', '8', 15),
+    "metallic": ('PNG', '8', 15),
+    "roughness": ('PNG', '8', 15),
+    "vertex_color": ('PNG', '8', 15),
+    "material_index": ('PNG', '8', 15),
+    "object_index": ('PNG', '8', 15),
+    "object_random": ('PNG', '16', 15),
+    "hair_random": ('PNG', '16', 15),
+    "hair_root": ('PNG', '8', 15),
+}
+
+# The bit depths which are supported by each file format
+COLOR_DEPTHS = {
+    'PNG': ('8', '16'),
+    'TIFF': ('8', '16'),
+    'OPEN_EXR': ('16', '32'),
+}
+
+# When Multilayer EXR is enabled, every texture is saved as a lossless float image before being combined
+LAYER_FORMAT = ('OPEN_EXR', '32', 0)
+
+# 8 bits can only store 256 different indexes
+MAX_8BIT_INDEX = 255
+
+
+def valid_depth(file_format, color_depth):
+    depths = COLOR_DEPTHS[file_format]
+
+    if color_depth in depths:
+        return color_depth
+
+    # Use the closest supported depth
+    elif int(color_depth) < int(depths[0]):
+        return depths[0]
+
+    else:
+        return depths[-1]
+
+
+def auto_format(data, name):
+    format = AUTO_FORMATS[name]
+
+    if name == "material_index" and data.generate_material_index_max > MAX_8BIT_INDEX:
+        return ('PNG', '16', 15)
+
+    elif name == "object_index" and data.generate_object_index_max > MAX_8BIT_INDEX:
+        return ('PNG', '16', 15)
+
+    else:
+        return format
+
+
+# Returns the format which is used for the texture
+def output_format(data, name):
+    if data.use_multilayer:
+        return LAYER_FORMAT
+
+    for override in data.output_overrides:
+        if override.texture == name:
+            return (override.file_format, valid_depth(override.file_format, override.color_depth), override.compression)
+
+    if data.output_policy == 'AUTO':
+        return auto_format(data, name)
+
+    else:
+        return None
+
+
+# Changes the output settings while the texture is being baked
+class OutputFormat:
+    def __init__(self, context, format):
+        self.image_settings = context.scene.render.image_settings
+        self.format = format
+        self.saved = None
+
+    def __enter__(self):
+        if self.format is not None:
+            settings = self.image_settings
+
+            self.saved = (settings.file_format, settings.color_mode, settings.color_depth, settings.compression, settings.exr_codec, settings.tiff_codec)
+
+            (file_format, color_depth, compression) = self.format
+
+            # The file format must be changed first, because it changes which bit depths are allowed
+            settings.file_format = file_format
+            settings.color_depth = color_depth
+
+            if file_format == 'PNG':
+                settings.compression = compression
+
+            elif file_format == 'OPEN_EXR':
+                settings.exr_codec = 'ZIP' if compression > 0 else 'NONE'
+
+            elif file_format == 'TIFF':
+                settings.tiff_codec = 'DEFLATE' if compression > 0 else 'NONE'
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.saved is not None:
+            settings = self.image_settings
+
+            (file_format, color_mode, color_depth, compression, exr_codec, tiff_codec) = self.saved
+
+            settings.file_format = file_format
+            settings.color_mode = color_mode
+            settings.color_depth = color_depth
+            settings.compression = compression
+            settings.exr_codec = exr_codec
+            settings.tiff_codec = tiff_codec
+
+        return False
@@ -0,0 +1,186 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Bakes every frame of the scene's frame range, this is used for animated decals and flipbooks.
+#
+# The frames are rendered inside of the pass, so the settings, node groups and materials are only set up once for
+# each pass. If a frame looks the same as the previous frame (the objects and materials haven't changed) then the
+# previous frame's files are copied instead of rendering it again.
+#
+# The frames can also be combined into a single flipbook texture, with the first frame in the top left corner.
+
+import os
+import numpy
+from math import (ceil, sqrt)
+
+from .cache import (link_or_copy)
+from .utils import (load_output, output_path, save_pixels, render_frame, write_resolutions, write_block_compressed, render_state)
+
+
+def frame_numbers(scene):
+    return list(range(scene.frame_start, scene.frame_end + 1, scene.frame_step))
+
+
+def frame_suffix(number):
+    return "_" + str(number).zfill(4)
+
+
+# Returns the (columns, rows) of the flipbook
+def flipbook_grid(data, count):
+    columns = data.flipbook_columns
+
+    if columns == 0:
+        columns = ceil(sqrt(count))
+
+    columns = min(columns, count)
+
+    return (columns, ceil(count / columns))
+
+
+def flipbook(data, frames):
+    (columns, rows) = flipbook_grid(data, len(frames))
+    (height, width) = frames[0].shape[:2]
+
+    pixels = numpy.zeros((rows * height, columns * width, 4), dtype=numpy.float32)
+
+    for (index, frame) in enumerate(frames):
+        column = index % columns
+
+        # The first row of the pixels is the bottom of the image
+        row = rows - 1 - index // columns
+
+        pixels[row * height:(row + 1) * height, column * width:(column + 1) * width] = frame
+
+    return pixels
+
+
+class Frames:
+    def __init__(self, context, data, fingerprint):
+        self.context = context
+        self.data = data
+        self.fingerprint = fingerprint
+        self.active = False
+        self.saved = None
+
+    # Copies the files of the previous frame, the paths only differ by the frame number
+    def copy_frame(self, previous_root, root, previous_paths):
+        paths = []
+
+        for source in previous_paths:
+            target = root + source[len(previous_root):]
+            link_or_copy(source, target)
+            paths.append(target)
+
+        return paths
+
+    def write_flipbook(self, data, context, frames):
+        pixels = flipbook(data, frames)
+
+        path = output_path(context)
+        (root, extension) = os.path.splitext(path)
+        partial = root + ".partial" + extension
+
+        save_pixels(context, pixels, partial)
+        os.replace(partial, path)
+
+        paths = [path]
+
+        if data.resolution_levels > 0 and not data.use_multilayer:
+            paths += write_resolutions(data, context, path, pixels, False)
+
+        if data.use_dds:
+            paths += write_block_compressed(data, context, path, pixels, False)
+
+        return paths
+
+    # Renders every frame of the current pass, this is called by render
+    def render(self, data, context):
+        scene = context.scene
+        render = scene.render
+
+        filepath = render.filepath
+        current = scene.frame_current
+
+        paths = []
+        frames = []
+
+        previous = None
+        previous_root = None
+        previous_paths = None
+
+        try:
+            for number in frame_numbers(scene):
+                scene.frame_set(number)
+
+                render.filepath = filepath + frame_suffix(number)
+                root = os.path.splitext(output_path(context))[0]
+
+                fingerprint = self.fingerprint()
+
+                # Nothing changed since the previous frame
+                unchanged = fingerprint is not None and fingerprint == previous
+
+                if unchanged:
+                    frame_paths = self.copy_frame(previous_root, root, previous_paths)
+                else:
+                    frame_paths = render_frame(data, context)
+
+                if data.use_flipbook:
+                    # The copied frames look the same as the previous frame
+                    if unchanged:
+                        frames.append(frames[-1])
+
+                    # The pixels are only loaded if the render wrote them directly into the file
+                    elif render_state["pixels"] is None:
+                        frames.append(load_output(context, frame_paths[0]))
+
+                    else:
+                        frames.append(render_state["pixels"])
+
+                render_state["pixels"] = None
+
+                paths += frame_paths
+
+                previous = fingerprint
+                previous_root = root
+                previous_paths = frame_paths
+
+        finally:
+            render.filepath = filepath
+            scene.frame_set(current)
+
+        if frames:
+            paths += self.write_flipbook(data, context, frames)
+
+        return paths
+
+    def __enter__(self):
+        if not self.data.use_frame_range:
+            return self
+
+        self.active = True
+        self.saved = render_state["frames"]
+        render_state["frames"] = self
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            render_state["frames"] = self.saved
+            self.active = False
+
+        return False
@@ -0,0 +1,161 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# A job file lists the bakes which should be done, for example:
+#
+#     {
+#         "bakes": [
+#             {"file": "decal.blend", "scene": "Scene", "textures": ["alpha", "ao", "normal"], "output": "//textures/"},
+#             {"file": "trim.blend", "resolution": [4096, 2048], "output": "/tmp/trim_"}
+#         ]
+#     }
+#
+# Each bake accepts the same options as a bake server request. Relative file paths are relative to the job file.
+#
+# Every finished pass is recorded in the checkpoint file (by default it is next to the job file), if the job is
+# run again it skips the passes which are already finished.
+
+import os
+import json
+import hashlib
+import bpy
+
+from .baking import (bake, open_blend, find_scene, parse_options, enabled_passes, pass_label, Configure, BakeError, Progress)
+from .utils import (bake_regions)
+
+
+def load_job(path):
+    try:
+        if path.endswith(".toml"):
+            import tomllib
+
+            with open(path, "rb") as file:
+                return tomllib.load(file)
+
+        else:
+            with open(path, "r", encoding="utf-8") as file:
+                return json.load(file)
+
+    except ImportError:
+        raise BakeError("TOML job files need Python 3.11 or higher, use JSON instead")
+
+    except (OSError, ValueError) as e:
+        raise BakeError("Could not load job file: " + str(e))
+
+
+def checkpoint_path(path, job):
+    if "checkpoint" in job:
+        return os.path.join(os.path.dirname(path), job["checkpoint"])
+    else:
+        return path + ".checkpoint.json"
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    else:
+        return {}
+
+
+# Writes to a temporary file and then renames it, so the checkpoint is never partially written
+def write_json(path, value):
+    partial = path + ".partial"
+
+    with open(partial, "w", encoding="utf-8") as file:
+        json.dump(value, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(partial, path)
+
+
+# Identifies a bake, if the bake is changed in the job file then it will be baked again
+def bake_key(bake):
+    return hashlib.sha1(json.dumps(bake, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def is_finished(checkpoint, key):
+    paths = checkpoint.get(key)
+    return paths is not None and all(os.path.exists(path) for path in paths)
+
+
+# Records every finished pass in the checkpoint
+class CheckpointProgress(Progress):
+    def __init__(self, progress, path, checkpoint, key):
+        self.progress = progress
+        self.path = path
+        self.checkpoint = checkpoint
+        self.key = key
+
+    def begin(self, total):
+        self.progress.begin(total)
+
+    def update(self, index, name, paths):
+        self.checkpoint[self.key + "/" + name] = paths
+        write_json(self.path, self.checkpoint)
+        self.progress.update(index, name, paths)
+
+    def skip(self, index, name, reason):
+        self.checkpoint[self.key + "/" + name] = []
+        write_json(self.path, self.checkpoint)
+        self.progress.skip(index, name, reason)
+
+    def end(self):
+        self.progress.end()
+
+
+# Bakes everything in the job file and returns the files which were written
+def run_job(path, progress=None):
+    if progress is None:
+        progress = Progress()
+
+    path = os.path.abspath(path)
+    job = load_job(path)
+
+    checkpoint_file = checkpoint_path(path, job)
+    checkpoint = load_checkpoint(checkpoint_file)
+
+    outputs = {}
+
+    for bake_options in job.get("bakes", []):
+        if "file" not in bake_options:
+            raise BakeError("Missing file in job")
+
+        key = bake_key(bake_options)
+
+        open_blend(os.path.join(os.path.dirname(path), bake_options["file"]))
+
+        scene = find_scene(bake_options.get("scene"))
+
+        with bpy.context.temp_override(scene=scene):
+            with Configure(scene, parse_options(bake_options)):
+                data = scene.bake_scene
+
+                # The checkpoint uses the same labels as the progress of bake, so every region is checked
+                labels = {name: [key + "/" + pass_label(region, name) for region in bake_regions(data)] for name in enabled_passes(data)}
+
+                names = [name for name in enabled_passes(data) if not all(is_finished(checkpoint, label) for label in labels[name])]
+
+                if names:
+                    bake(bpy.context, data, names=names, progress=CheckpointProgress(progress, checkpoint_file, checkpoint, key))
+
+                for name in enabled_passes(data):
+                    for label in labels[name]:
+                        outputs[label] = checkpoint[label]
+
+    return outputs
@@ -17,18 +17,14 @@
 
 import time
 import bpy
-from math import radians
 
-from . import bakers
-from .utils import (calculate_max_height, calculate_max_depth, default_settings, AddEmptyMaterial, Camera, Settings)
+from . import workers
+from .baking import (bake, enabled_passes, height_error, BakeError, WindowProgress)
+from .quality import (DEFAULT_PROFILES, DEFAULT_PROFILE, find_profile, add_profile, add_default_profiles)
+from .utils import (calculate_max_height, calculate_max_depth)
 
 
-class HeightOperator:
-    def height_error(self, data):
-        self.report({'ERROR'}, "Objects are outside of baking range (" + str(round(data.camera_height)) + "m)")
-
-
-class CalculateMaxHeight(bpy.types.Operator, HeightOperator):
+class CalculateMaxHeight(bpy.types.Operator):
     bl_idname = "bake_scene.calculate_max_height"
     bl_label = "Calculate max height"
     bl_description = "Sets the max height using the same algorithm as the Auto mode"
@@ -40,7 +36,7 @@ class CalculateMaxHeight(bpy.types.Operator, HeightOperator):
         max_height = calculate_max_height(context, data)
 
         if max_height is None:
-            self.height_error(data)
+            self.report({'ERROR'}, height_error(data))
         else:
             data.max_height = max_height
 
@@ -85,123 +81,246 @@ class HideSize(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class Bake(bpy.types.Operator, HeightOperator):
-    bl_idname = "bake_scene.bake"
-    bl_label = "Bake"
-    bl_description = "Bake scene"
-    bl_options = {'REGISTER', 'UNDO'}
+class AddDefaultQualityProfiles(bpy.types.Operator):
+    bl_idname = "bake_scene.add_default_quality_profiles"
+    bl_label = "Add default profiles"
+    bl_description = "Adds the preview, draft, and final quality profiles"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    def execute(self, context):
+        add_default_profiles(context.scene.bake_scene)
+        return {'FINISHED'}
+
+
+class AddQualityProfile(bpy.types.Operator):
+    bl_idname = "bake_scene.add_quality_profile"
+    bl_label = "Add quality profile"
+    bl_description = "Adds a new quality profile which is a copy of the current profile"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    def execute(self, context):
+        data = context.scene.bake_scene
+
+        add_default_profiles(data)
+
+        current = find_profile(data) or data.quality_profiles[DEFAULT_PROFILE]
+
+        name = "custom"
+        index = 1
+
+        while name in data.quality_profiles:
+            index += 1
+            name = "custom" + str(index)
+
+        profile = add_profile(data, name, {key: getattr(current, key) for key in DEFAULT_PROFILES[DEFAULT_PROFILE]})
+
+        for override in current.overrides:
+            copy = profile.overrides.add()
+            copy.texture = override.texture
+            copy.eevee_samples = override.eevee_samples
+            copy.cycles_samples = override.cycles_samples
+            copy.workbench_aa = override.workbench_aa
+
+        data.quality_profile = name
+        return {'FINISHED'}
+
+
+class RemoveQualityProfile(bpy.types.Operator):
+    bl_idname = "bake_scene.remove_quality_profile"
+    bl_label = "Remove quality profile"
+    bl_description = "Removes the current quality profile"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    def execute(self, context):
+        data = context.scene.bake_scene
+
+        index = data.quality_profiles.find(data.quality_profile)
+
+        if index != -1:
+            data.quality_profiles.remove(index)
+            data.quality_profile = DEFAULT_PROFILE
+
+        return {'FINISHED'}
+
+
+class AddQualityOverride(bpy.types.Operator):
+    bl_idname = "bake_scene.add_quality_override"
+    bl_label = "Add texture samples"
+    bl_description = "Uses different samples for a texture"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    def execute(self, context):
+        data = context.scene.bake_scene
+
+        add_default_profiles(data)
+
+        profile = find_profile(data)
+
+        if profile is None:
+            self.report({'ERROR'}, "Unknown quality profile: " + data.quality_profile)
+            return {'CANCELLED'}
+
+        override = profile.overrides.add()
+        override.eevee_samples = profile.eevee_samples
+        override.cycles_samples = profile.cycles_samples
+        override.workbench_aa = profile.workbench_aa
+        return {'FINISHED'}
+
+
+class RemoveQualityOverride(bpy.types.Operator):
+    bl_idname = "bake_scene.remove_quality_override"
+    bl_label = "Remove texture samples"
+    bl_description = "Uses the profile's samples for the texture"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    index: bpy.props.IntProperty(options={'HIDDEN'})
+
+    def execute(self, context):
+        profile = find_profile(context.scene.bake_scene)
+
+        if profile is not None and self.index < len(profile.overrides):
+            profile.overrides.remove(self.index)
+
+        return {'FINISHED'}
+
+
+class AddOutputOverride(bpy.types.Operator):
+    bl_idname = "bake_scene.add_output_override"
+    bl_label = "Add texture format"
+    bl_description = "Uses a different file format for a texture"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    def execute(self, context):
+        context.scene.bake_scene.output_overrides.add()
+        return {'FINISHED'}
+
+
+class RemoveOutputOverride(bpy.types.Operator):
+    bl_idname = "bake_scene.remove_output_override"
+    bl_label = "Remove texture format"
+    bl_description = "Uses the output policy for the texture"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+
+    index: bpy.props.IntProperty(options={'HIDDEN'})
 
     def execute(self, context):
         data = context.scene.bake_scene
 
-        max_height = 0
-        max_depth = 0
+        if self.index < len(data.output_overrides):
+            data.output_overrides.remove(self.index)
+
+        return {'FINISHED'}
+
+
+# Returns the first "<prefix> <number>" which doesn't have the same file name as one of the items
+def unique_name(items, prefix):
+    names = {bpy.path.clean_name(item.name) for item in items}
+    number = 1
+
+    while bpy.path.clean_name(prefix + " " + str(number)) in names:
+        number += 1
 
-        if data.generate_height and data.camera_mode == 'TOP':
-            if data.height_mode == 'AUTO':
-                # TODO maybe it should always do this check, in order to check for out of camera bounds
-                max_height = calculate_max_height(context, data)
+    return prefix + " " + str(number)
 
-                if max_height is None:
-                    self.height_error(data)
-                    return {'FINISHED'}
 
-            elif data.height_mode == 'MANUAL':
-                max_height = data.max_height
+class AddBakeRegion(bpy.types.Operator):
+    bl_idname = "bake_scene.add_bake_region"
+    bl_label = "Add region"
+    bl_description = "Adds a region which is baked into its own textures"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
+    def execute(self, context):
+        data = context.scene.bake_scene
 
-        if data.generate_depth and data.camera_mode == 'HDRI':
-            if data.depth_mode == 'AUTO':
-                max_depth = calculate_max_depth(context)
+        name = unique_name(data.regions, "Region")
 
-            elif data.depth_mode == 'MANUAL':
-                max_depth = data.max_depth
+        region = data.regions.add()
+        region.name = name
+        region.size = data.size
+        region.resolution_x = context.scene.render.resolution_x
+        region.resolution_y = context.scene.render.resolution_y
 
+        return {'FINISHED'}
 
-        with Settings(context) as settings, Camera(context) as camera, AddEmptyMaterial(context):
-            if data.camera_mode == 'TOP':
-                camera.data.type = 'ORTHO'
-                camera.data.ortho_scale = data.size
-                camera.data.clip_end = data.camera_height * 2
-                camera.location = (0.0, 0.0, data.camera_height)
 
-            elif data.camera_mode == 'HDRI':
-                camera.data.type = 'PANO'
-                camera.data.cycles.panorama_type = 'EQUIRECTANGULAR'
-                camera.location = (0.0, 0.0, 0.0)
-                camera.rotation_euler = (radians(90.0), 0.0, 0.0)
+class RemoveBakeRegion(bpy.types.Operator):
+    bl_idname = "bake_scene.remove_bake_region"
+    bl_label = "Remove region"
+    bl_description = "Removes the region"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
-            baking = []
+    index: bpy.props.IntProperty(options={'HIDDEN'})
 
-            # This must come first, because it must bake with the user's settings
-            if data.generate_render:
-                baking.append(lambda: bakers.bake_render(data, context, settings))
+    def execute(self, context):
+        data = context.scene.bake_scene
 
-            # Geometry
-            if data.generate_alpha:
-                baking.append(lambda: bakers.bake_alpha(data, context, settings))
+        if self.index < len(data.regions):
+            data.regions.remove(self.index)
 
-            if data.generate_ao:
-                baking.append(lambda: bakers.bake_ao(data, context, settings))
+        return {'FINISHED'}
 
-            if data.generate_curvature:
-                baking.append(lambda: bakers.bake_curvature(data, context, settings))
 
-            if data.generate_height and data.camera_mode == 'TOP':
-                baking.append(lambda: bakers.bake_height(data, context, settings, max_height))
+class AddBakeProbe(bpy.types.Operator):
+    bl_idname = "bake_scene.add_bake_probe"
+    bl_label = "Add probe"
+    bl_description = "Adds a probe at the 3D cursor, an HDRI is baked at every probe"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
-            if data.generate_depth and data.camera_mode == 'HDRI':
-                baking.append(lambda: bakers.bake_depth(data, context, settings, max_depth))
+    def execute(self, context):
+        data = context.scene.bake_scene
 
-            if data.generate_normal:
-                baking.append(lambda: bakers.bake_normal(data, context, settings))
+        name = unique_name(data.probes, "Probe")
 
-            # Material
-            if data.generate_color:
-                baking.append(lambda: bakers.bake_color(data, context, settings))
+        probe = data.probes.add()
+        probe.name = name
+        probe.location = context.scene.cursor.location
 
-            if data.generate_emission:
-                baking.append(lambda: bakers.bake_emission(data, context, settings))
+        return {'FINISHED'}
 
-            if data.generate_metallic:
-                baking.append(lambda: bakers.bake_metallic(data, context, settings))
 
-            if data.generate_roughness:
-                baking.append(lambda: bakers.bake_roughness(data, context, settings))
+class RemoveBakeProbe(bpy.types.Operator):
+    bl_idname = "bake_scene.remove_bake_probe"
+    bl_label = "Remove probe"
+    bl_description = "Removes the probe"
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
-            if data.generate_vertex_color:
-                baking.append(lambda: bakers.bake_vertex_color(data, context, settings))
+    index: bpy.props.IntProperty(options={'HIDDEN'})
 
-            # Masking
-            if data.generate_material_index:
-                baking.append(lambda: bakers.bake_material_index(data, context, settings))
+    def execute(self, context):
+        data = context.scene.bake_scene
 
-            if data.generate_object_index:
-                baking.append(lambda: bakers.bake_object_index(data, context, settings))
+        if self.index < len(data.probes):
+            data.probes.remove(self.index)
 
-            if data.generate_object_random:
-                baking.append(lambda: bakers.bake_object_random(data, context, settings))
+        return {'FINISHED'}
 
-            # Hair
-            if data.generate_hair_random:
-                baking.append(lambda: bakers.bake_hair_random(data, context, settings))
 
-            if data.generate_hair_root:
-                baking.append(lambda: bakers.bake_hair_root(data, context, settings))
+class Bake(bpy.types.Operator):
+    bl_idname = "bake_scene.bake"
+    bl_label = "Bake"
+    bl_description = "Bake scene"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        data = context.scene.bake_scene
+        progress = WindowProgress(context.window_manager)
 
-            # Bake all the textures
-            context.window_manager.progress_begin(0, len(baking))
-            context.window_manager.progress_update(0)
+        start = time.time()
 
-            start = time.time()
+        try:
+            if data.use_workers:
+                workers.bake_workers(context, data, enabled_passes(data), progress)
+            else:
+                bake(context, data, progress=progress)
 
-            for (index, f) in enumerate(baking, start=1):
-                f()
-                context.window_manager.progress_update(index)
+        except BakeError as e:
+            self.report({'ERROR'}, str(e))
+            return {'FINISHED'}
 
-            context.window_manager.progress_end()
+        for skipped in progress.skipped:
+            self.report({'WARNING'}, "Skipped " + skipped)
 
-            duration = time.time() - start
-            self.report({'INFO'}, "Finished baking all textures (" + str(round(duration, 2)) + " seconds)")
+        duration = time.time() - start
+        self.report({'INFO'}, "Finished baking all textures (" + str(round(duration, 2)) + " seconds)")
 
         return {'FINISHED'}
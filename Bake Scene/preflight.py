@@ -0,0 +1,179 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Checks the objects and materials before rendering, to find passes which would render a completely black image
+# or a single color.
+#
+# These checks must never be wrong, so if something can't be checked (for example a linked node) then it is
+# assumed that the pass isn't black.
+
+from .crop import (covers_frame)
+from .extract import (bake_objects)
+from .utils import (renderable_objects, render_state)
+
+
+GEOMETRY_TYPES = ('MESH', 'CURVE', 'SURFACE', 'META', 'FONT')
+
+# Objects which are never rendered, so they can't make a texture non-black
+INVISIBLE_TYPES = ('EMPTY', 'CAMERA', 'LIGHT', 'LIGHT_PROBE', 'SPEAKER', 'ARMATURE', 'LATTICE')
+
+# The Principled BSDF input which is used by each pass
+MATERIAL_INPUTS = {
+    "color": "Base Color",
+    "emission": "Emission",
+    "metallic": "Metallic",
+    "roughness": "Roughness",
+}
+
+
+# Instanced objects aren't checked, so they might not be black.
+# Geometry nodes can create instances, and change the materials and attributes.
+def has_instances(obj):
+    if obj.instance_type != 'NONE':
+        return True
+
+    if any(modifier.type == 'NODES' for modifier in obj.modifiers):
+        return True
+
+    for system in obj.particle_systems:
+        if system.settings.render_type in ('OBJECT', 'COLLECTION'):
+            return True
+
+    return False
+
+
+def has_hair(context):
+    for obj in renderable_objects(context.view_layer.layer_collection):
+        if obj.type == 'CURVES':
+            return True
+
+        for system in obj.particle_systems:
+            if system.settings.type == 'HAIR':
+                return True
+
+    return False
+
+
+def has_vertex_colors(context, data):
+    depsgraph = context.evaluated_depsgraph_get()
+
+    for obj in bake_objects(context, data):
+        if has_instances(obj):
+            return True
+
+        elif obj.type == 'MESH':
+            mesh = obj.evaluated_get(depsgraph).data
+
+            if len(getattr(mesh, "color_attributes", mesh.vertex_colors)) > 0:
+                return True
+
+    return False
+
+
+# Returns the (R, G, B, A) color of the Principled BSDF input, or None if it isn't a constant.
+#
+# This must match how ReplaceMaterials connects the Principled BSDF to the bake node group
+def input_color(material, name):
+    if material is None or material.node_tree is None:
+        return None
+
+    for node in material.node_tree.nodes:
+        if node.type == 'OUTPUT_MATERIAL' and node.is_active_output:
+            for link in node.inputs["Surface"].links:
+                if link.from_node.type == 'BSDF_PRINCIPLED':
+                    socket = link.from_node.inputs[name]
+
+                    if socket.is_linked:
+                        return None
+
+                    value = socket.default_value
+
+                    if isinstance(value, float):
+                        return (value, value, value, 1.0)
+                    else:
+                        return (value[0], value[1], value[2], 1.0)
+
+    return None
+
+
+# Returns the color of the input if it is the same constant in every material, otherwise None
+def material_input_color(context, data, name):
+    color = None
+
+    for obj in bake_objects(context, data):
+        if has_instances(obj):
+            return None
+
+        if obj.type in INVISIBLE_TYPES:
+            continue
+
+        # Other objects (like hair curves, volumes and point clouds) can't be checked
+        if obj.type not in GEOMETRY_TYPES:
+            return None
+
+        # Empty slots use a placeholder material which can't be checked
+        if len(obj.material_slots) == 0:
+            return None
+
+        for slot in obj.material_slots:
+            value = input_color(slot.material, name)
+
+            if value is None or (color is not None and value != color):
+                return None
+
+            color = value
+
+    return color
+
+
+def is_black(color):
+    return color is not None and all(x == 0.0 for x in color[:3])
+
+
+# Returns the reason why the pass is completely black, or None if it might not be black.
+#
+# The background of these passes is black, so the texture is black if every object is black.
+def black_reason(context, data, name):
+    if name in ("hair_random", "hair_root"):
+        if not has_hair(context):
+            return "there is no hair"
+
+    elif name == "vertex_color":
+        if not has_vertex_colors(context, data):
+            return "there are no color attributes"
+
+    elif name in MATERIAL_INPUTS:
+        if is_black(material_input_color(context, data, MATERIAL_INPUTS[name])):
+            return "every material's " + MATERIAL_INPUTS[name] + " is black"
+
+    return None
+
+
+# Returns the color of the pass if every material has the same unconnected input, or None if it might not be a single color.
+#
+# The background is black, so the objects must cover the whole frame. The coverage can't be checked for atlases
+# and HDRIs, so they only use black_reason.
+def constant_color(context, data, name):
+    if name not in MATERIAL_INPUTS or data.camera_mode != 'TOP' or render_state["atlas"] is not None:
+        return None
+
+    color = material_input_color(context, data, MATERIAL_INPUTS[name])
+
+    if color is None or not covers_frame(context):
+        return None
+
+    return color
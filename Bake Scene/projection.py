@@ -0,0 +1,286 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Bakes HDRIs as six 90° cubemap faces instead of a single equirectangular panorama.
+#
+# An equirectangular panorama has far too many pixels near the poles, the cubemap faces have almost the same density
+# everywhere so they need fewer samples. Each face is rendered separately, and then the faces are saved as a
+# horizontal strip (+X, -X, +Y, -Y, +Z, -Z) or reprojected into an octahedral map. The faces can also be reprojected
+# into an equirectangular image, for tools which need it.
+
+import os
+import numpy
+from math import (pi)
+from mathutils import (Matrix)
+
+from .utils import (frame_size, render_converged, save_pixels, render_state)
+
+
+# The (name, forward, right, up) of each face, in world space
+CUBE_FACES = (
+    ("px", (1.0, 0.0, 0.0), (0.0, -1.0, 0.0), (0.0, 0.0, 1.0)),
+    ("nx", (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+    ("py", (0.0, 1.0, 0.0), (1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    ("ny", (0.0, -1.0, 0.0), (-1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    ("pz", (0.0, 0.0, 1.0), (1.0, 0.0, 0.0), (0.0, -1.0, 0.0)),
+    ("nz", (0.0, 0.0, -1.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0)),
+)
+
+# The reprojections are done in chunks of rows, to limit the memory usage
+CHUNK_ROWS = 256
+
+# The (forward, right, up) of the equirectangular camera in HDRI mode, the forward direction is in the center of the image
+EQUIRECT_AXES = ((0.0, 1.0, 0.0), (1.0, 0.0, 0.0), (0.0, 0.0, 1.0))
+
+
+def equirect_path(path):
+    (root, extension) = os.path.splitext(path)
+    return root + "_equirect" + extension
+
+
+# The faces are a quarter of the panorama's width, so the horizon has the same number of pixels
+def face_size(context):
+    return max(frame_size(context)[0] // 4, 1)
+
+
+# Size of the output image (width, height)
+def projection_size(data, size):
+    if data.hdri_projection == 'CUBEMAP':
+        return (size * 6, size)
+
+    elif data.hdri_projection == 'OCTAHEDRAL':
+        return (size * 2, size * 2)
+
+
+# Converts the pixel centers of an image into (u, v) coordinates between 0 and 1, the first row is the bottom
+def pixel_centers(width, height, start, stop):
+    u = (numpy.arange(width, dtype=numpy.float32) + 0.5) / width
+    v = (numpy.arange(start, stop, dtype=numpy.float32) + 0.5) / height
+    return numpy.meshgrid(u, v)
+
+
+# Directions of an equirectangular image, this is the same mapping as the panorama which is rendered in HDRI mode
+def equirect_directions(width, height, start, stop):
+    (u, v) = pixel_centers(width, height, start, stop)
+
+    longitude = (u - 0.5) * 2.0 * pi
+    latitude = (v - 0.5) * pi
+
+    (forward, right, up) = (numpy.array(axis, dtype=numpy.float32) for axis in EQUIRECT_AXES)
+
+    return (
+        (numpy.cos(longitude) * numpy.cos(latitude))[..., None] * forward +
+        (numpy.sin(longitude) * numpy.cos(latitude))[..., None] * right +
+        numpy.sin(latitude)[..., None] * up
+    )
+
+
+# Directions of an octahedral image, the upper hemisphere is in the middle and the lower hemisphere is in the corners
+def octahedral_directions(size, start, stop):
+    (u, v) = pixel_centers(size, size, start, stop)
+
+    x = u * 2.0 - 1.0
+    y = v * 2.0 - 1.0
+    z = 1.0 - numpy.abs(x) - numpy.abs(y)
+
+    lower = z < 0.0
+    folded_x = (1.0 - numpy.abs(y)) * numpy.sign(x)
+    folded_y = (1.0 - numpy.abs(x)) * numpy.sign(y)
+
+    x = numpy.where(lower, folded_x, x)
+    y = numpy.where(lower, folded_y, y)
+
+    directions = numpy.stack([x, y, z], axis=-1)
+    return directions / numpy.linalg.norm(directions, axis=-1, keepdims=True)
+
+
+# Looks up the color of each direction in the cubemap faces, with bilinear filtering
+def sample_cube(faces, directions):
+    size = faces[0].shape[0]
+
+    axes = numpy.array([face[1] for face in CUBE_FACES], dtype=numpy.float32)
+    rights = numpy.array([face[2] for face in CUBE_FACES], dtype=numpy.float32)
+    ups = numpy.array([face[3] for face in CUBE_FACES], dtype=numpy.float32)
+
+    # The face which is the most aligned with the direction
+    index = numpy.argmax(directions @ axes.T, axis=-1)
+
+    forward = numpy.sum(directions * axes[index], axis=-1)
+    u = numpy.sum(directions * rights[index], axis=-1) / forward
+    v = numpy.sum(directions * ups[index], axis=-1) / forward
+
+    x = numpy.clip((u + 1.0) * 0.5 * size - 0.5, 0.0, size - 1)
+    y = numpy.clip((v + 1.0) * 0.5 * size - 0.5, 0.0, size - 1)
+
+    x0 = numpy.floor(x).astype(numpy.int32)
+    y0 = numpy.floor(y).astype(numpy.int32)
+    x1 = numpy.minimum(x0 + 1, size - 1)
+    y1 = numpy.minimum(y0 + 1, size - 1)
+
+    fx = (x - x0)[..., None]
+    fy = (y - y0)[..., None]
+
+    stacked = numpy.stack(faces)
+
+    top = stacked[index, y0, x0] * (1.0 - fx) + stacked[index, y0, x1] * fx
+    bottom = stacked[index, y1, x0] * (1.0 - fx) + stacked[index, y1, x1] * fx
+
+    return (top * (1.0 - fy) + bottom * fy).astype(numpy.float32)
+
+
+def reproject(faces, width, height, directions):
+    pixels = numpy.empty((height, width, faces[0].shape[2]), dtype=numpy.float32)
+
+    for start in range(0, height, CHUNK_ROWS):
+        stop = min(start + CHUNK_ROWS, height)
+        pixels[start:stop] = sample_cube(faces, directions(start, stop))
+
+    return pixels
+
+
+def equirect(faces, width, height):
+    return reproject(faces, width, height, lambda start, stop: equirect_directions(width, height, start, stop))
+
+
+def octahedral(faces, size):
+    return reproject(faces, size, size, lambda start, stop: octahedral_directions(size, start, stop))
+
+
+# Points the camera at a cubemap face
+class Face:
+    def __init__(self, context, face, size):
+        self.scene = context.scene
+        self.face = face
+        self.size = size
+        self.saved = None
+
+    def __enter__(self):
+        render = self.scene.render
+        camera = self.scene.camera
+
+        (_, forward, right, up) = self.face
+
+        self.saved = {
+            "resolution_x": render.resolution_x,
+            "resolution_y": render.resolution_y,
+            "resolution_percentage": render.resolution_percentage,
+            "rotation": camera.rotation_euler.copy(),
+            "type": camera.data.type,
+            "sensor_fit": camera.data.sensor_fit,
+            "lens_unit": camera.data.lens_unit,
+            "angle": camera.data.angle,
+        }
+
+        # The camera looks along -Z, with +Y as the up direction
+        camera.rotation_euler = Matrix((right, up, [-x for x in forward])).transposed().to_euler()
+        camera.data.type = 'PERSP'
+        camera.data.sensor_fit = 'AUTO'
+        camera.data.lens_unit = 'FOV'
+        camera.data.angle = pi / 2.0
+
+        render.resolution_x = self.size
+        render.resolution_y = self.size
+        render.resolution_percentage = 100
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        render = self.scene.render
+        camera = self.scene.camera
+
+        render.resolution_x = self.saved["resolution_x"]
+        render.resolution_y = self.saved["resolution_y"]
+        render.resolution_percentage = self.saved["resolution_percentage"]
+        camera.rotation_euler = self.saved["rotation"]
+        camera.data.type = self.saved["type"]
+        camera.data.sensor_fit = self.saved["sensor_fit"]
+        camera.data.lens_unit = self.saved["lens_unit"]
+        camera.data.angle = self.saved["angle"]
+
+        return False
+
+
+class Projection:
+    def __init__(self, context, data):
+        self.context = context
+        self.data = data
+        self.faces = None
+        self.active = False
+        self.saved = None
+
+    # Renders every face and returns the output pixels, this is called by render
+    def render(self, data, context):
+        size = face_size(context)
+        (width, height) = projection_size(data, size)
+
+        if render_state["constant"] is not None:
+            self.faces = None
+            return numpy.full((height, width, 4), render_state["constant"], dtype=numpy.float32)
+
+        self.faces = []
+
+        # Each face is a separate render, so adaptive sampling and denoising work on each face
+        for face in CUBE_FACES:
+            with Face(context, face, size):
+                self.faces.append(render_converged(data, context))
+
+        if data.hdri_projection == 'CUBEMAP':
+            return numpy.concatenate(self.faces, axis=1)
+
+        elif data.hdri_projection == 'OCTAHEDRAL':
+            return octahedral(self.faces, width)
+
+    # Saves the faces of the last render as an equirectangular image, it has the same size as the scene's resolution
+    def write_equirect(self, context, path, unchanged):
+        target = equirect_path(path)
+
+        if unchanged and os.path.exists(target):
+            return [target]
+
+        (width, height) = frame_size(context)
+
+        if self.faces is None:
+            pixels = numpy.full((height, width, 4), render_state["constant"], dtype=numpy.float32)
+        else:
+            pixels = equirect(self.faces, width, height)
+
+        (root, extension) = os.path.splitext(target)
+        partial = root + ".partial" + extension
+
+        save_pixels(context, pixels, partial)
+        os.replace(partial, target)
+
+        return [target]
+
+    def __enter__(self):
+        if self.data.camera_mode != 'HDRI' or self.data.hdri_projection == 'EQUIRECTANGULAR':
+            return self
+
+        self.active = True
+        self.saved = render_state["projection"]
+        render_state["projection"] = self
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.active:
+            render_state["projection"] = self.saved
+            self.active = False
+
+        self.faces = None
+
+        return False
@@ -16,7 +16,12 @@
 # along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
 
 import bpy
-from bpy.props import (IntProperty, FloatProperty, PointerProperty, EnumProperty, BoolProperty)
+from bpy.props import (IntProperty, FloatProperty, FloatVectorProperty, PointerProperty, EnumProperty, BoolProperty, StringProperty, CollectionProperty)
+
+from .baking import (PASSES)
+from .quality import (DEFAULT_PROFILES, DEFAULT_PROFILE)
+from .formats import (COLOR_DEPTHS)
+from .watch import (update_watch)
 
 
 # This causes the gizmo to update when the property is changed
@@ -24,6 +29,259 @@ def update_noop(self, context):
     pass
 
 
+WORKBENCH_AA = (
+    ('OFF', "No Anti-Aliasing", "Scene will be rendering without any anti-aliasing"),
+    ('FXAA', "Single Pass Anti-Aliasing", "Scene will be rendered using a single pass anti-aliasing method (FXAA)"),
+    ('5', "5 Samples", "Scene will be rendered using 5 anti-aliasing samples"),
+    ('8', "8 Samples", "Scene will be rendered using 8 anti-aliasing samples"),
+    ('11', "11 Samples", "Scene will be rendered using 11 anti-aliasing samples"),
+    ('16', "16 Samples", "Scene will be rendered using 16 anti-aliasing samples"),
+    ('32', "32 Samples", "Scene will be rendered using 32 anti-aliasing samples"),
+)
+
+
+class QualityOverride(bpy.types.PropertyGroup):
+    texture: EnumProperty(
+        name="Texture",
+        description="Texture which uses these samples instead of the profile's samples",
+        options=set(),
+        items=[(name, name.replace("_", " ").title(), "") for name in PASSES],
+    )
+
+    eevee_samples: IntProperty(
+        name="EEVEE Samples",
+        description="Number of anti-aliasing samples when rendering with EEVEE",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["eevee_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    cycles_samples: IntProperty(
+        name="Cycles Samples",
+        description="Number of samples when rendering with Cycles",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["cycles_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    workbench_aa: EnumProperty(
+        name="Workbench Samples",
+        description="Anti-aliasing when rendering with Workbench",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["workbench_aa"],
+        options=set(),
+        items=WORKBENCH_AA,
+    )
+
+
+class OutputOverride(bpy.types.PropertyGroup):
+    texture: EnumProperty(
+        name="Texture",
+        description="Texture which uses this format instead of the output policy",
+        options=set(),
+        items=[(name, name.replace("_", " ").title(), "") for name in PASSES],
+    )
+
+    file_format: EnumProperty(
+        name="File Format",
+        description="File format which is used to save the texture",
+        default='PNG',
+        options=set(),
+        items=(
+            ('PNG', "PNG", "Lossless compressed 8 or 16 bit image"),
+            ('TIFF', "TIFF", "Lossless 8 or 16 bit image"),
+            ('OPEN_EXR', "OpenEXR", "Lossless 16 or 32 bit float image"),
+        ),
+    )
+
+    color_depth: EnumProperty(
+        name="Color Depth",
+        description="Bit depth per channel (it uses the closest depth which is supported by the file format)",
+        default='8',
+        options=set(),
+        items=[(depth, depth, "") for depth in sorted({depth for depths in COLOR_DEPTHS.values() for depth in depths}, key=int)],
+    )
+
+    compression: IntProperty(
+        name="Compression",
+        description="Amount of compression, higher values are smaller but slower to save (OpenEXR and TIFF are uncompressed when this is 0)",
+        default=15,
+        min=0,
+        max=100,
+        subtype='PERCENTAGE',
+        options=set(),
+    )
+
+
+class BakeRegion(bpy.types.PropertyGroup):
+    use: BoolProperty(
+        name="Enabled",
+        description="Bake this region",
+        default=True,
+        options=set(),
+    )
+
+    center: FloatVectorProperty(
+        name="Center",
+        description="Center of the region",
+        size=2,
+        default=(0.0, 0.0),
+        subtype='XYZ',
+        unit='LENGTH',
+        options=set(),
+    )
+
+    size: FloatProperty(
+        name="Size",
+        description="Width / height of the region",
+        default=2,
+        min=0,
+        step=1,
+        precision=5,
+        subtype='DISTANCE',
+        unit='LENGTH',
+        options=set(),
+    )
+
+    resolution_x: IntProperty(
+        name="Resolution X",
+        description="Number of horizontal pixels in the textures of the region",
+        default=1024,
+        min=4,
+        subtype='PIXEL',
+        options=set(),
+    )
+
+    resolution_y: IntProperty(
+        name="Resolution Y",
+        description="Number of vertical pixels in the textures of the region",
+        default=1024,
+        min=4,
+        subtype='PIXEL',
+        options=set(),
+    )
+
+
+class BakeProbe(bpy.types.PropertyGroup):
+    use: BoolProperty(
+        name="Enabled",
+        description="Bake this probe",
+        default=True,
+        options=set(),
+    )
+
+    location: FloatVectorProperty(
+        name="Location",
+        description="Position of the probe, the HDRI is rendered from here",
+        size=3,
+        default=(0.0, 0.0, 0.0),
+        subtype='TRANSLATION',
+        unit='LENGTH',
+        options=set(),
+    )
+
+
+class QualityProfile(bpy.types.PropertyGroup):
+    resolution_scale: IntProperty(
+        name="Resolution Scale",
+        description="Percentage of the output resolution which is baked",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["resolution_scale"],
+        min=1,
+        max=100,
+        step=1,
+        subtype='PERCENTAGE',
+        options=set(),
+    )
+
+    eevee_samples: IntProperty(
+        name="EEVEE Samples",
+        description="Number of anti-aliasing samples when rendering with EEVEE",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["eevee_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    cycles_samples: IntProperty(
+        name="Cycles Samples",
+        description="Number of samples when rendering with Cycles",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["cycles_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    workbench_aa: EnumProperty(
+        name="Workbench Samples",
+        description="Anti-aliasing when rendering with Workbench",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["workbench_aa"],
+        options=set(),
+        items=WORKBENCH_AA,
+    )
+
+    ao_samples: IntProperty(
+        name="AO Samples",
+        description="Number of samples for the Ambient Occlusion texture (Flat mode)",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["ao_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    cycles_ao_samples: IntProperty(
+        name="HDRI AO Samples",
+        description="Number of samples for the Ambient Occlusion texture (HDRI mode)",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["cycles_ao_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    use_adaptive: BoolProperty(
+        name="Adaptive Sampling",
+        description="Render with more and more samples until the texture stops changing, the samples above are the maximum",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["use_adaptive"],
+        options=set(),
+    )
+
+    adaptive_threshold: FloatProperty(
+        name="Noise Threshold",
+        description="Stops when almost every pixel changes by less than this between renders, lower values are less noisy",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["adaptive_threshold"],
+        min=0.0001,
+        soft_max=0.1,
+        step=0.1,
+        precision=4,
+        options=set(),
+    )
+
+    adaptive_min_samples: IntProperty(
+        name="Min Samples",
+        description="Number of samples for the first render",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["adaptive_min_samples"],
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    use_denoising: BoolProperty(
+        name="Denoise",
+        description="Denoise the Render, AO, and Emission textures with OpenImageDenoise when baking with Cycles, this allows for much lower samples",
+        default=DEFAULT_PROFILES[DEFAULT_PROFILE]["use_denoising"],
+        options=set(),
+    )
+
+    overrides: CollectionProperty(type=QualityOverride)
+
+
 class Scene(bpy.types.PropertyGroup):
     # TODO deprecate and remove these
     collection: PointerProperty(type=bpy.types.Collection)
@@ -39,6 +297,42 @@ class Scene(bpy.types.PropertyGroup):
                ('HDRI', "HDRI", "Bakes the entire scene as an equirectangular HDRI"))
     )
 
+    hdri_projection: EnumProperty(
+        name="Projection",
+        description="How the HDRI is rendered and saved",
+        default='EQUIRECTANGULAR',
+        options=set(),
+        items=(('EQUIRECTANGULAR', "Equirectangular", "Renders a single equirectangular panorama"),
+               ('CUBEMAP', "Cubemap", "Renders six 90° faces and saves them as a horizontal strip (+X, -X, +Y, -Y, +Z, -Z), each face is a quarter of the resolution width"),
+               ('OCTAHEDRAL', "Octahedral", "Renders six 90° faces and reprojects them into a square octahedral map, which is half of the resolution width"))
+    )
+
+    use_probes: BoolProperty(
+        name="Probes",
+        description="Bake an HDRI at every enabled probe instead of at the origin, the textures of each probe start with the name of the probe",
+        default=False,
+        options=set(),
+    )
+
+    probes: CollectionProperty(
+        type=BakeProbe,
+        options=set(),
+    )
+
+    probe_collection: PointerProperty(
+        name="Probe Collection",
+        description="Every empty in this collection is also a probe",
+        type=bpy.types.Collection,
+        options=set(),
+    )
+
+    use_hdri_equirect: BoolProperty(
+        name="Equirectangular Copy",
+        description="Also reprojects the cubemap faces into an equirectangular image with the scene's resolution, it is saved with an _equirect suffix",
+        default=False,
+        options=set(),
+    )
+
     camera_height: FloatProperty(
         name="Camera Height",
         description="Height of the camera",
@@ -62,6 +356,323 @@ class Scene(bpy.types.PropertyGroup):
         update=update_noop,
     )
 
+    use_regions: BoolProperty(
+        name="Regions",
+        description="Bake every enabled region instead of the whole scene, each region has its own center, size and resolution",
+        default=False,
+        options=set(),
+    )
+
+    regions: CollectionProperty(
+        type=BakeRegion,
+        options=set(),
+    )
+
+    use_frame_range: BoolProperty(
+        name="Frame Range",
+        description="Bake every frame of the scene's frame range, the frame number is added to the end of the file names",
+        default=False,
+        options=set(),
+    )
+
+    use_flipbook: BoolProperty(
+        name="Flipbook",
+        description="Also combine the frames into a single flipbook texture, the first frame is in the top left corner",
+        default=False,
+        options=set(),
+    )
+
+    flipbook_columns: IntProperty(
+        name="Columns",
+        description="Number of frames in each row of the flipbook (0 makes the flipbook as square as possible)",
+        default=0,
+        min=0,
+        options=set(),
+    )
+
+    tile_mode: EnumProperty(
+        name="Tiles",
+        description="Split large textures into smaller tiles, in order to reduce memory usage",
+        default='OFF',
+        options=set(),
+        items=(('OFF', "Off", "Render the entire texture at once"),
+               ('MANUAL', "Manual", "Render tiles with a fixed size"),
+               ('AUTO', "Auto", "Calculate the tile size based on the memory budget"))
+    )
+
+    tile_size: IntProperty(
+        name="Tile Size",
+        description="Width / height of each tile (including the padding)",
+        default=4096,
+        min=64,
+        step=1,
+        subtype='PIXEL',
+        options=set(),
+    )
+
+    tile_memory: IntProperty(
+        name="Memory",
+        description="Maximum amount of memory (in MB) which is used to render each tile",
+        default=2048,
+        min=64,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    tile_padding: IntProperty(
+        name="Padding",
+        description="Extra pixels which are rendered around each tile, this prevents seams in the AO and curvature textures",
+        default=16,
+        min=4,
+        step=1,
+        subtype='PIXEL',
+        options=set(),
+    )
+
+    use_workers: BoolProperty(
+        name="Background Workers",
+        description="Bake the textures in parallel, using multiple background Blender processes",
+        default=False,
+        options=set(),
+    )
+
+    worker_count: IntProperty(
+        name="Workers",
+        description="Number of background Blender processes",
+        default=2,
+        min=1,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    worker_threads: IntProperty(
+        name="Threads",
+        description="Number of render threads for each worker (0 splits the CPU cores evenly between the workers)",
+        default=0,
+        min=0,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    use_worker_extract: BoolProperty(
+        name="Minimal Files",
+        description="The workers load a stripped .blend file which only contains the objects inside of the baking region, this makes loading faster and uses less memory",
+        default=True,
+        options=set(),
+    )
+
+    preflight_mode: EnumProperty(
+        name="Black Textures",
+        description="What to do with textures which are detected as completely black before rendering (for example Hair Random when there is no hair)",
+        default='OFF',
+        options=set(),
+        items=(
+            ('OFF', "Render", "Always render the textures"),
+            ('WRITE', "Write", "Write a black texture without rendering"),
+            ('SKIP', "Skip", "Don't write the texture"),
+        ),
+    )
+
+    use_crop: BoolProperty(
+        name="Crop to Content",
+        description="Only render the part of the frame which contains objects, and save its position in crop.json (useful for decals)",
+        default=False,
+        options=set(),
+    )
+
+    crop_padding: IntProperty(
+        name="Padding",
+        description="Number of extra pixels around the objects when cropping",
+        default=8,
+        min=0,
+        subtype='PIXEL',
+        options=set(),
+    )
+
+    use_atlas: BoolProperty(
+        name="Decal Atlas",
+        description="Bake every child collection of the atlas collection as a separate decal, and pack the decals into a single texture (the placement is saved in atlas.json)",
+        default=False,
+        options=set(),
+    )
+
+    atlas_collection: PointerProperty(
+        name="Atlas Collection",
+        description="Each child collection of this collection is a decal",
+        type=bpy.types.Collection,
+        options=set(),
+    )
+
+    atlas_padding: IntProperty(
+        name="Atlas Padding",
+        description="Number of empty pixels between the decals in the atlas",
+        default=4,
+        min=0,
+        subtype='PIXEL',
+        options=set(),
+    )
+
+    use_output_checks: BoolProperty(
+        name="Check Outputs",
+        description="Check the rendered textures before writing them: textures which only contain a single color are written without copying the pixels, and textures which haven't changed since the last bake aren't written again",
+        default=False,
+        options=set(),
+    )
+
+    use_cache: BoolProperty(
+        name="Cache",
+        description="Skip baking the textures which haven't changed since the last bake, and copy them from the cache instead",
+        default=False,
+        options=set(),
+    )
+
+    cache_directory: StringProperty(
+        name="Cache Folder",
+        description="Folder where the cached textures are stored (empty uses the system temporary folder)",
+        default="",
+        subtype='DIR_PATH',
+        options=set(),
+    )
+
+    cache_size: IntProperty(
+        name="Cache Size",
+        description="Maximum size of the cache (in MB), the least recently used textures are deleted when the cache is full",
+        default=4096,
+        min=16,
+        step=1,
+        subtype='UNSIGNED',
+        options=set(),
+    )
+
+    use_partial_rebake: BoolProperty(
+        name="Partial Re-bake",
+        description="Only re-render the part of the textures which contains objects that have changed since the last bake",
+        default=False,
+        options=set(),
+    )
+
+    use_watch: BoolProperty(
+        name="Watch",
+        description="Automatically re-bake the affected textures in the background when the scene is changed",
+        default=False,
+        options=set(),
+        update=update_watch,
+    )
+
+    watch_delay: FloatProperty(
+        name="Delay",
+        description="How long (in seconds) to wait after the last change before re-baking",
+        default=1.0,
+        min=0.1,
+        soft_max=10.0,
+        step=10,
+        precision=1,
+        options=set(),
+    )
+
+    watch_quality: StringProperty(
+        name="Quality",
+        description="Quality profile which is used by Watch, use the Bake button to bake with the normal quality",
+        default="preview",
+        options=set(),
+    )
+
+    quality_profiles: CollectionProperty(type=QualityProfile)
+
+    quality_profile: StringProperty(
+        name="Quality",
+        description="Quality profile which is used for baking",
+        default=DEFAULT_PROFILE,
+        options=set(),
+    )
+
+    output_policy: EnumProperty(
+        name="Output Formats",
+        description="Which file format and bit depth is used for each texture",
+        default='USER',
+        options=set(),
+        items=(
+            ('USER', "Output Settings", "Every texture uses the output settings of the scene"),
+            ('AUTO', "Auto", "Masks are saved as 8 bit PNG, height, depth and normal are saved as 16 bit PNG, and Render uses the output settings"),
+        ),
+    )
+
+    output_overrides: CollectionProperty(
+        type=OutputOverride,
+        options=set(),
+    )
+
+    resolution_levels: IntProperty(
+        name="Extra Resolutions",
+        description="Number of lower resolutions which are created from each texture, each resolution is half the size of the previous resolution",
+        default=0,
+        min=0,
+        max=8,
+        options=set(),
+    )
+
+    downsample_filter: EnumProperty(
+        name="Filter",
+        description="Filter which is used to create the lower resolutions of color textures (normal and index textures always use their own filter)",
+        default='BOX',
+        options=set(),
+        items=(
+            ('BOX', "Box", "Average of each 2x2 block, fast and never creates halos"),
+            ('LANCZOS', "Lanczos", "Sharper, but it can create halos near hard edges"),
+        ),
+    )
+
+    use_dds: BoolProperty(
+        name="DDS",
+        description="Also save the textures as block compressed DDS files with mipmaps (normal uses BC5, masks use BC4, index textures are not saved)",
+        default=False,
+        options=set(),
+    )
+
+    dds_color_codec: EnumProperty(
+        name="Color Codec",
+        description="Block compression which is used for color textures",
+        default='BC7',
+        options=set(),
+        items=(
+            ('BC7', "BC7", "High quality RGBA, 1 byte per pixel"),
+            ('BC1', "BC1", "Lower quality RGB without alpha, half a byte per pixel"),
+        ),
+    )
+
+    use_multilayer: BoolProperty(
+        name="Multilayer EXR",
+        description="Combine all of the textures into a single multilayer EXR file (layers.exr), each texture is a separate layer",
+        default=False,
+        options=set(),
+    )
+
+    multilayer_codec: EnumProperty(
+        name="Codec",
+        description="Lossless compression which is used for the multilayer EXR file",
+        default='ZIP',
+        options=set(),
+        items=(
+            ('NONE', "None", "No compression, fastest to save but the file is large"),
+            ('ZIPS', "ZIPS", "Zip compression of single scanlines"),
+            ('ZIP', "ZIP", "Zip compression of 16 scanlines, usually the smallest"),
+        ),
+    )
+
+    multilayer_depth: EnumProperty(
+        name="Color Depth",
+        description="Bit depth per channel of the multilayer EXR file",
+        default='32',
+        options=set(),
+        items=(
+            ('16', "Half", "16 bit half float"),
+            ('32', "Full", "32 bit float"),
+        ),
+    )
+
     show_size: BoolProperty(
         name="Show Size",
         description="Whether the size is visible or not",
@@ -0,0 +1,118 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Quality profiles control how many samples are used for each texture.
+#
+# The profiles are stored in the scene, but if a profile doesn't exist in the scene then the default
+# profile with the same name is used, so old .blend files keep working.
+
+
+# The "final" profile matches the sample counts which were used before profiles existed
+DEFAULT_PROFILES = {
+    "preview": {
+        "resolution_scale": 25,
+        "eevee_samples": 8,
+        "cycles_samples": 4,
+        "workbench_aa": '5',
+        "ao_samples": 16,
+        "cycles_ao_samples": 4,
+        "use_adaptive": False,
+        "adaptive_threshold": 0.01,
+        "adaptive_min_samples": 8,
+        "use_denoising": False,
+    },
+    "draft": {
+        "resolution_scale": 50,
+        "eevee_samples": 32,
+        "cycles_samples": 16,
+        "workbench_aa": '8',
+        "ao_samples": 32,
+        "cycles_ao_samples": 8,
+        "use_adaptive": False,
+        "adaptive_threshold": 0.01,
+        "adaptive_min_samples": 8,
+        "use_denoising": False,
+    },
+    "final": {
+        "resolution_scale": 100,
+        "eevee_samples": 128,
+        "cycles_samples": 32,
+        "workbench_aa": '32',
+        "ao_samples": 128,
+        "cycles_ao_samples": 16,
+        "use_adaptive": False,
+        "adaptive_threshold": 0.01,
+        "adaptive_min_samples": 8,
+        "use_denoising": False,
+    },
+}
+
+DEFAULT_PROFILE = "final"
+
+
+def find_profile(data, name=None):
+    if name is None:
+        name = data.quality_profile
+
+    return data.quality_profiles.get(name)
+
+
+# Whether the profile exists in the scene or is one of the default profiles
+def is_profile(data, name):
+    return find_profile(data, name) is not None or name in DEFAULT_PROFILES
+
+
+# Returns a setting from the current profile
+def profile_value(data, key):
+    profile = find_profile(data)
+
+    if profile is None:
+        return DEFAULT_PROFILES.get(data.quality_profile, DEFAULT_PROFILES[DEFAULT_PROFILE])[key]
+    else:
+        return getattr(profile, key)
+
+
+# Returns the (EEVEE, Cycles, Workbench) samples for the pass
+def pass_samples(data, name):
+    profile = find_profile(data)
+
+    if profile is not None:
+        for override in profile.overrides:
+            if override.texture == name:
+                return (override.eevee_samples, override.cycles_samples, override.workbench_aa)
+
+    return (
+        profile_value(data, "eevee_samples"),
+        profile_value(data, "cycles_samples"),
+        profile_value(data, "workbench_aa"),
+    )
+
+
+def add_profile(data, name, values):
+    profile = data.quality_profiles.add()
+    profile.name = name
+
+    for (key, value) in values.items():
+        setattr(profile, key, value)
+
+    return profile
+
+
+def add_default_profiles(data):
+    for (name, values) in DEFAULT_PROFILES.items():
+        if name not in data.quality_profiles:
+            add_profile(data, name, values)
@@ -0,0 +1,187 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# The manifest is stored next to the textures, it records the hash and bounds of every object when the pass was baked.
+# When baking again it compares the hashes, and only the part of the texture which contains the changed objects is rendered.
+#
+# It also records how many samples were used for each pass, which is useful with adaptive sampling,
+# and the digest and constant color of every output file, which are used by Check Outputs.
+
+import os
+import json
+from math import (floor, ceil)
+
+from .utils import (frame_size, pixel_size, tile_padding)
+
+
+MANIFEST_VERSION = 1
+
+# If more than this much of the texture has changed, then it renders the whole texture instead
+MAX_PARTIAL_AREA = 0.5
+
+
+def manifest_path(prefix):
+    return prefix + "manifest.json"
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    except (OSError, ValueError):
+        return {}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+
+    return manifest.get("passes", {})
+
+
+# Converts world space bounds into a pixel rectangle, which is clamped to the frame
+def pixel_rect(context, data, bounds, name):
+    (width, height) = frame_size(context)
+
+    pixel = pixel_size(context)
+    padding = tile_padding(data, context, name)
+
+    (min_x, min_y, max_x, max_y) = bounds
+
+    # The bounds are in world units, so they are moved relative to the camera
+    camera = context.scene.camera
+    min_x -= camera.location.x
+    max_x -= camera.location.x
+    min_y -= camera.location.y
+    max_y -= camera.location.y
+
+    x1 = max(floor(min_x / pixel + width / 2) - padding, 0)
+    y1 = max(floor(min_y / pixel + height / 2) - padding, 0)
+    x2 = min(ceil(max_x / pixel + width / 2) + padding, width)
+    y2 = min(ceil(max_y / pixel + height / 2) + padding, height)
+
+    return (x1, y1, max(x2 - x1, 0), max(y2 - y1, 0))
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.previous = load_manifest(path)
+        self.passes = {}
+
+    def paths(self, name):
+        return self.previous[name]["paths"]
+
+    # Returns the digest of every output file from the previous bake
+    def digests(self, name):
+        previous = self.previous.get(name)
+
+        if previous is None:
+            return {}
+        else:
+            return previous.get("digests", {})
+
+    # Returns the pixel rectangle which must be rendered (the width is 0 if nothing changed),
+    # or None if the whole texture must be rendered
+    def changed_rect(self, context, data, name, hashes):
+        previous = self.previous.get(name)
+
+        # The render pass uses the user's settings, so it can be affected by objects outside of the bounds
+        if name == "render" or data.camera_mode != 'TOP' or hashes is None or previous is None:
+            return None
+
+        (scene, objects) = hashes
+
+        if previous["scene"] != scene or not all(os.path.exists(path) for path in previous["paths"]):
+            return None
+
+        old = previous["objects"]
+        bounds = []
+
+        for obj_name in set(old) | set(objects):
+            if obj_name in old and obj_name in objects and old[obj_name]["hash"] == objects[obj_name][0]:
+                continue
+
+            # Both the old and new position of the object must be rendered
+            if obj_name in old:
+                bounds.append(old[obj_name]["bounds"])
+
+            if obj_name in objects:
+                bounds.append(objects[obj_name][1])
+
+        if not bounds:
+            return (0, 0, 0, 0)
+
+        if any(x is None for x in bounds):
+            return None
+
+        rect = pixel_rect(context, data, (
+            min(x[0] for x in bounds),
+            min(x[1] for x in bounds),
+            max(x[2] for x in bounds),
+            max(x[3] for x in bounds),
+        ), name)
+
+        (width, height) = frame_size(context)
+
+        if rect[2] * rect[3] > width * height * MAX_PARTIAL_AREA:
+            return None
+
+        if rect[2] == 0 or rect[3] == 0:
+            return (0, 0, 0, 0)
+
+        return rect
+
+    # The samples are the number of samples which were used to render the pass (None if it wasn't rendered).
+    # The constants are the colors of the output files which only contain a single color.
+    def record(self, name, hashes, paths, samples=None, digests=None, constants=None):
+        if hashes is None:
+            self.passes[name] = {
+                "scene": None,
+                "paths": paths,
+                "samples": samples,
+                "objects": {},
+            }
+
+        else:
+            (scene, objects) = hashes
+
+            self.passes[name] = {
+                "scene": scene,
+                "paths": paths,
+                "samples": samples,
+                "objects": {obj_name: {"hash": hash, "bounds": bounds} for (obj_name, (hash, bounds)) in objects.items()},
+            }
+
+        self.passes[name]["digests"] = {} if digests is None else digests
+        self.passes[name]["constants"] = {} if constants is None else {path: list(color) for (path, color) in constants.items()}
+
+        self.save()
+
+    # The manifest is loaded again before saving, because background workers can bake different passes at the same time
+    def save(self):
+        passes = load_manifest(self.path)
+
+        passes.update(self.passes)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        partial = self.path + "." + str(os.getpid()) + ".partial"
+
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump({"version": MANIFEST_VERSION, "passes": passes}, file)
+
+        os.replace(partial, self.path)
@@ -0,0 +1,126 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Creates lower resolutions of the baked textures, every function halves the width and height.
+#
+# The pixels are (height, width, 4) linear RGBA arrays, if the size is odd then the last row or column is ignored.
+
+import numpy
+
+
+# These passes contain colors, so they use the filter which is chosen by the user
+COLOR_PASSES = ("render", "color", "emission", "vertex_color")
+
+# These passes contain IDs which must not be blended together
+INDEX_PASSES = ("material_index", "object_index", "object_random", "hair_random", "hair_root")
+
+# Lanczos with 3 lobes, scaled by 2 so it covers 12 pixels of the high resolution image
+LANCZOS_LOBES = 3
+LANCZOS_OFFSETS = numpy.arange(-5, 7)
+
+
+def crop_even(pixels):
+    (height, width) = pixels.shape[:2]
+    return pixels[:height - height % 2, :width - width % 2]
+
+
+def box(pixels):
+    pixels = crop_even(pixels)
+    return (pixels[0::2, 0::2] + pixels[1::2, 0::2] + pixels[0::2, 1::2] + pixels[1::2, 1::2]) * 0.25
+
+
+def lanczos_weights():
+    # Distance (in low resolution pixels) from the center of the output pixel to each input pixel
+    x = (LANCZOS_OFFSETS - 0.5) / 2.0
+    weights = numpy.sinc(x) * numpy.sinc(x / LANCZOS_LOBES)
+    return weights / weights.sum()
+
+
+def lanczos_axis(pixels, axis):
+    weights = lanczos_weights()
+
+    size = pixels.shape[axis] // 2
+    before = -LANCZOS_OFFSETS[0]
+    after = LANCZOS_OFFSETS[-1]
+
+    padding = [(0, 0)] * pixels.ndim
+    padding[axis] = (before, after)
+    padded = numpy.pad(pixels, padding, mode='edge')
+
+    output = None
+
+    for (offset, weight) in zip(LANCZOS_OFFSETS, weights):
+        start = before + offset
+        tap = numpy.take(padded, numpy.arange(start, start + size * 2, 2), axis=axis) * weight
+
+        if output is None:
+            output = tap
+        else:
+            output += tap
+
+    return output
+
+
+def lanczos(pixels):
+    pixels = crop_even(pixels)
+    output = lanczos_axis(lanczos_axis(pixels, 0), 1)
+
+    # Lanczos can overshoot near sharp edges, negative colors aren't valid
+    return numpy.maximum(output, 0.0).astype(numpy.float32)
+
+
+# The normals are averaged and then normalized again, so the lower resolutions don't get flatter
+def normal(pixels):
+    averaged = box(pixels)
+
+    vectors = averaged[..., :3] * 2.0 - 1.0
+    length = numpy.linalg.norm(vectors, axis=2, keepdims=True)
+    vectors = numpy.divide(vectors, length, out=numpy.zeros_like(vectors), where=length > 0)
+
+    averaged[..., :3] = vectors * 0.5 + 0.5
+    return averaged
+
+
+# Uses the color which is the most common in each 2x2 block
+def majority(pixels):
+    pixels = crop_even(pixels)
+
+    samples = numpy.stack([pixels[0::2, 0::2], pixels[1::2, 0::2], pixels[0::2, 1::2], pixels[1::2, 1::2]])
+
+    counts = numpy.zeros(samples.shape[:3], dtype=numpy.int32)
+
+    for other in samples:
+        counts += numpy.all(samples == other, axis=3)
+
+    # If there is a tie then the first sample is used
+    choice = numpy.argmax(counts, axis=0)
+
+    return numpy.take_along_axis(samples, choice[None, ..., None], axis=0)[0]
+
+
+def downsample(pixels, name, filter):
+    if name == "normal":
+        return normal(pixels)
+
+    elif name in INDEX_PASSES:
+        return majority(pixels)
+
+    elif name in COLOR_PASSES and filter == 'LANCZOS':
+        return lanczos(pixels)
+
+    else:
+        return box(pixels)
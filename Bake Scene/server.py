@@ -0,0 +1,127 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# The server receives one JSON object per line, and it sends back one JSON object per line:
+#
+#     {"file": "/path/to/file.blend", "scene": "Scene", "textures": ["ao", "normal"], "output": "/tmp/decal_"}
+#
+#     {"type": "progress", "texture": "ao", "index": 1, "total": 2}
+#     {"type": "progress", "texture": "normal", "index": 2, "total": 2}
+#     {"type": "done", "outputs": {"ao": ["/tmp/decal_ao.png"], "normal": ["/tmp/decal_normal.png"]}, "seconds": 3.2}
+#
+# If the bake fails it sends {"type": "error", "message": "..."} instead of "done".
+#
+# Sending {"command": "quit"} stops the server.
+
+import json
+import time
+import socket
+import traceback
+import bpy
+
+from .baking import (bake, open_blend, find_scene, parse_options, Configure, BakeError, Progress)
+
+
+def send(stream, message):
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+# Sends the progress to the client
+class StreamProgress(Progress):
+    def __init__(self, stream):
+        self.stream = stream
+        self.total = 0
+
+    def begin(self, total):
+        self.total = total
+
+    def update(self, index, name, paths):
+        send(self.stream, {"type": "progress", "texture": name, "index": index, "total": self.total, "outputs": paths})
+
+    def skip(self, index, name, reason):
+        send(self.stream, {"type": "progress", "texture": name, "index": index, "total": self.total, "outputs": [], "skipped": reason})
+
+
+def handle(request, stream):
+    if "file" not in request:
+        raise BakeError("Missing file")
+
+    open_blend(request["file"])
+
+    scene = find_scene(request.get("scene"))
+
+    start = time.time()
+
+    with bpy.context.temp_override(scene=scene):
+        with Configure(scene, parse_options(request)):
+            outputs = bake(bpy.context, scene.bake_scene, progress=StreamProgress(stream))
+
+    send(stream, {"type": "done", "outputs": outputs, "seconds": round(time.time() - start, 2)})
+
+
+# Returns False if the server should stop
+def serve_connection(stream):
+    for line in stream:
+        if not line.strip():
+            continue
+
+        try:
+            request = json.loads(line)
+
+        except ValueError as e:
+            send(stream, {"type": "error", "message": "Invalid JSON: " + str(e)})
+            continue
+
+        if not isinstance(request, dict):
+            send(stream, {"type": "error", "message": "The request must be a JSON object"})
+            continue
+
+        if request.get("command") == "quit":
+            send(stream, {"type": "quit"})
+            return False
+
+        try:
+            handle(request, stream)
+
+        except BakeError as e:
+            send(stream, {"type": "error", "message": str(e)})
+
+        except Exception as e:
+            traceback.print_exc()
+            send(stream, {"type": "error", "message": repr(e)})
+
+    return True
+
+
+# Handles one client at a time, because Blender can only bake one scene at a time
+def serve(host, port):
+    with socket.create_server((host, port)) as server:
+        print("Bake Scene server is listening on " + host + ":" + str(port), flush=True)
+
+        while True:
+            (connection, _) = server.accept()
+
+            with connection, connection.makefile("rw", encoding="utf-8") as stream:
+                try:
+                    running = serve_connection(stream)
+
+                except (ConnectionError, OSError):
+                    running = True
+
+            if not running:
+                break
@@ -17,6 +17,9 @@
 
 import bpy
 
+from . import watch
+from .quality import (find_profile)
+
 
 class TexturesScenePanel(bpy.types.Panel):
     bl_idname = "DATA_PT_bake_scene_textures_scene"
@@ -198,6 +201,243 @@ class TexturesHairPanel(bpy.types.Panel):
         col.prop(data, "generate_hair_root")
 
 
+class PerformancePanel(bpy.types.Panel):
+    bl_idname = "DATA_PT_bake_scene_performance"
+    bl_label = "Performance"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = 'output'
+    bl_parent_id = "DATA_PT_bake_scene"
+    bl_order = 3
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        data = context.scene.bake_scene
+        layout = self.layout
+
+        layout.use_property_split = True
+        flow = layout.grid_flow(row_major=True, columns=1, even_columns=True, even_rows=False, align=True)
+
+        if data.camera_mode == 'TOP':
+            col = flow.column()
+            col.row().prop(data, "tile_mode", expand=True)
+
+            if data.tile_mode == 'MANUAL':
+                col.prop(data, "tile_size")
+
+            elif data.tile_mode == 'AUTO':
+                col.prop(data, "tile_memory")
+
+            row = col.row()
+            row.enabled = data.tile_mode != 'OFF'
+            row.prop(data, "tile_padding")
+
+            flow.separator()
+
+        col = flow.column()
+        col.prop(data, "use_workers")
+
+        col = flow.column()
+        col.enabled = data.use_workers
+        col.prop(data, "worker_count")
+        col.prop(data, "worker_threads")
+        col.prop(data, "use_worker_extract")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(data, "preflight_mode")
+        col.prop(data, "use_output_checks")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(data, "use_cache")
+
+        col = flow.column()
+        col.enabled = data.use_cache
+        col.prop(data, "cache_directory")
+        col.prop(data, "cache_size")
+
+        if data.camera_mode == 'TOP':
+            flow.separator()
+
+            col = flow.column()
+            col.prop(data, "use_partial_rebake")
+
+
+class QualityPanel(bpy.types.Panel):
+    bl_idname = "DATA_PT_bake_scene_quality"
+    bl_label = "Quality"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = 'output'
+    bl_parent_id = "DATA_PT_bake_scene"
+    bl_order = 1
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        data = context.scene.bake_scene
+        layout = self.layout
+
+        layout.use_property_split = True
+        flow = layout.grid_flow(row_major=True, columns=1, even_columns=True, even_rows=False, align=True)
+
+        if not data.quality_profiles:
+            col = flow.column()
+            col.prop(data, "quality_profile")
+            col.operator("bake_scene.add_default_quality_profiles", icon='ADD')
+            return
+
+        row = flow.row(align=True)
+        row.prop_search(data, "quality_profile", data, "quality_profiles")
+        row.operator("bake_scene.add_quality_profile", text="", icon='DUPLICATE')
+        row.operator("bake_scene.remove_quality_profile", text="", icon='REMOVE')
+
+        profile = find_profile(data)
+
+        if profile is None:
+            return
+
+        col = flow.column()
+        col.prop(profile, "name")
+        col.prop(profile, "resolution_scale")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(profile, "eevee_samples")
+        col.prop(profile, "cycles_samples")
+        col.prop(profile, "workbench_aa")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(profile, "ao_samples")
+        col.prop(profile, "cycles_ao_samples")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(profile, "use_adaptive")
+
+        col = flow.column()
+        col.enabled = profile.use_adaptive
+        col.prop(profile, "adaptive_threshold")
+        col.prop(profile, "adaptive_min_samples")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(profile, "use_denoising")
+
+        for (index, override) in enumerate(profile.overrides):
+            flow.separator()
+
+            col = flow.column()
+
+            row = col.row(align=True)
+            row.prop(override, "texture")
+            row.operator("bake_scene.remove_quality_override", text="", icon='X').index = index
+
+            col.prop(override, "eevee_samples")
+            col.prop(override, "cycles_samples")
+            col.prop(override, "workbench_aa")
+
+        flow.separator()
+
+        flow.operator("bake_scene.add_quality_override", icon='ADD')
+
+
+class OutputPanel(bpy.types.Panel):
+    bl_idname = "DATA_PT_bake_scene_output"
+    bl_label = "Output Formats"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = 'output'
+    bl_parent_id = "DATA_PT_bake_scene"
+    bl_order = 2
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        data = context.scene.bake_scene
+        layout = self.layout
+
+        layout.use_property_split = True
+        flow = layout.grid_flow(row_major=True, columns=1, even_columns=True, even_rows=False, align=True)
+
+        col = flow.column()
+        col.enabled = not data.use_multilayer
+        col.prop(data, "resolution_levels")
+
+        row = col.row()
+        row.enabled = data.resolution_levels > 0
+        row.prop(data, "downsample_filter")
+
+        flow.separator()
+
+        if data.camera_mode == 'TOP':
+            col = flow.column()
+            col.prop(data, "use_crop")
+
+            row = col.row()
+            row.enabled = data.use_crop
+            row.prop(data, "crop_padding")
+
+            flow.separator()
+
+            col = flow.column()
+            col.prop(data, "use_atlas")
+
+            col = flow.column()
+            col.enabled = data.use_atlas
+            col.prop(data, "atlas_collection")
+            col.prop(data, "atlas_padding")
+
+            flow.separator()
+
+        col = flow.column()
+        col.prop(data, "use_dds")
+
+        row = col.row()
+        row.enabled = data.use_dds
+        row.prop(data, "dds_color_codec")
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(data, "use_multilayer")
+
+        col = flow.column()
+        col.enabled = data.use_multilayer
+        col.prop(data, "multilayer_codec")
+        col.row().prop(data, "multilayer_depth", expand=True)
+
+        flow.separator()
+
+        col = flow.column()
+        col.enabled = not data.use_multilayer
+        col.row().prop(data, "output_policy", expand=True)
+
+        for (index, override) in enumerate(data.output_overrides):
+            flow.separator()
+
+            col = flow.column()
+            col.enabled = not data.use_multilayer
+
+            row = col.row(align=True)
+            row.prop(override, "texture")
+            row.operator("bake_scene.remove_output_override", text="", icon='X').index = index
+
+            col.prop(override, "file_format")
+            col.row().prop(override, "color_depth", expand=True)
+            col.prop(override, "compression")
+
+        flow.separator()
+
+        flow.operator("bake_scene.add_output_override", icon='ADD')
+
+
 class TexturesPanel(bpy.types.Panel):
     bl_idname = "DATA_PT_bake_scene_textures"
     bl_label = "Textures"
@@ -233,6 +473,36 @@ class BakePanel(bpy.types.Panel):
         row.alignment = 'EXPAND'
         row.operator("bake_scene.bake", icon='RENDER_STILL')
 
+        col.prop(data, "use_watch")
+
+        if data.use_watch:
+            col.prop(data, "watch_delay")
+
+            if data.quality_profiles:
+                col.prop_search(data, "watch_quality", data, "quality_profiles")
+            else:
+                col.prop(data, "watch_quality")
+
+            # The worker errors can contain a traceback, so it only shows the first and the last line
+            if watch.state["error"] is not None:
+                lines = watch.state["error"].splitlines()
+                col.label(text=lines[0], icon='ERROR')
+
+                if len(lines) > 1:
+                    col.label(text=lines[-1])
+
+        flow.separator()
+
+        col = flow.column()
+        col.prop(data, "use_frame_range")
+
+        if data.use_frame_range:
+            col.prop(data, "use_flipbook")
+
+            row = col.row()
+            row.enabled = data.use_flipbook
+            row.prop(data, "flipbook_columns")
+
         flow.separator()
 
         row = flow.row()
@@ -246,3 +516,65 @@ class BakePanel(bpy.types.Panel):
                 row.operator("bake_scene.hide_size", text="", icon='HIDE_OFF')
             else:
                 row.operator("bake_scene.show_size", text="", icon='HIDE_ON')
+
+            flow.separator()
+
+            col = flow.column()
+            col.prop(data, "use_regions")
+
+            if data.use_regions:
+                for (index, region) in enumerate(data.regions):
+                    flow.separator()
+
+                    col = flow.column()
+
+                    row = col.row(align=True)
+                    row.prop(region, "use", text="")
+                    row.prop(region, "name", text="")
+                    row.operator("bake_scene.remove_bake_region", text="", icon='X').index = index
+
+                    col = col.column()
+                    col.enabled = region.use
+                    col.prop(region, "center")
+                    col.prop(region, "size")
+                    col.prop(region, "resolution_x")
+                    col.prop(region, "resolution_y")
+
+                flow.separator()
+
+                flow.operator("bake_scene.add_bake_region", icon='ADD')
+
+        elif data.camera_mode == 'HDRI':
+            col = flow.column()
+            col.prop(data, "hdri_projection")
+
+            row = col.row()
+            row.enabled = data.hdri_projection != 'EQUIRECTANGULAR'
+            row.prop(data, "use_hdri_equirect")
+
+            flow.separator()
+
+            col = flow.column()
+            col.prop(data, "use_probes")
+
+            if data.use_probes:
+                col = flow.column()
+                col.prop(data, "probe_collection")
+
+                for (index, probe) in enumerate(data.probes):
+                    flow.separator()
+
+                    col = flow.column()
+
+                    row = col.row(align=True)
+                    row.prop(probe, "use", text="")
+                    row.prop(probe, "name", text="")
+                    row.operator("bake_scene.remove_bake_probe", text="", icon='X').index = index
+
+                    col = col.column()
+                    col.enabled = probe.use
+                    col.prop(probe, "location")
+
+                flow.separator()
+
+                flow.operator("bake_scene.add_bake_probe", icon='ADD')
@@ -15,10 +15,92 @@
 # You should have received a copy of the GNU General Public License
 # along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
 import bpy
-from math import (hypot)
+import numpy
+import tempfile
+import hashlib
+from math import (hypot, ceil, sqrt)
 from mathutils import (Vector)
 
+from .quality import (pass_samples, profile_value)
+from .resample import (downsample)
+from .dds import (write_dds, pass_codec)
+from .exr import (ScanlineWriter, CODECS)
+
+
+# Rough estimate of how much memory EEVEE uses for every rendered pixel
+RENDER_BYTES_PER_PIXEL = 128
+
+# Passes which are noisy when rendered with Cycles, the other passes contain data which must not be denoised
+DENOISE_PASSES = ("render", "ao", "emission")
+
+# Adaptive sampling stops when this percentage of the pixels has converged, the rest are usually fireflies
+ADAPTIVE_PERCENTILE = 99.9
+
+# When Multilayer EXR is enabled, the textures are saved into this folder and then combined into a single file
+LAYERS_FOLDER = "layers"
+
+# Distance (in world units) of the Ambient Occlusion node which is used by the AO texture
+AO_DISTANCE = 1.0
+
+
+# Information about the pass which is currently being rendered, this is set by RenderPass
+render_state = {
+    # Name of the pass
+    "name": None,
+
+    # The pixel rectangle which should be re-rendered into the existing output file
+    "rect": None,
+
+    # If this is not None then it writes an image with this color instead of rendering
+    "constant": None,
+
+    # The number of samples which were used, this is set by render
+    "samples": None,
+
+    # The digest of every output file from the previous bake, if a new output has the same digest then it isn't written
+    "previous": {},
+
+    # The digest of every output file which was written, this is set by render
+    "digests": {},
+
+    # The color of every output file which only contains a single color, this is set by render
+    "constants": {},
+
+    # If this is not None then every decal is rendered into the atlas instead of rendering the frame, this is set by Atlas
+    "atlas": None,
+
+    # If this is not None then the HDRI is rendered as cubemap faces instead of a panorama, this is set by Projection
+    "projection": None,
+
+    # If this is not None then every frame of the frame range is rendered, this is set by Frames
+    "frames": None,
+
+    # If this is not None then the pixels of every pass are stored in this dict instead of writing files,
+    # this is set by CollectLayers
+    "layers": None,
+
+    # The pixels of the last frame which was rendered by Frames, or None if they were written directly into the file
+    "pixels": None,
+}
+
+
+# The region which is currently being baked, this is set by UseRegion
+region_state = {
+    # Center of the region in world units
+    "center": (0.0, 0.0),
+
+    # Size of the region in world units, if this is None then the scene's size is used
+    "size": None,
+
+    # Position of the HDRI probe, the depth is measured from here
+    "origin": (0.0, 0.0, 0.0),
+
+    # The output files of the region start with this
+    "prefix": "",
+}
+
 
 def renderable_objects(layer):
     if not layer.exclude and not layer.collection.hide_render:
@@ -30,16 +112,79 @@ def renderable_objects(layer):
             yield from renderable_objects(child)
 
 
-def get_size(context, data):
-    res_x = context.scene.render.resolution_x
-    res_y = context.scene.render.resolution_y
-
+def fit_size(size, res_x, res_y):
     if res_x == res_y:
-        return (data.size, data.size)
+        return (size, size)
     elif res_x < res_y:
-        return (data.size * (res_x / res_y), data.size)
+        return (size * (res_x / res_y), size)
+    else:
+        return (size, size * (res_y / res_x))
+
+
+def get_size(context, data):
+    size = data.size if region_state["size"] is None else region_state["size"]
+    return fit_size(size, context.scene.render.resolution_x, context.scene.render.resolution_y)
+
+
+# The regions (or HDRI probes) which are baked, None means that the frame is centered on the origin and uses the scene's settings
+def bake_regions(data):
+    regions = []
+
+    if data.use_regions and data.camera_mode == 'TOP':
+        regions = [region for region in data.regions if region.use]
+
+    elif data.use_probes and data.camera_mode == 'HDRI':
+        regions = [probe for probe in data.probes if probe.use]
+
+        # Every empty in the probe collection is also a probe
+        if data.probe_collection is not None:
+            regions += sorted((obj for obj in data.probe_collection.all_objects if obj.type == 'EMPTY' and not obj.hide_render), key=lambda obj: obj.name)
+
+    if regions:
+        return regions
+    else:
+        return [None]
+
+
+def probe_location(probe):
+    if isinstance(probe, bpy.types.Object):
+        return tuple(probe.matrix_world.translation)
+    else:
+        return tuple(probe.location)
+
+
+# The (center, size) in world units of every region which is baked
+def region_bounds(context, data):
+    bounds = []
+
+    for region in bake_regions(data):
+        if region is None:
+            bounds.append(((0.0, 0.0), get_size(context, data)))
+        else:
+            bounds.append((tuple(region.center), fit_size(region.size, region.resolution_x, region.resolution_y)))
+
+    return bounds
+
+
+def region_prefix(region):
+    if region is None:
+        return ""
     else:
-        return (data.size, data.size * (res_y / res_x))
+        return bpy.path.clean_name(region.name) + "_"
+
+
+# Size of the rendered image in pixels
+def frame_size(context):
+    render = context.scene.render
+    return (
+        render.resolution_x * render.resolution_percentage // 100,
+        render.resolution_y * render.resolution_percentage // 100,
+    )
+
+
+# Size of a single pixel in world units
+def pixel_size(context):
+    return context.scene.camera.data.ortho_scale / max(frame_size(context))
 
 
 def object_vertices(obj):
@@ -64,6 +209,8 @@ def calculate_max_height(context, data):
     half_width = size[0] / 2
     half_height = size[1] / 2
 
+    (center_x, center_y) = region_state["center"]
+
     camera_height = data.camera_height
 
     max_height = 0
@@ -72,10 +219,10 @@ def calculate_max_height(context, data):
         for co in object_vertices(obj):
             # If the vertex is within the size bounds
             if (
-                co.x <= half_width and
-                co.x >= -half_width and
-                co.y <= half_height and
-                co.y >= -half_height
+                co.x - center_x <= half_width and
+                co.x - center_x >= -half_width and
+                co.y - center_y <= half_height and
+                co.y - center_y >= -half_height
             ):
                 height = abs(co.z)
 
@@ -92,10 +239,12 @@ def calculate_max_height(context, data):
 def calculate_max_depth(context):
     max_depth = 0
 
+    (origin_x, origin_y, origin_z) = region_state["origin"]
+
     for obj in renderable_objects(context.view_layer.layer_collection):
         for co in object_vertices(obj):
-            # Distance from (0, 0, 0)
-            depth = hypot(co.x, co.y, co.z)
+            # Distance from the probe, which is (0, 0, 0) by default
+            depth = hypot(co.x - origin_x, co.y - origin_y, co.z - origin_z)
 
             if depth > max_depth:
                 max_depth = depth
@@ -103,10 +252,11 @@ def calculate_max_depth(context):
     return max_depth
 
 
-def antialias_on(context):
-    context.scene.cycles.samples = 32
-    context.scene.display.render_aa = '32'
-    context.scene.eevee.taa_render_samples = 128
+def antialias_on(context, data, name):
+    (eevee, cycles, workbench) = pass_samples(data, name)
+    context.scene.cycles.samples = cycles
+    context.scene.display.render_aa = workbench
+    context.scene.eevee.taa_render_samples = eevee
 
 def antialias_off(context):
     context.scene.cycles.samples = 1
@@ -176,7 +326,582 @@ def default_settings(context):
 
 
 def filename(data, settings, suffix):
-    return settings.filepath + suffix
+    prefix = settings.filepath + region_state["prefix"]
+
+    if data.use_multilayer:
+        return prefix + LAYERS_FOLDER + "/" + suffix
+    else:
+        return prefix + suffix
+
+
+# The file which bpy.ops.render.render(write_still=True) will write to
+def output_path(context):
+    render = context.scene.render
+    path = bpy.path.abspath(render.filepath)
+
+    if render.use_file_extension:
+        path += render.file_extension
+
+    return path
+
+
+# Returns the pixels of the image and whether Blender loaded it as a float buffer.
+#
+# If raw is True then the pixels are never converted into linear colors.
+def load_image(path, raw=False):
+    image = bpy.data.images.load(path)
+
+    try:
+        if raw:
+            image.colorspace_settings.name = 'Non-Color'
+
+        width, height = image.size
+        pixels = numpy.empty(width * height * image.channels, dtype=numpy.float32)
+        image.pixels.foreach_get(pixels)
+        return (pixels.reshape(height, width, image.channels), image.is_float)
+
+    finally:
+        bpy.data.images.remove(image)
+
+
+def load_pixels(path):
+    return load_image(path)[0]
+
+
+# Saves the pixels using the scene's image settings and color management
+def save_pixels(context, pixels, path):
+    height, width = pixels.shape[:2]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    image = bpy.data.images.new("__Bake_Output", width, height, alpha=True, float_buffer=True)
+
+    try:
+        # This doesn't copy the pixels if they are contiguous
+        image.pixels.foreach_set(numpy.ascontiguousarray(pixels, dtype=numpy.float32).reshape(-1))
+        image.save_render(path, scene=context.scene)
+
+    finally:
+        bpy.data.images.remove(image)
+
+
+# Loads an existing output file and converts it back into linear pixels
+def load_output(context, path):
+    # Outputs without the Standard view transform contain data, not colors
+    is_color = context.scene.view_settings.view_transform == 'Standard'
+
+    (pixels, is_float) = load_image(path, raw=not is_color)
+
+    # Grayscale and RGB files are converted into RGBA
+    if pixels.shape[2] < 4:
+        (height, width, channels) = pixels.shape
+        rgba = numpy.ones((height, width, 4), dtype=numpy.float32)
+        rgba[..., :3] = pixels[..., :3] if channels >= 3 else pixels[..., :1]
+        pixels = rgba
+
+    # Blender already converts float buffers (for example EXR or 16 bit PNG) into linear colors,
+    # but 8 bit images are returned with the view transform
+    if not is_float and is_color:
+        rgb = pixels[..., :3]
+        pixels[..., :3] = numpy.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+    return pixels
+
+
+# Writes an image where every pixel is the same color, this doesn't need a pixel buffer in Python
+def save_constant(context, color, path, size):
+    (width, height) = size
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Float images use a linear color, the same as the rendered pixels
+    image = bpy.data.images.new("__Bake_Output", width, height, alpha=True, float_buffer=True)
+
+    try:
+        image.generated_color = color
+        image.save_render(path, scene=context.scene)
+
+    finally:
+        bpy.data.images.remove(image)
+
+
+# Returns the color if every pixel has the same color, otherwise None
+def uniform_color(pixels):
+    flat = pixels.reshape(-1, pixels.shape[2])
+    first = flat[0]
+
+    if (flat == first).all():
+        return tuple(float(x) for x in first)
+    else:
+        return None
+
+
+# The digest includes the output settings, because they change the file even if the pixels are the same
+def pixels_digest(context, pixels):
+    settings = context.scene.render.image_settings
+
+    h = hashlib.sha256()
+    h.update(repr(pixels.shape).encode("utf-8"))
+    h.update(pixels.tobytes())
+    h.update(repr((settings.file_format, settings.color_mode, settings.color_depth, context.scene.view_settings.view_transform)).encode("utf-8"))
+    return h.hexdigest()
+
+
+# Writes the pixels into the output, unless the output already contains the same pixels.
+# Images which only contain a single color are written without copying the pixels.
+def write_output(context, pixels, output):
+    digest = pixels_digest(context, pixels)
+    color = uniform_color(pixels)
+
+    render_state["digests"][output.path] = digest
+
+    if color is not None:
+        render_state["constants"][output.path] = color
+
+    if render_state["previous"].get(output.path) == digest and os.path.exists(output.path):
+        output.unchanged = True
+
+    # Atlases and HDRI projections don't have the same size as the frame
+    elif color is not None:
+        save_constant(context, color, output.partial, (pixels.shape[1], pixels.shape[0]))
+
+    else:
+        save_pixels(context, pixels, output.partial)
+
+
+# Renders the current frame and returns the raw (linear) pixels
+def render_pixels(context):
+    with TemporaryOutput(context) as output:
+        bpy.ops.render.render(write_still=True)
+        return load_pixels(output_path(context))
+
+
+def tile_size(data, context):
+    if data.tile_mode == 'MANUAL':
+        return data.tile_size
+
+    elif data.tile_mode == 'AUTO':
+        return int(sqrt(data.tile_memory * 1024 * 1024 / RENDER_BYTES_PER_PIXEL))
+
+
+# The name is the pass which is rendered, by default it is the current pass
+def tile_padding(data, context, name=None):
+    if name is None:
+        name = render_state["name"]
+
+    padding = data.tile_padding
+    eevee = context.scene.eevee
+
+    # AO is affected by geometry which is outside of the tile
+    if eevee.use_gtao:
+        padding = max(padding, ceil(eevee.gtao_distance / pixel_size(context)))
+
+    # The AO texture uses the distance of the AO node, which is larger than the EEVEE distance
+    if name == "ao":
+        padding = max(padding, ceil(AO_DISTANCE / pixel_size(context)))
+
+    return padding
+
+
+def use_tiles(data, context):
+    if data.camera_mode == 'TOP' and data.tile_mode != 'OFF':
+        return tile_size(data, context) < max(frame_size(context))
+    else:
+        return False
+
+
+def tiles(width, height, size):
+    for y in range(0, height, size):
+        for x in range(0, width, size):
+            yield (x, y, min(size, width - x), min(size, height - y))
+
+
+# The channels of the EXR file for each color mode, and which channel of the pixels they use (sorted by name)
+EXR_CHANNELS = {
+    'BW': (("Y", 0),),
+    'RGB': (("B", 2), ("G", 1), ("R", 0)),
+    'RGBA': (("A", 3), ("B", 2), ("G", 1), ("R", 0)),
+}
+
+
+# The tiles can be written directly into EXR files, so the whole texture is never in memory
+def use_streaming(data, context):
+    settings = context.scene.render.image_settings
+
+    return (
+        settings.file_format == 'OPEN_EXR' and
+        settings.exr_codec in CODECS and
+        settings.color_mode in EXR_CHANNELS and
+        # The output checks need all of the pixels
+        not data.use_output_checks
+    )
+
+
+# Renders a row of tiles at a time, and returns the (y, pixels) of each row
+def tile_rows(data, context):
+    width, height = frame_size(context)
+    padding = tile_padding(data, context)
+
+    # The padding is included in the tile size, but it must always render at least 1 pixel
+    size = max(tile_size(data, context) - padding * 2, 1)
+
+    for y in range(0, height, size):
+        h = min(size, height - y)
+        row = numpy.empty((h, width, 4), dtype=numpy.float32)
+
+        for x in range(0, width, size):
+            w = min(size, width - x)
+
+            with Region(context, x - padding, y - padding, w + padding * 2, h + padding * 2):
+                tile = render_converged(data, context)
+
+            row[:, x:x + w] = tile[padding:padding + h, padding:padding + w]
+
+        yield (y, row)
+
+
+# Renders the frame as multiple smaller tiles and stitches them together.
+#
+# If the output can be streamed then the rows of tiles are written into the path and it returns None,
+# otherwise it returns the pixels.
+def render_tiled(data, context, path=None):
+    width, height = frame_size(context)
+
+    if path is not None and use_streaming(data, context):
+        settings = context.scene.render.image_settings
+        channels = EXR_CHANNELS[settings.color_mode]
+
+        with ScanlineWriter(path, [name for (name, _) in channels], width, height, settings.exr_codec, settings.color_depth) as writer:
+            for (y, row) in tile_rows(data, context):
+                writer.write(row[..., [index for (_, index) in channels]])
+
+        return None
+
+    pixels = numpy.empty((height, width, 4), dtype=numpy.float32)
+
+    for (y, row) in tile_rows(data, context):
+        pixels[y:y + row.shape[0]] = row
+
+    return pixels
+
+
+# Re-renders a rectangle of the existing output file, returns None if the existing file can't be patched
+def render_patch(data, context, path, rect):
+    pixels = load_output(context, path)
+
+    (width, height) = frame_size(context)
+
+    if pixels.shape[:2] != (height, width):
+        return None
+
+    (x, y, w, h) = rect
+
+    # The padding is rendered so that the AO and curvature match the rest of the file
+    padding = tile_padding(data, context)
+
+    with Region(context, x - padding, y - padding, w + padding * 2, h + padding * 2):
+        patch = render_converged(data, context)
+
+    pixels[y:y + h, x:x + w] = patch[padding:padding + h, padding:padding + w]
+
+    return pixels
+
+
+# Maximum number of samples for the current render engine, or None if the engine doesn't use samples
+def engine_samples(context):
+    scene = context.scene
+
+    if scene.render.engine == 'CYCLES':
+        return scene.cycles.samples
+
+    elif scene.render.engine == 'BLENDER_EEVEE':
+        return scene.eevee.taa_render_samples
+
+    else:
+        return None
+
+
+def use_adaptive(data, context):
+    # The render pass must use the user's settings
+    if render_state["name"] == "render" or engine_samples(context) is None:
+        return False
+
+    return profile_value(data, "use_adaptive")
+
+
+# Returns True if almost all of the pixels changed less than the threshold
+def is_converged(previous, pixels, threshold):
+    change = numpy.abs(pixels - previous).max(axis=2)
+    return numpy.percentile(change, ADAPTIVE_PERCENTILE) < threshold
+
+
+# EEVEE always uses the same sample pattern, so it must render again with double the samples
+def render_adaptive_eevee(context, samples, max_samples, threshold):
+    eevee = context.scene.eevee
+    saved = eevee.taa_render_samples
+
+    try:
+        eevee.taa_render_samples = samples
+        pixels = render_pixels(context)
+
+        while samples < max_samples:
+            samples = min(samples * 2, max_samples)
+            eevee.taa_render_samples = samples
+
+            previous = pixels
+            pixels = render_pixels(context)
+
+            if is_converged(previous, pixels, threshold):
+                break
+
+    finally:
+        eevee.taa_render_samples = saved
+
+    return (pixels, samples)
+
+
+# Cycles renders batches with different seeds, and the batches are averaged together
+def render_adaptive_cycles(context, batch, max_samples, threshold):
+    cycles = context.scene.cycles
+    saved = (cycles.samples, cycles.seed, cycles.use_animated_seed)
+
+    cycles.use_animated_seed = False
+
+    total = 0
+    pixels = None
+
+    try:
+        while total < max_samples:
+            samples = min(batch, max_samples - total)
+
+            cycles.samples = samples
+            cycles.seed = saved[1] + total
+
+            previous = pixels
+            rendered = render_pixels(context)
+
+            if pixels is None:
+                pixels = rendered
+            else:
+                pixels = (pixels * total + rendered * samples) / (total + samples)
+
+            total += samples
+
+            if previous is not None and is_converged(previous, pixels, threshold):
+                break
+
+    finally:
+        (cycles.samples, cycles.seed, cycles.use_animated_seed) = saved
+
+    return (pixels, total)
+
+
+# Renders the current frame and returns the raw (linear) pixels, with adaptive sampling if it is enabled
+def render_converged(data, context):
+    max_samples = engine_samples(context)
+
+    if use_adaptive(data, context):
+        threshold = profile_value(data, "adaptive_threshold")
+        samples = min(profile_value(data, "adaptive_min_samples"), max_samples)
+
+        if context.scene.render.engine == 'CYCLES':
+            (pixels, samples) = render_adaptive_cycles(context, samples, max_samples, threshold)
+        else:
+            (pixels, samples) = render_adaptive_eevee(context, samples, max_samples, threshold)
+
+    else:
+        pixels = render_pixels(context)
+        samples = max_samples
+
+    # When rendering tiles, this is the maximum samples of all the tiles
+    if samples is not None:
+        render_state["samples"] = max(render_state["samples"] or 0, samples)
+
+    return pixels
+
+
+# The paths of the lower resolutions, the size is added to the end of the file name
+def resolution_paths(data, context, path, size):
+    (width, height) = size
+    (root, extension) = os.path.splitext(path)
+
+    paths = []
+
+    for level in range(data.resolution_levels):
+        width //= 2
+        height //= 2
+
+        if width == 0 or height == 0:
+            break
+
+        paths.append(root + "_" + str(width) + "x" + str(height) + extension)
+
+    return paths
+
+
+# Creates the lower resolutions from the output, each resolution is created from the previous resolution.
+# The pixels are the output's pixels if they are already in memory, otherwise the output is loaded.
+def write_resolutions(data, context, path, pixels, unchanged):
+    # The atlas and the cubemap have a different size than the frame
+    size = frame_size(context) if pixels is None else (pixels.shape[1], pixels.shape[0])
+
+    paths = resolution_paths(data, context, path, size)
+
+    # The output didn't change, so the lower resolutions don't need to change either
+    if unchanged and all(os.path.exists(x) for x in paths):
+        return paths
+
+    if paths and pixels is None:
+        pixels = load_output(context, path)
+
+    for target in paths:
+        pixels = downsample(pixels, render_state["name"], data.downsample_filter)
+
+        (root, extension) = os.path.splitext(target)
+        partial = root + ".partial" + extension
+
+        save_pixels(context, pixels, partial)
+        os.replace(partial, target)
+
+    return paths
+
+
+# Saves the output as a block compressed DDS file, the pixels are the output's pixels if they are already in memory
+def write_block_compressed(data, context, path, pixels, unchanged):
+    codec = pass_codec(data, render_state["name"])
+
+    if codec is None:
+        return []
+
+    target = os.path.splitext(path)[0] + ".dds"
+
+    if unchanged and os.path.exists(target):
+        return [target]
+
+    if pixels is None:
+        pixels = load_output(context, path)
+
+    write_dds(target, pixels, render_state["name"], codec, data.downsample_filter)
+    return [target]
+
+
+# Renders the whole frame and returns the raw (linear) pixels, or None if the output file was already written.
+# If path is None then it always returns the pixels.
+def render_whole(data, context, path):
+    if use_tiles(data, context):
+        return render_tiled(data, context, path)
+
+    elif use_adaptive(data, context):
+        return render_converged(data, context)
+
+    # The pixels are needed to check the output, or to keep them in memory
+    elif data.use_output_checks or path is None:
+        pixels = render_pixels(context)
+        render_state["samples"] = engine_samples(context)
+        return pixels
+
+    else:
+        bpy.ops.render.render(write_still=True)
+        render_state["samples"] = engine_samples(context)
+        return None
+
+
+# Renders the current pass into memory, the layers are written into a multilayer EXR file afterwards
+def render_layer(data, context):
+    render_state["samples"] = None
+
+    with Denoise(data, context):
+        if render_state["atlas"] is not None:
+            pixels = render_state["atlas"].render(data, context)
+
+        elif render_state["projection"] is not None:
+            pixels = render_state["projection"].render(data, context)
+
+        elif render_state["constant"] is not None:
+            (width, height) = frame_size(context)
+            pixels = numpy.full((height, width, 4), render_state["constant"], dtype=numpy.float32)
+
+        else:
+            pixels = render_whole(data, context, None)
+
+    render_state["layers"][render_state["name"]] = pixels
+
+    # The extra files are still written next to the layer's path, even though the layer itself isn't written
+    path = output_path(context)
+    paths = []
+
+    if data.use_dds or (render_state["projection"] is not None and data.use_hdri_equirect):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if data.use_dds:
+        paths += write_block_compressed(data, context, path, pixels, False)
+
+    if render_state["projection"] is not None and data.use_hdri_equirect:
+        paths += render_state["projection"].write_equirect(context, path, False)
+
+    return paths
+
+
+# Renders the current frame of the current pass and returns the list of files which were written
+def render_frame(data, context):
+    if render_state["layers"] is not None:
+        return render_layer(data, context)
+
+    render_state["samples"] = None
+
+    with Denoise(data, context), AtomicOutput(context) as output:
+        rect = render_state["rect"]
+        pixels = None
+
+        if render_state["atlas"] is not None:
+            pixels = render_state["atlas"].render(data, context)
+
+        elif render_state["projection"] is not None:
+            pixels = render_state["projection"].render(data, context)
+
+        elif render_state["constant"] is not None:
+            render_state["constants"][output.path] = tuple(render_state["constant"])
+            save_constant(context, render_state["constant"], output.partial, frame_size(context))
+
+        else:
+            if rect is not None and os.path.exists(output.path):
+                pixels = render_patch(data, context, output.path, rect)
+
+            # The existing file can't be patched (for example because the resolution changed), so it renders everything
+            if pixels is None:
+                pixels = render_whole(data, context, output.partial)
+
+        if pixels is not None:
+            if data.use_output_checks:
+                write_output(context, pixels, output)
+            else:
+                save_pixels(context, pixels, output.partial)
+
+    # Frames keeps the pixels of every frame for the flipbook
+    if render_state["frames"] is not None:
+        render_state["pixels"] = pixels
+
+    paths = [output.path]
+
+    # The lower resolutions aren't used by Multilayer EXR, because every layer must have the same size
+    if data.resolution_levels > 0 and not data.use_multilayer:
+        paths += write_resolutions(data, context, output.path, pixels, output.unchanged)
+
+    if data.use_dds:
+        paths += write_block_compressed(data, context, output.path, pixels, output.unchanged)
+
+    if render_state["projection"] is not None and data.use_hdri_equirect:
+        paths += render_state["projection"].write_equirect(context, output.path, output.unchanged)
+
+    return paths
+
+
+# Renders the current pass and returns the list of files which were written
+def render(data, context):
+    if render_state["frames"] is not None:
+        return render_state["frames"].render(data, context)
+    else:
+        return render_frame(data, context)
 
 
 def node_group_output(tree, inputs, socket):
@@ -192,7 +917,7 @@ def node_group_output(tree, inputs, socket):
     tree.links.new(mix.outputs["Shader"], outputs.inputs["Surface"])
 
 
-def render_with_input(context, name, input):
+def render_with_input(data, context, name, input):
     with NodeGroup(name) as tree:
         inputs = tree.nodes.new('NodeGroupInput')
         emission = tree.nodes.new('ShaderNodeEmission')
@@ -202,7 +927,7 @@ def render_with_input(context, name, input):
         node_group_output(tree, inputs, emission.outputs["Emission"])
 
         with ReplaceMaterials(context, name):
-            bpy.ops.render.render(write_still=True)
+            return render(data, context)
 
 
 # Creates a node group for custom materials
@@ -443,6 +1168,291 @@ class Camera:
         return False
 
 
+# Moves the camera to a named region of the scene, every region has its own size and resolution.
+# In HDRI mode the region is a probe, and the camera is moved to the probe.
+#
+# If region is None then nothing is changed.
+class UseRegion:
+    def __init__(self, context, data, region):
+        self.scene = context.scene
+        self.data = data
+        self.region = region
+        self.saved = None
+
+    def __enter__(self):
+        region = self.region
+
+        if region is None:
+            return self
+
+        render = self.scene.render
+        camera = self.scene.camera
+
+        self.saved = {
+            "resolution_x": render.resolution_x,
+            "resolution_y": render.resolution_y,
+            "location": camera.location.copy(),
+            "ortho_scale": camera.data.ortho_scale,
+            "state": region_state.copy(),
+        }
+
+        if self.data.camera_mode == 'HDRI':
+            camera.location = probe_location(region)
+            region_state["origin"] = probe_location(region)
+
+        else:
+            render.resolution_x = region.resolution_x
+            render.resolution_y = region.resolution_y
+            camera.location.x = region.center[0]
+            camera.location.y = region.center[1]
+            camera.data.ortho_scale = region.size
+
+            region_state["center"] = tuple(region.center)
+            region_state["size"] = region.size
+
+        region_state["prefix"] = region_prefix(region)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.saved is not None:
+            render = self.scene.render
+            camera = self.scene.camera
+
+            render.resolution_x = self.saved["resolution_x"]
+            render.resolution_y = self.saved["resolution_y"]
+            camera.location = self.saved["location"]
+            camera.data.ortho_scale = self.saved["ortho_scale"]
+            region_state.update(self.saved["state"])
+
+            self.saved = None
+
+        return False
+
+
+# Changes the camera and resolution so that it only renders a rectangle (in pixels) of the current frame
+class Region:
+    def __init__(self, context, x, y, width, height):
+        self.context = context
+        self.scene = context.scene
+        self.rect = (x, y, width, height)
+        self.saved = None
+
+    def __enter__(self):
+        render = self.scene.render
+        camera = self.scene.camera
+
+        (x, y, width, height) = self.rect
+        (full_width, full_height) = frame_size(self.context)
+
+        pixel = pixel_size(self.context)
+
+        self.saved = {
+            "resolution_x": render.resolution_x,
+            "resolution_y": render.resolution_y,
+            "resolution_percentage": render.resolution_percentage,
+            "location": camera.location.copy(),
+            "ortho_scale": camera.data.ortho_scale,
+        }
+
+        camera.location.x += (x + width / 2 - full_width / 2) * pixel
+        camera.location.y += (y + height / 2 - full_height / 2) * pixel
+        camera.data.ortho_scale = max(width, height) * pixel
+
+        render.resolution_x = width
+        render.resolution_y = height
+        render.resolution_percentage = 100
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        render = self.scene.render
+        camera = self.scene.camera
+
+        render.resolution_x = self.saved["resolution_x"]
+        render.resolution_y = self.saved["resolution_y"]
+        render.resolution_percentage = self.saved["resolution_percentage"]
+        camera.location = self.saved["location"]
+        camera.data.ortho_scale = self.saved["ortho_scale"]
+
+        return False
+
+
+# Keeps the pixels of every pass in the layers dict, instead of writing the passes into files.
+#
+# If layers is None then nothing is changed.
+class CollectLayers:
+    def __init__(self, layers):
+        self.layers = layers
+        self.saved = None
+
+    def __enter__(self):
+        self.saved = render_state["layers"]
+
+        if self.layers is not None:
+            render_state["layers"] = self.layers
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        render_state["layers"] = self.saved
+        return False
+
+
+# Renders into a temporary file which is renamed afterwards, so the output file is never partially written
+class AtomicOutput:
+    def __init__(self, context):
+        self.context = context
+        self.filepath = None
+        self.path = None
+        self.partial = None
+
+        # If this is True then the existing output is kept and nothing is written
+        self.unchanged = False
+
+    def __enter__(self):
+        render = self.context.scene.render
+
+        self.filepath = render.filepath
+        self.path = output_path(self.context)
+
+        render.filepath = self.filepath + ".partial"
+        self.partial = output_path(self.context)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.scene.render.filepath = self.filepath
+
+        if exc_type is None:
+            if not self.unchanged:
+                os.replace(self.partial, self.path)
+
+        elif os.path.exists(self.partial):
+            os.remove(self.partial)
+
+        return False
+
+
+# Sets the pass which is being rendered.
+#
+# If rect is not None then only that rectangle of the existing output files is rendered.
+# If constant is not None then it writes an image with that color instead of rendering.
+# The previous digests are used to skip writing outputs which haven't changed.
+class RenderPass:
+    def __init__(self, name, rect=None, constant=None, previous=None):
+        self.name = name
+        self.rect = rect
+        self.constant = constant
+        self.previous = previous
+        self.saved = None
+
+    def __enter__(self):
+        self.saved = (render_state["name"], render_state["rect"], render_state["constant"], render_state["previous"])
+        render_state["name"] = self.name
+        render_state["rect"] = self.rect
+        render_state["constant"] = self.constant
+        render_state["previous"] = {} if self.previous is None else self.previous
+        render_state["samples"] = None
+        render_state["digests"] = {}
+        render_state["constants"] = {}
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        (render_state["name"], render_state["rect"], render_state["constant"], render_state["previous"]) = self.saved
+        return False
+
+
+# Enables the OpenImageDenoise denoiser, if the current pass should be denoised
+class Denoise:
+    def __init__(self, data, context):
+        self.data = data
+        self.scene = context.scene
+        self.view_layer = context.view_layer
+        self.saved = None
+
+    def __enter__(self):
+        scene = self.scene
+
+        if (
+            scene.render.engine == 'CYCLES' and
+            render_state["name"] in DENOISE_PASSES and
+            profile_value(self.data, "use_denoising") and
+            getattr(bpy.app.build_options, "openimagedenoise", True)
+        ):
+            cycles = scene.cycles
+
+            self.saved = {
+                "use_denoising": cycles.use_denoising,
+                "denoiser": cycles.denoiser,
+                "denoising_input_passes": cycles.denoising_input_passes,
+                "denoising_prefilter": cycles.denoising_prefilter,
+                "view_layer": self.view_layer.cycles.use_denoising,
+            }
+
+            cycles.use_denoising = True
+            cycles.denoiser = 'OPENIMAGEDENOISE'
+            cycles.denoising_input_passes = 'RGB_ALBEDO_NORMAL'
+            cycles.denoising_prefilter = 'ACCURATE'
+            self.view_layer.cycles.use_denoising = True
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.saved is not None:
+            cycles = self.scene.cycles
+
+            cycles.use_denoising = self.saved["use_denoising"]
+            cycles.denoiser = self.saved["denoiser"]
+            cycles.denoising_input_passes = self.saved["denoising_input_passes"]
+            cycles.denoising_prefilter = self.saved["denoising_prefilter"]
+            self.view_layer.cycles.use_denoising = self.saved["view_layer"]
+
+        return False
+
+
+# Temporarily renders into a lossless float file, so that the pixels can be loaded afterwards
+class TemporaryOutput:
+    def __init__(self, context):
+        self.render = context.scene.render
+        self.directory = None
+        self.saved = None
+
+    def __enter__(self):
+        settings = self.render.image_settings
+
+        self.directory = tempfile.TemporaryDirectory(prefix="bake_scene_")
+
+        self.saved = {
+            "filepath": self.render.filepath,
+            "file_format": settings.file_format,
+            "color_mode": settings.color_mode,
+            "color_depth": settings.color_depth,
+            "exr_codec": settings.exr_codec,
+        }
+
+        self.render.filepath = os.path.join(self.directory.name, "render")
+        settings.file_format = 'OPEN_EXR'
+        settings.color_mode = 'RGBA'
+        settings.color_depth = '32'
+        settings.exr_codec = 'NONE'
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        settings = self.render.image_settings
+
+        settings.file_format = self.saved["file_format"]
+        settings.color_mode = self.saved["color_mode"]
+        settings.color_depth = self.saved["color_depth"]
+        settings.exr_codec = self.saved["exr_codec"]
+        self.render.filepath = self.saved["filepath"]
+
+        self.directory.cleanup()
+
+        return False
+
+
 # Saves the user's settings and automatically restores them
 class Settings:
     def __init__(self, context):
@@ -462,6 +1472,8 @@ class Settings:
         self.use_freestyle = scene.render.use_freestyle
         self.use_border = scene.render.use_border
         self.use_multiview = scene.render.use_multiview
+        self.use_persistent_data = scene.render.use_persistent_data
+        self.resolution_percentage = scene.render.resolution_percentage
         self.filepath = scene.render.filepath
         self.use_file_extension = scene.render.use_file_extension
         self.use_overwrite = scene.render.use_overwrite
@@ -538,6 +1550,8 @@ class Settings:
         scene.render.use_freestyle = self.use_freestyle
         scene.render.use_border = self.use_border
         scene.render.use_multiview = self.use_multiview
+        scene.render.use_persistent_data = self.use_persistent_data
+        scene.render.resolution_percentage = self.resolution_percentage
         scene.render.filepath = self.filepath
         scene.render.use_file_extension = self.use_file_extension
         scene.render.use_overwrite = self.use_overwrite
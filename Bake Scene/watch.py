@@ -0,0 +1,273 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+# Watch mode re-bakes the textures whenever the scene is changed.
+#
+# The changes are collected by a depsgraph handler, and after the scene hasn't changed for a while (the delay)
+# the affected passes are baked with the Watch quality profile by background workers. Background workers are used so
+# that Blender doesn't freeze while baking.
+
+import os
+import time
+import hashlib
+import bpy
+from bpy.app.handlers import (persistent)
+
+from .baking import (enabled_passes, combine_layers, BakeError, Progress)
+from .cache import (PASS_INPUTS, hash_material, Uncacheable)
+from .workers import (Workers)
+
+
+# How often (in seconds) the background workers are checked
+POLL_INTERVAL = 0.25
+
+
+state = {
+    "scene": None,
+    "pending": set(),
+    "deadline": None,
+    "workers": None,
+    "materials": {},
+    "error": None,
+
+    # The images which were reloaded after the last bake, their updates are caused by the bake and not by the user
+    "reloaded": set(),
+}
+
+
+# The previews are saved into a separate folder, so they don't overwrite the full quality textures
+def preview_path(filepath):
+    (head, tail) = os.path.split(filepath)
+    return os.path.join(head, "preview", tail)
+
+
+def material_hash(material, inputs):
+    h = hashlib.sha256()
+
+    try:
+        hash_material(h, material, inputs)
+
+    # Painted images change all the time, so they always count as changed
+    except Uncacheable:
+        return None
+
+    return h.hexdigest()
+
+
+# Returns the passes which are affected by material changes
+def changed_material_passes():
+    changed = set()
+    hashes = {}
+
+    for material in bpy.data.materials:
+        if material.name.startswith("__Bake"):
+            continue
+
+        for inputs in set(PASS_INPUTS.values()):
+            key = (material.name, inputs)
+            hashes[key] = material_hash(material, inputs)
+
+            if hashes[key] is None or state["materials"].get(key) != hashes[key]:
+                changed.update(name for (name, x) in PASS_INPUTS.items() if x == inputs)
+
+    state["materials"] = hashes
+
+    return changed
+
+
+def affected_passes(depsgraph):
+    names = set()
+    materials = False
+
+    for update in depsgraph.updates:
+        id = update.id
+
+        if isinstance(id, bpy.types.Object):
+            if update.is_updated_transform or update.is_updated_geometry:
+                names.update(PASS_INPUTS)
+
+        elif isinstance(id, bpy.types.World):
+            names.add("render")
+
+        elif isinstance(id, bpy.types.Image):
+            if id.name not in state["reloaded"]:
+                materials = True
+
+        elif isinstance(id, (bpy.types.Material, bpy.types.NodeTree)):
+            materials = True
+
+    if materials:
+        names.update(changed_material_passes())
+
+    return names
+
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+    data = scene.bake_scene
+
+    if not data.use_watch:
+        return
+
+    names = affected_passes(depsgraph) & set(enabled_passes(data))
+
+    # The reloaded images are only ignored for the update which they caused
+    state["reloaded"] = set()
+
+    if names:
+        state["scene"] = scene.name
+        state["pending"].update(names)
+        state["deadline"] = time.monotonic() + data.watch_delay
+
+        if not bpy.app.timers.is_registered(tick):
+            bpy.app.timers.register(tick, first_interval=data.watch_delay)
+
+
+def reload_images(outputs):
+    paths = {bpy.path.abspath(path) for paths in outputs.values() for path in paths}
+
+    for image in bpy.data.images:
+        if image.source == 'FILE' and bpy.path.abspath(image.filepath) in paths:
+            state["reloaded"].add(image.name)
+            image.reload()
+
+    # The baked files have changed, so the materials which use them are hashed again, otherwise the next
+    # change would re-bake them
+    if state["reloaded"]:
+        changed_material_passes()
+
+
+# The timer doesn't redraw the UI, so the panel is redrawn to show the error
+def redraw_panels():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'PROPERTIES':
+                area.tag_redraw()
+
+
+def finish(workers):
+    workers.close()
+    state["workers"] = None
+
+    error = state["error"]
+
+    if workers.errors:
+        state["error"] = workers.errors[0]
+
+    else:
+        state["error"] = None
+        outputs = dict(workers.outputs)
+
+        scene = bpy.data.scenes.get(state["scene"] or "")
+
+        if scene is not None and scene.bake_scene.use_multilayer:
+            with bpy.context.temp_override(scene=scene):
+                outputs["layers"] = combine_layers(bpy.context, scene.bake_scene, preview_path(scene.render.filepath))
+
+        reload_images(outputs)
+
+    if state["error"] != error:
+        redraw_panels()
+
+
+def start(scene):
+    data = scene.bake_scene
+
+    names = [name for name in enabled_passes(data) if name in state["pending"]]
+    state["pending"] = set()
+
+    if not names:
+        return
+
+    with bpy.context.temp_override(scene=scene):
+        workers = Workers(bpy.context, data, names, Progress(), quality=data.watch_quality, output=preview_path(scene.render.filepath))
+        state["workers"] = workers
+
+        try:
+            workers.start()
+
+        # For example an unknown quality profile, it is shown in the Bake Scene panel
+        except BakeError as e:
+            workers.errors.append(str(e))
+            finish(workers)
+
+        except Exception:
+            finish(workers)
+            raise
+
+
+# Runs in a timer, it starts the bake after the delay and waits for the workers to finish
+def tick():
+    workers = state["workers"]
+
+    if workers is not None:
+        if not workers.poll():
+            return POLL_INTERVAL
+
+        finish(workers)
+
+    scene = bpy.data.scenes.get(state["scene"] or "")
+
+    if scene is None or not scene.bake_scene.use_watch or not state["pending"]:
+        return None
+
+    remaining = state["deadline"] - time.monotonic()
+
+    if remaining > 0:
+        return remaining
+
+    start(scene)
+
+    return POLL_INTERVAL
+
+
+def stop():
+    if state["workers"] is not None:
+        finish(state["workers"])
+
+    state["pending"] = set()
+
+    if bpy.app.timers.is_registered(tick):
+        bpy.app.timers.unregister(tick)
+
+
+def update_watch(self, context):
+    if self.use_watch:
+        state["scene"] = context.scene.name
+
+        # The current materials are used to detect which passes have changed
+        changed_material_passes()
+
+    else:
+        stop()
+
+
+@persistent
+def on_load(dummy):
+    stop()
+    state["materials"] = {}
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_pre.append(on_load)
+
+
+def unregister():
+    stop()
+    bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    bpy.app.handlers.load_pre.remove(on_load)
@@ -0,0 +1,262 @@
+# Copyright © 2021 Pauan
+#
+# This file is part of Bake Scene.
+#
+# Bake Scene is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bake Scene is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bake Scene.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import queue
+import collections
+import argparse
+import tempfile
+import threading
+import subprocess
+import bpy
+import addon_utils
+
+from .baking import (bake, combine_layers, check_profile, check_regions, BakeError, Progress)
+from .extract import (write_bake_blend)
+from .utils import (bake_regions)
+
+
+# Every line which is sent from the worker to the parent starts with this
+PREFIX = "@bake_scene "
+
+# The last lines of the worker's other output are added to the error if the worker crashes (for example the traceback)
+LOG_LINES = 20
+
+
+# Reports the progress of the worker to the parent process
+class WorkerProgress(Progress):
+    def update(self, index, name, paths):
+        for path in paths:
+            message("output", name + " " + path)
+
+        message("progress", name)
+
+    def skip(self, index, name, reason):
+        message("skip", name + " " + reason)
+
+
+def message(kind, value):
+    print(PREFIX + kind + " " + value, flush=True)
+
+
+def worker_threads(data):
+    if data.worker_threads == 0:
+        return max((os.cpu_count() or 1) // data.worker_count, 1)
+    else:
+        return data.worker_threads
+
+
+def worker_command(blend, scene, threads, names, output, quality=None):
+    expr = "import importlib; importlib.import_module(" + repr(__package__ + ".workers") + ").main()"
+
+    command = [
+        bpy.app.binary_path,
+        "--background",
+        "--threads", str(threads),
+        blend,
+        "--scene", scene,
+        "--python-exit-code", "1",
+        "--python-expr", expr,
+        "--",
+        "--passes", ",".join(names),
+        "--output", output,
+    ]
+
+    if quality is not None:
+        command += ["--quality", quality]
+
+    return command
+
+
+# Reads the output of a worker process on a separate thread, so that all of the workers can be read at the same time
+def read_worker(process, messages):
+    log = collections.deque(maxlen=LOG_LINES)
+
+    for line in process.stdout:
+        if line.startswith(PREFIX):
+            (kind, _, value) = line[len(PREFIX):].rstrip("\n").partition(" ")
+            messages.put((process, kind, value))
+
+        elif line.strip():
+            log.append(line.rstrip("\n"))
+
+    process.wait()
+    messages.put((process, "exit", str(process.returncode) + " " + "\n".join(log)))
+
+
+# Saves the current file and bakes the passes in multiple background Blender processes.
+#
+# The worker processes run independently of Blender, so poll can be called from a timer without blocking the UI.
+class Workers:
+    def __init__(self, context, data, names, progress, quality=None, output=None):
+        self.context = context
+        self.data = data
+        self.names = names
+        self.progress = progress
+        self.quality = quality
+        self.output = output
+
+        self.directory = None
+        self.processes = []
+        self.messages = queue.Queue()
+        self.running = 0
+        self.index = 0
+
+        self.outputs = {}
+        self.errors = []
+
+    def start(self):
+        context = self.context
+        data = self.data
+
+        check_profile(data, data.quality_profile if self.quality is None else self.quality)
+        check_regions(data)
+
+        self.directory = tempfile.TemporaryDirectory(prefix="bake_scene_")
+
+        blend = os.path.join(self.directory.name, "bake.blend")
+
+        if data.use_worker_extract:
+            scene = write_bake_blend(context, data, blend)
+
+        else:
+            scene = context.scene.name
+
+            # This remaps relative paths, so that images are loaded correctly
+            bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True, check_existing=False)
+
+        output = bpy.path.abspath(context.scene.render.filepath if self.output is None else self.output)
+        threads = worker_threads(data)
+
+        chunks = [self.names[index::data.worker_count] for index in range(data.worker_count)]
+        chunks = [chunk for chunk in chunks if chunk]
+
+        # Every worker bakes its passes for every region
+        self.progress.begin(len(self.names) * len(bake_regions(data)))
+
+        for chunk in chunks:
+            command = worker_command(blend, scene, threads, chunk, output, self.quality)
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            self.processes.append(process)
+            self.running += 1
+
+            threading.Thread(target=read_worker, args=(process, self.messages), daemon=True).start()
+
+    def handle(self, kind, value):
+        if kind == "progress":
+            self.index += 1
+            self.progress.update(self.index, value, self.outputs.get(value, []))
+
+        elif kind == "skip":
+            self.index += 1
+            (name, _, reason) = value.partition(" ")
+            self.progress.skip(self.index, name, reason)
+
+        elif kind == "output":
+            (name, _, path) = value.partition(" ")
+            self.outputs.setdefault(name, []).append(path)
+
+        elif kind == "error":
+            self.errors.append(value)
+
+        elif kind == "exit":
+            self.running -= 1
+
+            (code, _, log) = value.partition(" ")
+
+            if code != "0" and not self.errors:
+                if log:
+                    self.errors.append("Bake worker failed with exit code " + code + ":\n" + log)
+                else:
+                    self.errors.append("Bake worker failed with exit code " + code)
+
+    # Handles the messages which were sent by the workers, returns True when all of the workers are finished
+    def poll(self, block=False):
+        while self.running > 0:
+            try:
+                (process, kind, value) = self.messages.get(block=block)
+
+            except queue.Empty:
+                return False
+
+            self.handle(kind, value)
+
+        self.progress.end()
+        return True
+
+    def close(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        if self.directory is not None:
+            self.directory.cleanup()
+            self.directory = None
+
+    # Returns the outputs of the workers, or raises BakeError if any of them failed
+    def result(self):
+        if self.errors:
+            raise BakeError(self.errors[0])
+
+        return self.outputs
+
+
+def bake_workers(context, data, names, progress):
+    workers = Workers(context, data, names, progress)
+
+    try:
+        workers.start()
+        workers.poll(block=True)
+
+    finally:
+        workers.close()
+
+    outputs = workers.result()
+
+    if data.use_multilayer:
+        combine_layers(context, data)
+
+    return outputs
+
+
+# Entry point for the background worker processes
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--passes", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--quality")
+
+    args = parser.parse_args(sys.argv[sys.argv.index("--") + 1:])
+
+    # The add-on might not be enabled in the user's preferences
+    if not hasattr(bpy.types.Scene, "bake_scene"):
+        addon_utils.enable(__package__, default_set=False)
+
+    context = bpy.context
+    context.scene.render.filepath = args.output
+
+    if args.quality is not None:
+        context.scene.bake_scene.quality_profile = args.quality
+
+    try:
+        bake(context, context.scene.bake_scene, names=args.passes.split(","), progress=WorkerProgress(), combine=False)
+
+    except BakeError as e:
+        message("error", str(e))
+        sys.exit(1)
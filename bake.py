@@ -0,0 +1,19 @@
+# Bakes a .blend file from the command line, for example:
+#
+#     blender --background file.blend --python bake.py -- --output //textures/ --textures ao,normal
+#
+# Use `--help` after the `--` to see all of the options.
+
+import sys
+import importlib
+import addon_utils
+
+name = "Bake Scene"
+
+addon_utils.enable(name, default_set=False)
+
+cli = importlib.import_module(name + ".cli")
+
+argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+sys.exit(cli.main(argv))
@@ -0,0 +1,81 @@
+# Sends a bake request to a running bake server, for example:
+#
+#     blender --background --python bake.py -- --serve 8123
+#
+#     python bake_client.py --port 8123 /path/to/file.blend --textures ao,normal --output /tmp/decal_
+#
+# This script doesn't need Blender, it can be run with any Python 3 interpreter.
+
+import sys
+import json
+import socket
+import argparse
+
+
+def parse_resolution(value):
+    (x, _, y) = value.lower().partition("x")
+    return [int(x), int(y or x)]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Sends a bake request to a Bake Scene server.")
+    parser.add_argument("file", nargs="?", help="path to the .blend file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--scene")
+    parser.add_argument("--output")
+    parser.add_argument("--textures")
+    parser.add_argument("--resolution", type=parse_resolution)
+    parser.add_argument("--mode", choices=("flat", "hdri"))
+    parser.add_argument("--size", type=float)
+    parser.add_argument("--quality")
+    parser.add_argument("--quit", action="store_true", help="stop the server")
+    args = parser.parse_args(argv)
+
+    if args.quit:
+        request = {"command": "quit"}
+
+    elif args.file is None:
+        parser.error("the file is required")
+
+    else:
+        request = {"file": args.file}
+
+        for key in ("scene", "output", "resolution", "mode", "size", "quality"):
+            if getattr(args, key) is not None:
+                request[key] = getattr(args, key)
+
+        if args.textures is not None:
+            request["textures"] = [name.strip() for name in args.textures.split(",") if name.strip()]
+
+    with socket.create_connection((args.host, args.port)) as connection, connection.makefile("rw", encoding="utf-8") as stream:
+        stream.write(json.dumps(request) + "\n")
+        stream.flush()
+
+        for line in stream:
+            message = json.loads(line)
+
+            if message["type"] == "progress":
+                print("[" + str(message["index"]) + "/" + str(message["total"]) + "] Finished " + message["texture"], flush=True)
+
+            elif message["type"] == "done":
+                for paths in message["outputs"].values():
+                    for path in paths:
+                        print("Saved: " + path)
+
+                print("Finished baking all textures (" + str(message["seconds"]) + " seconds)")
+                return 0
+
+            elif message["type"] == "error":
+                print("Error: " + message["message"], file=sys.stderr)
+                return 1
+
+            elif message["type"] == "quit":
+                return 0
+
+    print("Error: The server closed the connection", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))